@@ -0,0 +1,256 @@
+"""Admission control for database work.
+
+Every database connection checkout (``Database.get_connection``) must take
+one of ``ADMISSION_LIMIT`` global slots and holds it until the connection is
+returned, so at most that many statements run at once whatever issued them.
+The slot belongs to the priority class in ``current_class``: the request
+middleware sets it from the route (interactive stats, listings, exports), and
+it follows the request into dashboard sections, cache refreshes and the ETag
+version probe through the copied context. Export jobs run as exports, and
+work outside any request (warm-up, snapshot, incremental, search and summary
+refreshes) as background. A class can also be capped below the global limit
+(exports and background default to 2).
+
+When no slot is free the thread waits in its class's bounded queue. Freed
+slots go to the highest-priority class with waiters. Work is rejected with
+``Rejected`` right away when its queue is full, or once it has waited longer
+than its class deadline; the request middleware answers such requests ``503``
+with a ``Retry-After`` estimate. Routes outside the classes, such as
+``/health`` and ``/metrics``, are never queued.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app import metrics
+
+# Highest priority first.
+PRIORITY_CLASSES = ("interactive", "listing", "export", "background")
+
+# Route path templates -> priority class; unlisted routes bypass admission.
+ROUTE_CLASSES = {
+    "/stats/programs": "interactive",
+    "/stats/years": "interactive",
+    "/stats/divisions": "interactive",
+    "/stats/lifetime": "interactive",
+    "/stats/yearly-breakdown": "interactive",
+    "/stats/player-enrollments": "interactive",
+    "/stats/query": "interactive",
+    "/stats/retention": "interactive",
+    "/stats/cohorts": "interactive",
+    "/stats/dashboard": "interactive",
+    "/programs": "listing",
+    "/programs/{program_id}": "listing",
+    "/divisions": "listing",
+    "/enrollments": "listing",
+    "/enrollments/stream": "export",
+    "/exports/enrollments": "export",
+    "/incremental/reconcile": "background",
+    "/summaries/refresh": "background",
+}
+
+DEFAULTS = {
+    # class: (max active, queue size, deadline seconds)
+    "interactive": (None, 100, 5.0),
+    "listing": (None, 50, 10.0),
+    "export": (2, 10, 30.0),
+    "background": (2, 100, 60.0),
+}
+
+# Priority class of the database work running in this context; None bypasses admission.
+current_class = ContextVar("admission_class", default="background")
+# Set per request to a list that collects the ``Rejected`` errors of its database work.
+rejections = ContextVar("admission_rejections", default=None)
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PriorityClass:
+    def __init__(self, name, max_active, max_queue, deadline):
+        self.name = name
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.active = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0}
+        self.wait_seconds_total = 0.0
+        self.hold_seconds = 1.0  # moving average of how long a request keeps its slot
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queued": len(self.waiters),
+            "max_active": self.max_active,
+            "max_queue": self.max_queue,
+            "deadline_seconds": self.deadline,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected["queue_full"],
+            "rejected_deadline": self.rejected["deadline"],
+            "avg_wait_ms": round(self.wait_seconds_total / self.admitted * 1000, 3) if self.admitted else 0.0,
+            "avg_hold_ms": round(self.hold_seconds * 1000, 3),
+        }
+
+
+class Waiter:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class AdmissionController:
+    def __init__(self, limit, classes):
+        """``classes`` maps class names, highest priority first, to ``(max active, queue size, deadline)``."""
+        self.limit = limit
+        self.active = 0
+        self.classes = {
+            name: PriorityClass(name, min(max_active or limit, limit), max_queue, deadline)
+            for name, (max_active, max_queue, deadline) in classes.items()
+        }
+        self._condition = threading.Condition()
+
+    def acquire(self, name):
+        """Block until class ``name`` gets a slot; return the time it was granted."""
+        priority = self.classes[name]
+        with self._condition:
+            if self.active < self.limit and priority.active < priority.max_active and not priority.waiters:
+                self._take(priority)
+                return self._admitted(priority, 0.0)
+
+            if len(priority.waiters) >= priority.max_queue:
+                self._reject(priority, "queue_full")
+                raise Rejected(f"Too many {name} requests are waiting", self.retry_after(priority))
+
+            started = time.monotonic()
+            deadline = started + priority.deadline
+            waiter = Waiter()
+            priority.waiters.append(waiter)
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    priority.waiters.remove(waiter)
+                    self._reject(priority, "deadline")
+                    raise Rejected(
+                        f"No database capacity for {name} requests within {priority.deadline:g}s",
+                        self.retry_after(priority),
+                    )
+                self._condition.wait(remaining)
+            return self._admitted(priority, time.monotonic() - started)
+
+    def release(self, name, granted_at):
+        with self._condition:
+            priority = self.classes[name]
+            priority.active -= 1
+            self.active -= 1
+            priority.hold_seconds += (time.monotonic() - granted_at - priority.hold_seconds) * 0.1
+            self._grant()
+
+    def retry_after(self, priority):
+        """Seconds until the queue ahead of a new request has probably drained."""
+        capacity = max(1, priority.max_active)
+        return max(1, math.ceil(priority.hold_seconds * (len(priority.waiters) + 1) / capacity))
+
+    def status(self):
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "classes": {name: priority.stats() for name, priority in self.classes.items()},
+            }
+
+    def _take(self, priority):
+        priority.active += 1
+        self.active += 1
+
+    def _admitted(self, priority, waited):
+        priority.admitted += 1
+        priority.wait_seconds_total += waited
+        metrics.admission_wait.observe(waited, priority.name)
+        return time.monotonic()
+
+    def _reject(self, priority, reason):
+        priority.rejected[reason] += 1
+        metrics.admission_rejected.inc(1, priority.name, reason)
+
+    def _grant(self):
+        """Hand free slots to waiters, highest priority class first."""
+        granted = False
+        while self.active < self.limit:
+            for priority in self.classes.values():
+                if priority.waiters and priority.active < priority.max_active:
+                    self._take(priority)
+                    priority.waiters.popleft().granted = True
+                    granted = True
+                    break
+            else:
+                break
+        if granted:
+            self._condition.notify_all()
+
+
+def classify(path):
+    """The priority class of a route path template, or None if it bypasses admission."""
+    return ROUTE_CLASSES.get(path)
+
+
+# Whether this context already holds a slot, so nested checkouts do not wait on
+# themselves. A context, unlike a thread, belongs to one request: a streamed
+# body that finishes on another threadpool thread cannot leave it set for the
+# next request served by the thread that acquired it.
+_holding = ContextVar("admission_holding", default=False)
+
+
+@contextmanager
+def slot():
+    """Hold a slot of ``current_class`` for the duration of the block."""
+    name = current_class.get()
+    if name is None or controller.limit <= 0 or _holding.get():
+        yield
+        return
+    try:
+        granted_at = controller.acquire(name)
+    except Rejected as e:
+        collected = rejections.get()
+        if collected is not None:
+            collected.append(e)
+        raise
+    _holding.set(True)
+    try:
+        yield
+    finally:
+        # Not reset with a token: the block may end in a different context than it began.
+        _holding.set(False)
+        controller.release(name, granted_at)
+
+
+def _class_settings(name):
+    max_active, max_queue, deadline = DEFAULTS[name]
+    prefix = f"ADMISSION_{name.upper()}"
+    max_active = int(os.getenv(f"{prefix}_MAX_ACTIVE", str(max_active or 0))) or None
+    return (
+        max_active,
+        int(os.getenv(f"{prefix}_QUEUE", str(max_queue))),
+        float(os.getenv(f"{prefix}_DEADLINE", str(deadline))),
+    )
+
+
+# Defaults to the connection pool size, so admitted requests rarely wait for a
+# connection; 0 turns admission control off.
+ADMISSION_LIMIT = int(os.getenv("ADMISSION_LIMIT", os.getenv("DB_POOL_MAX_SIZE", "10")))
+
+controller = AdmissionController(
+    ADMISSION_LIMIT,
+    {name: _class_settings(name) for name in PRIORITY_CLASSES},
+)
@@ -0,0 +1,255 @@
+"""Player and family distinct counts shared by the /stats endpoints.
+
+Each grouping is a preset ``StatsQuery`` (see ``app.stats_query``): a single
+scan of Enrollment_Details that computes ``COUNT(DISTINCT [Player Id])`` and
+``COUNT(DISTINCT [User Id])`` side by side, instead of one scan per metric
+joined back together.
+
+In database mode each grouping is also registered as a summary table (see
+``app.summaries``); once provisioned and current, the endpoints read the
+summary instead of running the grouping.
+
+``STATS_SOURCE`` can instead compute the same results in-process, without
+querying the database per request: ``snapshot`` from the columnar copy in
+``app.snapshot``, ``incremental`` from the id sets maintained by
+``app.incremental``.
+
+The ``approximate_*`` functions answer from HyperLogLog sketches: those of the
+incremental pipeline with ``STATS_SOURCE=incremental``, otherwise those of the
+sketch-only ``incremental.sketches``. Roll-ups merge sketches rather than
+rescanning, and every result carries its relative error.
+"""
+import os
+
+import numpy as np
+
+from app import incremental, snapshot, summaries
+from app.cache import table_version
+from app.database import db
+from app.stats_query import ACTIVE_ENROLLMENT, StatsQuery
+
+IN_PROCESS_SOURCES = {
+    "snapshot": snapshot,
+    "incremental": incremental.pipeline,
+}
+
+STATS_SOURCE = os.getenv("STATS_SOURCE", "database").lower()
+if STATS_SOURCE != "database" and STATS_SOURCE not in IN_PROCESS_SOURCES:
+    raise ValueError(
+        f"STATS_SOURCE must be one of database, {', '.join(IN_PROCESS_SOURCES)}; not {STATS_SOURCE!r}"
+    )
+in_process_source = IN_PROCESS_SOURCES.get(STATS_SOURCE)
+
+
+def stats_version(*tables):
+    """Cache version function for exact statistics derived from ``tables``."""
+    live_version = table_version(*tables)
+
+    def version():
+        if STATS_SOURCE == "incremental":
+            return incremental.pipeline.version
+        if STATS_SOURCE == "snapshot":
+            return snapshot.store.current().version
+        return live_version()
+    # The snapshot and incremental versions are private to each worker.
+    version.process_local = STATS_SOURCE != "database"
+    return version
+
+
+def sketch_version():
+    """Cache version function for the ``approximate_*`` results.
+
+    A digest of the sketch registers and program names, the same in every
+    worker whose sketches hold the same data, so workers share those
+    estimates. The first call loads the sketches, so the version is never
+    the placeholder of an unloaded pipeline.
+    """
+    pipeline = _sketch_pipeline()
+    if pipeline.sketch_version is None:
+        pipeline.refresh()
+    return pipeline.sketch_version
+
+
+PROGRAM_COUNTS = StatsQuery(
+    group_by=["program", "year"],
+    sort=["-year", "program"],
+    aliases={"players": "PlayerCount", "families": "FamilyCount"},
+)
+YEAR_COUNTS = StatsQuery(
+    group_by=["year"],
+    aliases={"players": "UniquePlayerCount", "families": "UniqueFamilyCount"},
+)
+DIVISION_COUNTS = StatsQuery(
+    group_by=["year", "program", "season", "format", "environment", "division", "division_gender"],
+    metrics=["players"],
+    sort=["-year", "program"],
+)
+LIFETIME_COUNTS = StatsQuery(
+    active_only=False,
+    aliases={"players": "PlayersLifetime", "families": "FamiliesLifetime"},
+)
+ORDER_YEAR_COUNTS = StatsQuery(
+    group_by=["order_year"],
+    active_only=False,
+    conditions=["e.[Order Date] IS NOT NULL"],
+)
+
+PLAYER_ENROLLMENTS = """
+    e.[Player Id] as PlayerId,
+    e.[Player First Name] as PlayerFirstName,
+    e.[Player Last Name] as PlayerLastName,
+    COUNT(DISTINCT e.ProgramID) as TotalEnrollments
+FROM dbo.Enrollment_Details e
+WHERE e.[Program Sort Order] > 0
+GROUP BY e.[Player Id], e.[Player First Name], e.[Player Last Name]
+"""
+
+ACTIVE_MEMBERSHIPS = f"""
+SELECT DISTINCT e.ProgramID, e.[Player Id], e.[User Id]
+FROM dbo.Enrollment_Details e
+WHERE {ACTIVE_ENROLLMENT} AND e.ProgramID IS NOT NULL
+"""
+
+summaries.register(summaries.Summary.from_stats_query("ProgramCounts", PROGRAM_COUNTS))
+summaries.register(summaries.Summary.from_stats_query("YearCounts", YEAR_COUNTS))
+summaries.register(summaries.Summary.from_stats_query("DivisionCounts", DIVISION_COUNTS))
+summaries.register(summaries.Summary.from_stats_query("LifetimeCounts", LIFETIME_COUNTS))
+summaries.register(summaries.Summary.from_stats_query("OrderYearCounts", ORDER_YEAR_COUNTS))
+summaries.register(summaries.Summary(
+    "PlayerEnrollments",
+    [("PlayerId", "float"), ("PlayerFirstName", "nvarchar(255)"), ("PlayerLastName", "nvarchar(255)"),
+     ("TotalEnrollments", "int")],
+    "SELECT" + PLAYER_ENROLLMENTS,
+    ["Enrollment_Details"],
+    order_by=["[TotalEnrollments] DESC", "[PlayerLastName]", "[PlayerFirstName]", "[PlayerId]"],
+    indexed=True,
+))
+summaries.register(summaries.Summary(
+    "ProgramMembers",
+    [("ProgramID", "int"), ("PlayerId", "float"), ("UserId", "float")],
+    ACTIVE_MEMBERSHIPS,
+    ["Enrollment_Details"],
+))
+
+
+def _run(query, summary):
+    """Rows of a preset, read from its summary table when that is current."""
+    sql = summaries.store.select(summary)
+    return db.execute_query(sql) if sql else query.run()
+
+
+def program_counts():
+    """Players and families per program (name and year)."""
+    if in_process_source:
+        return in_process_source.program_counts()
+
+    return _run(PROGRAM_COUNTS, "ProgramCounts")
+
+
+def year_counts():
+    """Unique players and families per program year."""
+    if in_process_source:
+        return in_process_source.year_counts()
+
+    return _run(YEAR_COUNTS, "YearCounts")
+
+
+def division_counts():
+    """Unique players per program division."""
+    if in_process_source:
+        return in_process_source.division_counts()
+
+    return _run(DIVISION_COUNTS, "DivisionCounts")
+
+
+def lifetime_counts():
+    """Unique players and families across every enrollment ever recorded."""
+    if in_process_source:
+        return in_process_source.lifetime_counts()
+
+    results = _run(LIFETIME_COUNTS, "LifetimeCounts")
+    row = results[0] if results else {}
+    return {
+        "PlayersLifetime": row.get("PlayersLifetime") or 0,
+        "FamiliesLifetime": row.get("FamiliesLifetime") or 0,
+    }
+
+
+def order_year_counts():
+    """Unique players and families per calendar year of the order date.
+
+    Years are discovered from the data rather than configured.
+    """
+    if in_process_source:
+        return in_process_source.order_year_counts()
+
+    rows = _run(ORDER_YEAR_COUNTS, "OrderYearCounts")
+    return {
+        str(row["OrderYear"]): {"players": row["Players"], "families": row["Families"]}
+        for row in rows
+    }
+
+
+def player_enrollment_counts(limit):
+    """Top ``limit`` players by number of distinct programs enrolled in."""
+    if in_process_source:
+        return in_process_source.player_enrollment_counts(limit)
+
+    query = summaries.store.select("PlayerEnrollments", top=True) or (
+        "SELECT TOP (?)" + PLAYER_ENROLLMENTS
+        + "ORDER BY COUNT(DISTINCT e.ProgramID) DESC, e.[Player Last Name], e.[Player First Name], e.[Player Id]"
+    )
+    return db.execute_query(query, (limit,))
+
+
+def active_memberships():
+    """Which players and families enrolled in which programs, active enrollments only.
+
+    Returns ``(program_ids, player_ids, user_ids, programs)``: three aligned
+    int64 arrays pairing programs with their players and with their families
+    (pairs may repeat), and ``programs`` mapping each program id to
+    ``(name, year, season)``.
+    """
+    if in_process_source:
+        return in_process_source.active_memberships()
+
+    query = summaries.store.select("ProgramMembers") or ACTIVE_MEMBERSHIPS
+    batches = [np.array(batch, dtype=np.float64) for batch in db.iter_batches(query, batch_size=50000)]
+    rows = np.concatenate(batches).astype(np.int64) if batches else np.empty((0, 3), dtype=np.int64)
+    programs = {
+        program_id: (name, year, season)
+        for program_id, name, year, season in db.fetch_rows(
+            "SELECT ProgramID, [Program Name], [Program Year], [Program Season] FROM dbo.AthleticPrograms"
+        )
+    }
+    return rows[:, 0], rows[:, 1], rows[:, 2], programs
+
+
+# The exact pipeline keeps sketches too; otherwise a sketch-only one is enough.
+sketch_source = incremental.pipeline if STATS_SOURCE == "incremental" else incremental.sketches
+
+
+def _sketch_pipeline():
+    # Keeps the sketches current from the first approximate request on.
+    sketch_source.start()
+    return sketch_source
+
+
+def approximate_program_counts():
+    """Approximate ``program_counts`` merged from per-program sketches."""
+    return _sketch_pipeline().approximate_program_counts()
+
+
+def approximate_year_counts():
+    """Approximate ``year_counts``: each season is the union of its programs' sketches."""
+    return _sketch_pipeline().approximate_year_counts()
+
+
+def approximate_lifetime_counts():
+    """Approximate ``lifetime_counts``: the union of every order year's sketches."""
+    return _sketch_pipeline().approximate_lifetime_counts()
+
+
+def approximate_order_year_counts():
+    """Approximate ``order_year_counts`` read from per-order-year sketches."""
+    return _sketch_pipeline().approximate_order_year_counts()
@@ -0,0 +1,326 @@
+"""In-process result cache for the read endpoints.
+
+Misses fall through to the host-wide store in ``app.shared_cache`` when it is
+enabled, so several uvicorn workers compute each entry once between them.
+
+Entries are keyed by endpoint and parameters and are bounded by count, by an
+approximate memory footprint (LRU eviction) and by a TTL. Freshness is decided
+by a data-version probe of the underlying tables rather than by the clock: an
+entry computed against an older version is never served as fresh.
+
+The last value of each entry is kept until it is replaced, so when the
+database is resuming from auto-pause or slow to answer, ``cached`` functions
+serve it after ``STALE_WAIT_SECONDS`` instead of blocking. The refresh keeps
+running in the background, and the stale response is reported through
+``stale_results`` so the request can be marked.
+"""
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextvars import ContextVar, copy_context
+
+from app import shared_cache
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+# How long a request waits for a refresh before it gets the previous value; negative disables.
+STALE_WAIT_SECONDS = float(os.getenv("STALE_WAIT_SECONDS", "2"))
+
+# Set per request to a list that collects ``(namespace, age seconds)`` of stale values served.
+stale_results = ContextVar("stale_results", default=None)
+
+
+class DataVersionProbe:
+    """Cheap per-table fingerprints, re-read at most every ``interval`` seconds.
+
+    Enrollment_Details is append-mostly, so its row count and latest order date
+    identify a load; the small reference tables are checksummed.
+    """
+
+    QUERY = """
+    SELECT e.EnrollmentRows, e.LastOrderDate, p.ProgramsChecksum, p.ProgramRows,
+           d.DivisionsChecksum, d.DivisionRows
+    FROM (SELECT COUNT_BIG(*) AS EnrollmentRows, MAX([Order Date]) AS LastOrderDate
+          FROM dbo.Enrollment_Details) e
+    CROSS JOIN (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) AS ProgramsChecksum, COUNT_BIG(*) AS ProgramRows
+                FROM dbo.AthleticPrograms) p
+    CROSS JOIN (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) AS DivisionsChecksum, COUNT_BIG(*) AS DivisionRows
+                FROM dbo.ProgramDivisions) d
+    """
+
+    def __init__(self, interval=30.0):
+        self.interval = interval
+        self.probes = 0
+        self._lock = threading.Lock()
+        self._versions = None
+        self._checked_at = 0.0
+        self._bypass_shared = False
+
+    def current(self):
+        """Return ``{table: version}``, probing the database if the last read is too old.
+
+        With the shared store, workers take turns: one probes per ``interval``
+        window and the others read its result.
+        """
+        with self._lock:
+            if self._versions is not None and time.monotonic() - self._checked_at < self.interval:
+                return self._versions
+
+            if shared_cache.store is None or self.interval <= 0:
+                self._versions = self._probe()
+                self._checked_at = time.monotonic()
+                return self._versions
+
+            now = time.time()
+            window = int(now // self.interval)
+            if self._bypass_shared:
+                self._versions = self._probe()
+                shared_cache.store.set(("data_version",), self._versions, window)
+                self._bypass_shared = False
+            else:
+                self._versions = shared_cache.store.compute(("data_version",), window, self._probe)
+            # Expire with the window, so versions are never older than ``interval``.
+            self._checked_at = time.monotonic() - (now - window * self.interval)
+            return self._versions
+
+    def _probe(self):
+        row = db.execute_query(self.QUERY)[0]
+        self.probes += 1
+        return {
+            "Enrollment_Details": (row["EnrollmentRows"], row["LastOrderDate"]),
+            "AthleticPrograms": (row["ProgramsChecksum"], row["ProgramRows"]),
+            "ProgramDivisions": (row["DivisionsChecksum"], row["DivisionRows"]),
+        }
+
+    def due(self):
+        """Whether the next ``current()`` call will query the database."""
+        return self._versions is None or time.monotonic() - self._checked_at >= self.interval
+
+    def invalidate(self):
+        """Force the next ``current()`` call to probe the database."""
+        with self._lock:
+            self._checked_at = 0.0
+            self._bypass_shared = True
+
+
+class ResultCache:
+    """Thread-safe LRU cache whose entries are tagged with a data version."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=3600.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, version, expires_at, size)
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key, version):
+        """Return the cached value for ``key`` at ``version``, or ``MISSING``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return MISSING
+
+            value, entry_version, stored_at, _ = entry
+            if entry_version != version or time.monotonic() - stored_at >= self.ttl:
+                # Outdated entries stay until replaced so ``peek`` can still serve them.
+                self._counters["stale" if entry_version != version else "expired"] += 1
+                self._counters["misses"] += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, key, value, version):
+        size = approximate_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, version, time.monotonic(), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def contains(self, key, version):
+        """Whether ``get(key, version)`` would hit, without touching the counters or LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return (entry is not None and entry[1] == version
+                    and time.monotonic() - entry[2] < self.ttl)
+
+    def peek(self, key):
+        """Return ``(value, age in seconds)`` of the last value stored for ``key`` whatever its version, or ``MISSING``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, _, stored_at, _ = entry
+            return value, time.monotonic() - stored_at
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                **self._counters,
+                "hit_ratio": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        _, _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+
+def approximate_size(value):
+    """Rough deep size in bytes of a JSON-like value."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approximate_size(item) for item in value)
+    return size
+
+
+version_probe = DataVersionProbe(interval=float(os.getenv("DATA_VERSION_INTERVAL", "30")))
+
+result_cache = ResultCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("CACHE_TTL", "3600")),
+)
+
+
+def table_version(*tables):
+    """Version function for results derived from ``tables``."""
+    def version():
+        versions = version_probe.current()
+        return tuple(versions[table] for table in tables)
+    return version
+
+
+class Refresher:
+    """Runs cache loads in the background, at most one per key at a time."""
+
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cache-refresh")
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def submit(self, key, load):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._inflight[key] = self._executor.submit(copy_context().run, load)
+        # Outside the lock: the callback runs right away if the load has already finished.
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+refresher = Refresher(workers=int(os.getenv("CACHE_REFRESH_WORKERS", "4")))
+
+
+def _serve_stale(namespace, value, age):
+    served = stale_results.get()
+    if served is not None:
+        served.append((namespace, age))
+    return value
+
+
+def cached(namespace, version):
+    """Cache a function's return value per argument set and data version.
+
+    ``version`` is called on every lookup; a change in its result invalidates
+    every entry stored under an older version. It stays available as the
+    wrapper's ``version`` attribute. Exceptions are not cached.
+    Once a key has a value, lookups that take longer than ``STALE_WAIT_SECONDS``
+    or fail return that value instead, while the refresh completes in the background.
+    In-process misses go to ``shared_cache.store`` when it is enabled, so only
+    one worker per host computes each entry.
+    """
+    # Versions that only mean something inside this process (in-process stats
+    # sources) cannot be compared with other workers' entries.
+    shared = shared_cache.store is not None and not getattr(version, "process_local", False)
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (namespace, tuple(bound.arguments.items()))
+
+            def load():
+                try:
+                    current = version()
+                except Exception as e:
+                    # Without a version nothing can be validated; let the function
+                    # run (and report) against the database directly.
+                    logger.warning(f"Data version probe failed, bypassing cache for {namespace}: {e}")
+                    return func(*args, **kwargs)
+
+                value = result_cache.get(key, current)
+                if value is MISSING:
+                    if shared:
+                        value = shared_cache.store.compute(key, current, lambda: func(*args, **kwargs))
+                    else:
+                        value = func(*args, **kwargs)
+                    result_cache.set(key, value, current)
+                return value
+
+            previous = result_cache.peek(key) if STALE_WAIT_SECONDS >= 0 else MISSING
+            # Hits that need no probe are answered inline; only a load that
+            # may reach the database goes through the refresher.
+            if previous is MISSING or (not version_probe.due() and result_cache.contains(key, version())):
+                return load()
+
+            future = refresher.submit(key, load)
+            try:
+                return future.result(timeout=STALE_WAIT_SECONDS)
+            except TimeoutError:
+                logger.info(f"Refresh of {namespace} still running, serving the previous result")
+            except Exception as e:
+                logger.warning(f"Refresh of {namespace} failed, serving the previous result: {e}")
+            return _serve_stale(namespace, *previous)
+
+        wrapper.version = version
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    stats = {**result_cache.stats(), "version_probes": version_probe.probes}
+    if shared_cache.store is not None:
+        stats["shared"] = shared_cache.store.stats()
+    return stats
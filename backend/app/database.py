@@ -1,9 +1,303 @@
 import pyodbc
 import os
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
+from app import admission, metrics
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# The pool below owns connection reuse; driver-manager pooling would only keep
+# a second, invisible set of sessions open behind it.
+pyodbc.pooling = False
+
+# Identical queries running at the same time share one execution.
+QUERY_COALESCING = os.getenv("QUERY_COALESCING", "true").lower() in ("1", "true", "yes")
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the pool timeout."""
+
+
+class CoalesceTimeout(Exception):
+    """Raised when a coalesced query's shared execution did not finish in time."""
+
+
+class SingleFlight:
+    """Runs identical concurrent calls once and hands every caller the outcome.
+
+    The first caller for a key executes; callers arriving while it runs wait
+    up to ``timeout`` seconds for its result or exception instead of running
+    the same work again.
+    """
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.executions = 0
+        self.saved = 0
+
+    def run(self, key, func):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.executions += 1
+            else:
+                self.saved += 1
+
+        if not leader:
+            metrics.coalesced_queries.inc(1, metrics.current_endpoint())
+            with metrics.span("coalesced"):
+                try:
+                    return future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    raise CoalesceTimeout(f"Shared query execution did not finish within {self.timeout:g}s") from None
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {"executions": self.executions, "saved": self.saved, "in_flight": len(self._inflight)}
+
+
+class ConnectionPool:
+    """Thread-safe pool of reusable DB-API connections.
+
+    Connections are opened lazily up to ``max_size``; ``warm()`` pre-opens
+    ``min_size`` of them. Idle connections are validated with a cheap query
+    before reuse once they have sat idle for ``validate_after`` seconds, and any
+    connection older than ``max_lifetime`` is closed and replaced. Idle
+    connections above ``min_size`` are closed after ``max_idle`` seconds.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0,
+                 max_lifetime=1800.0, max_idle=600.0, validate_after=30.0,
+                 validation_query="SELECT 1"):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self.validation_query = validation_query
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, created_at, last_used_at), most recent on the right
+        self._created_at = {}  # id(connection) -> created_at, for checked-out connections
+        self._size = 0
+        self._waiting = 0
+
+        self._counters = {
+            "checkouts": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "recycled": 0,
+            "validation_failures": 0,
+            "timeouts": 0,
+        }
+        self._wait_seconds_total = 0.0
+
+    def warm(self):
+        """Open connections until the pool holds at least ``min_size``."""
+        opened = []
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        break
+                    self._size += 1
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                opened.append(conn)
+        finally:
+            now = time.monotonic()
+            with self._cond:
+                for conn in opened:
+                    self._idle.append((conn, self._created_at.pop(id(conn)), now))
+                self._cond.notify_all()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the ``with`` block.
+
+        Connections that fail with an operational or interface error are
+        discarded instead of being returned to the pool.
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (pyodbc.OperationalError, pyodbc.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        entry = None
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout:g}s "
+                            f"(pool max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._counters["checkouts"] += 1
+            self._wait_seconds_total += time.monotonic() - started
+
+        try:
+            if entry is None:
+                return self._open()
+            return self._checkout_idle(*entry)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard=False):
+        created_at = self._created_at.pop(id(conn), None)
+        now = time.monotonic()
+
+        if created_at is None or discard or now - created_at >= self.max_lifetime:
+            if not discard and created_at is not None:
+                self._count("recycled")
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, now))
+            expired = self._prune_idle(now)
+            self._cond.notify()
+        for stale in expired:
+            self._close(stale)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._counters["checkouts"]
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                **self._counters,
+                "avg_wait_ms": round(self._wait_seconds_total / checkouts * 1000, 3) if checkouts else 0.0,
+            }
+
+    def close(self):
+        """Close every idle connection; checked-out connections close on release."""
+        with self._cond:
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def _checkout_idle(self, conn, created_at, last_used_at):
+        now = time.monotonic()
+        if now - created_at >= self.max_lifetime:
+            self._count("recycled")
+            self._close(conn)
+            return self._open()
+
+        if now - last_used_at >= self.validate_after and not self._is_alive(conn):
+            self._count("validation_failures")
+            self._close(conn)
+            return self._open()
+
+        self._created_at[id(conn)] = created_at
+        return conn
+
+    def _prune_idle(self, now):
+        # Called with the lock held. The oldest-used connections sit on the left.
+        expired = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][2] >= self.max_idle:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _is_alive(self, conn):
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.validation_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding pooled connection that failed validation: {e}")
+            return False
+
+    def _open(self):
+        conn = self._connect()
+        self._created_at[id(conn)] = time.monotonic()
+        self._count("connections_opened")
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count("connections_closed")
+
+    def _count(self, name):
+        with self._cond:
+            self._counters[name] += 1
+
+
 class Database:
     def __init__(self):
         self.connection_string = (
@@ -16,26 +310,155 @@ class Database:
             f"TrustServerCertificate=no;"
             f"Connection Timeout=30;"
         )
+        self.pool = ConnectionPool(
+            self._connect,
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "600")),
+            validate_after=float(os.getenv("DB_POOL_VALIDATE_AFTER", "30")),
+        )
+
+        self.last_success = None
+        self.single_flight = SingleFlight(timeout=float(os.getenv("QUERY_COALESCE_TIMEOUT", "60")))
+
+    def seconds_since_success(self):
+        """Seconds since a query last executed successfully, or None if none has."""
+        return None if self.last_success is None else time.monotonic() - self.last_success
+
+    def _connect(self):
+        # The API only reads, so pooled sessions never hold an open transaction.
+        return pyodbc.connect(self.connection_string, autocommit=True)
 
+    @contextmanager
     def get_connection(self):
-        return pyodbc.connect(self.connection_string)
+        """A pooled connection, checked out under an admission slot (see ``app.admission``)."""
+        with admission.slot(), self.pool.connection() as conn:
+            yield conn
 
-    def execute_query(self, query, params=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    @contextmanager
+    def traced_cursor(self, query, params=None):
+        """Execute ``query`` on a pooled connection and yield the cursor and its ``QueryRecord``.
+
+        Callers report fetches on the record; its timings are recorded when the block exits.
+        """
+        record = metrics.QueryRecord(query, params)
+        started = time.perf_counter()
         try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+            with self.get_connection() as conn:
+                connected = time.perf_counter()
+                record.durations["connect"] = connected - started
+                cursor = conn.cursor()
+                try:
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    record.durations["execute"] = time.perf_counter() - connected
+                    self.last_success = time.monotonic()
+                    yield cursor, record
+                finally:
+                    cursor.close()
+        finally:
+            record.finish()
+
+    @contextmanager
+    def cursor(self, query, params=None):
+        """Execute ``query`` on a pooled connection and yield the open cursor."""
+        with self.traced_cursor(query, params) as (cursor, _):
+            yield cursor
 
+    def _fetch(self, cursor, record, size=None):
+        started = time.perf_counter()
+        rows = cursor.fetchall() if size is None else cursor.fetchmany(size)
+        record.fetched(rows, time.perf_counter() - started)
+        return rows
+
+    def _coalesced(self, query, params, run):
+        """``run()``, shared with identical concurrent calls; each caller gets its own list."""
+        if not QUERY_COALESCING:
+            return run()
+        try:
+            key = (" ".join(query.split()), tuple(params or ()))
+            hash(key)
+        except TypeError:
+            return run()
+        columns, rows = self.single_flight.run(key, run)
+        return columns, list(rows)
+
+    def _columns_and_rows(self, query, params):
+        with self.traced_cursor(query, params) as (cursor, record):
+            return [column[0] for column in cursor.description], self._fetch(cursor, record)
+
+    def execute_query(self, query, params=None):
+        columns, rows = self._coalesced(query, params, lambda: self._columns_and_rows(query, params))
+        with metrics.span("remap"):
+            return [dict(zip(columns, row)) for row in rows]
+
+    def fetch_rows(self, query, params=None):
+        """Return every result row as a tuple, without building per-row dicts."""
+        _, rows = self._coalesced(query, params, lambda: self._columns_and_rows(query, params))
+        return rows
+
+    def iter_batches(self, query, params=None, batch_size=1000):
+        """Yield lists of up to ``batch_size`` row tuples.
+
+        The pooled connection is held until the generator is exhausted or closed.
+        """
+        with self.traced_cursor(query, params) as (cursor, record):
+            while True:
+                rows = self._fetch(cursor, record, batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    def execute_statements(self, statements, transaction=True):
+        """Run ``(sql, params)`` statements in order on one connection, by default in one transaction.
+
+        For provisioning and refreshing derived tables; the endpoints only read.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if transaction:
+                    cursor.execute("BEGIN TRANSACTION")
+                for query, params in statements:
+                    record = metrics.QueryRecord(query, params)
+                    started = time.perf_counter()
+                    try:
+                        if params:
+                            cursor.execute(query, params)
+                        else:
+                            cursor.execute(query)
+                        record.durations["execute"] = time.perf_counter() - started
+                    finally:
+                        record.finish()
+                if transaction:
+                    cursor.execute("COMMIT TRANSACTION")
+                self.last_success = time.monotonic()
+            except Exception:
+                if transaction:
+                    try:
+                        cursor.execute("ROLLBACK TRANSACTION")
+                    except Exception as e:
+                        logger.warning(f"Rollback failed: {e}")
+                raise
+            finally:
+                cursor.close()
+
+    def iter_query(self, query, params=None, batch_size=1000):
+        """Yield result rows as dicts, fetching ``batch_size`` rows at a time.
+
+        The pooled connection is held until the generator is exhausted or closed.
+        """
+        with self.traced_cursor(query, params) as (cursor, record):
             columns = [column[0] for column in cursor.description]
-            results = []
-            for row in cursor.fetchall():
-                results.append(dict(zip(columns, row)))
-            return results
-        finally:
-            cursor.close()
-            conn.close()
+            while True:
+                rows = self._fetch(cursor, record, batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
 
 db = Database()
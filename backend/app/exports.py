@@ -0,0 +1,295 @@
+"""Bulk exports of projected rows as CSV or Parquet.
+
+Rows come from ``Database.iter_batches`` as tuples in projection field order
+and each ``fetchmany`` batch is encoded straight into the output: one
+``csv.writer.writerows`` call, or one Parquet row group built column-wise.
+No per-row dicts are built, and only one batch plus its encoded bytes is held
+in memory at a time, so an export of the whole table streams with chunked
+transfer at constant memory.
+
+Large exports can also run as background jobs that write to ``EXPORT_DIR``.
+``ExportJobs`` tracks them, and finished files are deleted after
+``EXPORT_RETENTION_SECONDS``.
+
+Parquet needs ``pyarrow``; without it only CSV is offered.
+"""
+import csv
+import io
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Union, get_args, get_origin
+
+from app import admission, metrics
+from app.database import db
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "data/exports")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
+# Largest batch_size a request may ask for; one batch is held in memory at a time.
+EXPORT_MAX_BATCH_SIZE = int(os.getenv("EXPORT_MAX_BATCH_SIZE", "100000"))
+# Export jobs one client may have queued or running at once.
+EXPORT_JOBS_PER_CLIENT = int(os.getenv("EXPORT_JOBS_PER_CLIENT", "2"))
+EXPORT_RETENTION_SECONDS = float(os.getenv("EXPORT_RETENTION_SECONDS", "3600"))
+
+
+class UnsupportedFormat(Exception):
+    """Raised for an export format that is unknown or whose library is missing."""
+
+
+class TooManyJobs(Exception):
+    """Raised when a client already has ``per_client`` export jobs queued or running."""
+
+
+def _column_type(annotation):
+    if get_origin(annotation) is Union:
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+    return {
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        datetime: pyarrow.timestamp("us"),
+    }.get(annotation, pyarrow.string())
+
+
+def parquet_schema(projection):
+    return pyarrow.schema(
+        (field, _column_type(projection.model.model_fields[field].annotation))
+        for field in projection.fields
+    )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last ``drain``."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def csv_chunks(projection, batches):
+    """Yield a header line and then one encoded chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(projection.fields)
+    yield buffer.getvalue().encode()
+
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        with metrics.span("serialize"):
+            writer.writerows(rows)
+            chunk = buffer.getvalue().encode()
+        yield chunk
+
+
+def parquet_chunks(projection, batches):
+    """Yield the Parquet file one row group (fetch batch) at a time; the footer comes last."""
+    schema = parquet_schema(projection)
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for rows in batches:
+            with metrics.span("serialize"):
+                columns = [
+                    pyarrow.array(values, type=field.type)
+                    for values, field in zip(zip(*rows), schema)
+                ]
+                writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+FORMATS = {
+    "csv": (csv_chunks, "text/csv", "csv"),
+    "parquet": (parquet_chunks, "application/vnd.apache.parquet", "parquet"),
+}
+
+
+def export_format(name):
+    """Return ``(chunks, media type, file extension)`` for a format name."""
+    if name not in FORMATS:
+        raise UnsupportedFormat(f"Unknown export format {name!r}; use one of {', '.join(FORMATS)}")
+    if name == "parquet" and pyarrow is None:
+        raise UnsupportedFormat("Parquet export requires the pyarrow package")
+    return FORMATS[name]
+
+
+def export_chunks(format_name, projection, query, params=(), batch_size=EXPORT_BATCH_SIZE):
+    """Run ``SELECT <projection> <query>`` and yield the encoded export."""
+    chunks, _, _ = export_format(format_name)
+    batches = db.iter_batches(f"SELECT {projection.select_list} {query}", tuple(params), batch_size=batch_size)
+    # Run the query now so that failures surface before the response starts.
+    first = next(batches, None)
+    return _closing(chunks(projection, itertools.chain([first] if first is not None else [], batches)), batches)
+
+
+def _closing(chunks, batches):
+    """Yield ``chunks``; closing it early also closes ``batches`` and returns their connection."""
+    try:
+        yield from chunks
+    finally:
+        batches.close()
+
+
+class ExportJobs:
+    """Exports written to ``directory`` by background threads."""
+
+    def __init__(self, directory, workers=2, retention=3600.0, per_client=2):
+        self.directory = directory
+        self.retention = retention
+        self.per_client = per_client
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._clients = {}  # job id -> client that submitted it
+        self._finished = {}  # job id -> time.monotonic() when it finished
+
+    def submit(self, name, format_name, projection, query, params=(), batch_size=EXPORT_BATCH_SIZE, client=None):
+        """Queue an export and return its status; ``name`` is the download file stem.
+
+        Raises ``TooManyJobs`` if ``client`` already has ``per_client`` unfinished jobs.
+        """
+        _, _, extension = export_format(format_name)
+        self.expire()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "format": format_name,
+            "filename": f"{name}.{extension}",
+            "rows": 0,
+            "bytes": 0,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "finished_at": None,
+            "error": None,
+        }
+        with self._lock:
+            if client is not None and self.per_client > 0:
+                unfinished = sum(
+                    1 for other_id, other in self._clients.items()
+                    if other == client and other_id not in self._finished
+                )
+                if unfinished >= self.per_client:
+                    raise TooManyJobs(f"{unfinished} export jobs are still running for this client")
+            self._jobs[job_id] = job
+            self._clients[job_id] = client
+        self._executor.submit(self._run, job, projection, query, params, batch_size)
+        return dict(job)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def path(self, job_id):
+        """The finished export file of ``job_id``, or None if it is not ready."""
+        job = self.status(job_id)
+        if job is None or job["status"] != "done":
+            return None
+        return self._path(job)
+
+    def expire(self):
+        """Forget finished jobs older than ``retention`` and delete their files."""
+        cutoff = time.monotonic() - self.retention
+        with self._lock:
+            expired = [self._jobs.pop(job_id) for job_id, finished in list(self._finished.items())
+                       if finished < cutoff]
+            for job in expired:
+                del self._finished[job["id"]]
+                del self._clients[job["id"]]
+        for job in expired:
+            try:
+                os.remove(self._path(job))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, job):
+        return os.path.join(self.directory, f"{job['id']}-{job['filename']}")
+
+    def _update(self, job, **changes):
+        # ``status`` copies jobs under the lock, so changes must be made under it too.
+        with self._lock:
+            job.update(changes)
+
+    def _count(self, job, rows=0, size=0):
+        with self._lock:
+            job["rows"] += rows
+            job["bytes"] += size
+
+    def _run(self, job, projection, query, params, batch_size):
+        # The export's database work queues in the export class, behind interactive requests.
+        class_token = admission.current_class.set("export")
+        self._update(job, status="running")
+        path = self._path(job)
+        partial = path + ".part"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            chunks, _, _ = export_format(job["format"])
+            batches = db.iter_batches(f"SELECT {projection.select_list} {query}", tuple(params), batch_size=batch_size)
+
+            def counted():
+                for rows in batches:
+                    self._count(job, rows=len(rows))
+                    yield rows
+
+            try:
+                with open(partial, "wb") as out:
+                    for chunk in chunks(projection, counted()):
+                        out.write(chunk)
+                        self._count(job, size=len(chunk))
+            finally:
+                batches.close()
+            os.replace(partial, path)
+            self._update(job, status="done")
+        except Exception as e:
+            logger.error(f"Export {job['id']} failed: {e}")
+            self._update(job, status="failed", error=str(e))
+            try:
+                os.remove(partial)
+            except FileNotFoundError:
+                pass
+        finally:
+            with self._lock:
+                job["finished_at"] = datetime.now().isoformat(timespec="seconds")
+                self._finished[job["id"]] = time.monotonic()
+            admission.current_class.reset(class_token)
+
+
+jobs = ExportJobs(
+    EXPORT_DIR,
+    workers=int(os.getenv("EXPORT_WORKERS", "2")),
+    retention=EXPORT_RETENTION_SECONDS,
+    per_client=EXPORT_JOBS_PER_CLIENT,
+)
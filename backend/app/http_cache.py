@@ -0,0 +1,163 @@
+"""HTTP-level caching: conditional GET and response compression.
+
+Routes registered with ``conditional_get`` get a weak ETag derived from the
+data version of the tables they read (the same version functions the result
+cache uses) and from the request's query string. A request whose
+``If-None-Match`` carries the current tag is answered ``304 Not Modified``
+before the endpoint runs, so a repeat view costs a version lookup, which is
+usually served from memory, and no body. ``Cache-Control`` lets browsers keep
+the response and revalidate it with the tag on every use (``no-cache``), or
+after ``CACHE_CONTROL_MAX_AGE`` seconds. The browser adds ``If-None-Match``
+itself, so cross-origin requests need no preflight for it.
+
+``CompressionMiddleware`` compresses JSON, NDJSON, CSV and other text bodies
+of at least ``COMPRESS_MIN_BYTES`` with brotli when the client accepts it and
+the ``brotli`` package is installed, and with gzip otherwise. The tags are
+weak because the same representation is sent in several encodings.
+"""
+import hashlib
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+CACHE_CONTROL_MAX_AGE = int(os.getenv("CACHE_CONTROL_MAX_AGE", "0"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+class ConditionalGet:
+    """Route path -> version function of the data its responses are built from."""
+
+    def __init__(self, max_age=0):
+        self.cache_control = f"public, max-age={max_age}, must-revalidate" if max_age > 0 else "no-cache"
+        self._versions = {}
+
+    def register(self, path, version):
+        """``version()`` is the route's data version; if ``version.per_query`` is set it is
+        called with the query items instead, for routes whose source depends on them."""
+        self._versions[path] = version
+
+    def version_for(self, path):
+        return self._versions.get(path)
+
+    def etag(self, path, query, version):
+        """Weak ETag for ``path`` with ``query`` at data ``version()``."""
+        current = version(query) if getattr(version, "per_query", False) else version()
+        digest = hashlib.blake2b(
+            repr((path, sorted(query), current)).encode(), digest_size=12
+        ).hexdigest()
+        return f'W/"{digest}"'
+
+    @staticmethod
+    def matches(if_none_match, etag):
+        """Whether an ``If-None-Match`` header value lists ``etag`` (weak comparison)."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tag = etag.removeprefix("W/")
+        return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+
+def accepted_encoding(accept_encoding):
+    """The best encoding we can produce for an ``Accept-Encoding`` header, or None."""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, final):
+        out = self._compressor.compress(data)
+        # Sync-flush each streamed chunk so the client can decode it as it arrives.
+        return out + (self._compressor.flush() if final else self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data, final):
+        out = self._compressor.process(data)
+        return out + (self._compressor.finish() if final else self._compressor.flush())
+
+
+ENCODERS = {"gzip": _Gzip, "br": _Brotli}
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing text responses, streamed ones chunk by chunk."""
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+
+        async def send_compressed(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                start = message  # held until the first body chunk shows whether to compress
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                initial, start = start, None
+                headers = MutableHeaders(raw=initial["headers"])
+                compress = (
+                    "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if compress:
+                    encoder = ENCODERS[encoding]()
+                    headers["Content-Encoding"] = encoding
+                    headers.add_vary_header("Accept-Encoding")
+                    if "content-length" in headers:
+                        del headers["Content-Length"]
+                    body = encoder.compress(body, final=not more_body)
+                    if not more_body:
+                        headers["Content-Length"] = str(len(body))
+                await send(initial)
+            elif encoder is not None:
+                body = encoder.compress(body, final=not more_body)
+
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+conditional_get = ConditionalGet(max_age=CACHE_CONTROL_MAX_AGE)
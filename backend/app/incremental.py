@@ -0,0 +1,466 @@
+"""Incrementally maintained distinct-count aggregates.
+
+``STATS_SOURCE=incremental`` keeps, for every (program, division, order year,
+active) partition, the set of player ids and user ids enrolled in it. A refresh
+pulls only the enrollments whose ``[Order Date]`` is at or after the last
+watermark and merges them into those sets, so the rows transferred and merged
+scale with new orders rather than with the whole history. (Without an index on
+``[Order Date]`` the server still scans the heap to find them.)
+
+Set union is idempotent, so re-reading rows at the watermark is harmless. Rows
+that are edited in place, deleted, or loaded with an older or NULL order date
+are not seen by the watermark; a periodic reconciliation rebuilds the state
+from a full pull and swaps it in atomically.
+
+The same pipeline keeps the HyperLogLog sketches behind the approximate
+statistics. ``sketches`` is a second, sketch-only pipeline: it pulls only the
+id and date columns and keeps no id sets, so ``approx=true`` requests in the
+other ``STATS_SOURCE`` modes cost a few KiB per program and year instead of
+the exact state.
+"""
+import hashlib
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from app.database import db
+from app.ordering import player_ranking_order, program_order, year_order
+from app.sketches import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_REFRESH_SECONDS = float(os.getenv("INCREMENTAL_REFRESH_SECONDS", "60"))
+INCREMENTAL_RECONCILE_SECONDS = float(os.getenv("INCREMENTAL_RECONCILE_SECONDS", "21600"))
+INCREMENTAL_BATCH_SIZE = int(os.getenv("INCREMENTAL_BATCH_SIZE", "10000"))
+
+ENROLLMENT_QUERY = """
+SELECT ProgramID, [Program Sort Order], [Player Id], [User Id], [Order Date],
+       [Division Name], [Player First Name], [Player Last Name]
+FROM dbo.Enrollment_Details
+"""
+
+PROGRAMS_QUERY = """
+SELECT ProgramID, [Program Name], [Program Year], [Program Season], [Program Format], [Program Environment]
+FROM dbo.AthleticPrograms
+"""
+
+SKETCH_QUERY = """
+SELECT ProgramID, [Program Sort Order], [Player Id], [User Id], [Order Date]
+FROM dbo.Enrollment_Details
+"""
+
+DIVISIONS_QUERY = "SELECT ProgramID, [Division Name], [Division Gender] FROM dbo.ProgramDivisions"
+
+
+def normalize_name(name):
+    """Compare division names the way the CI_AS collation does."""
+    return None if name is None else name.rstrip().casefold()
+
+
+class AggregateState:
+    """Per-partition id sets and sketches plus the watermark they are complete up to.
+
+    Without ``exact`` only the sketches are kept, merged from ``SKETCH_QUERY`` rows.
+    """
+
+    def __init__(self, exact=True):
+        self.exact = exact
+        # (program_id, division, order_year, active) -> (player ids, user ids)
+        self.partitions = defaultdict(lambda: (set(), set()))
+        # (player_id, first name, last name) -> program ids, active enrollments only
+        self.player_programs = defaultdict(set)
+        # order year (None for undated orders) -> (players, users) sketches, all enrollments
+        self.year_sketches = defaultdict(lambda: (HyperLogLog(), HyperLogLog()))
+        # program_id -> (players, users) sketches, active enrollments only
+        self.program_sketches = defaultdict(lambda: (HyperLogLog(), HyperLogLog()))
+        self.watermark = None
+        self.rows_merged = 0
+
+    def merge(self, rows):
+        """Merge enrollment rows and return how many of them added anything new
+        (without ``exact``, how many sketches grew)."""
+        if not self.exact:
+            return self._merge_sketches(rows)
+        added = 0
+        year_ids = defaultdict(list)
+        program_ids = defaultdict(list)
+        for program_id, sort_order, player_id, user_id, order_date, division, first, last in rows:
+            player_id, user_id = int(player_id), int(user_id)
+            active = sort_order is not None and sort_order > 0
+            order_year = order_date.year if order_date is not None else None
+            self.rows_merged += 1
+
+            players, users = self.partitions[(program_id, normalize_name(division), order_year, active)]
+            new = player_id not in players or user_id not in users
+            players.add(player_id)
+            users.add(user_id)
+            year_ids[order_year].append((player_id, user_id))
+
+            if active:
+                programs = self.player_programs[(player_id, first, last)]
+                if program_id is not None and program_id not in programs:
+                    programs.add(program_id)
+                    new = True
+                program_ids[program_id].append((player_id, user_id))
+
+            if order_date is not None and (self.watermark is None or order_date > self.watermark):
+                self.watermark = order_date
+            added += new
+
+        self._add_to_sketches(year_ids, program_ids)
+        return added
+
+    def _merge_sketches(self, rows):
+        year_ids = defaultdict(list)
+        program_ids = defaultdict(list)
+        for program_id, sort_order, player_id, user_id, order_date in rows:
+            ids = (int(player_id), int(user_id))
+            self.rows_merged += 1
+            year_ids[order_date.year if order_date is not None else None].append(ids)
+            if sort_order is not None and sort_order > 0:
+                program_ids[program_id].append(ids)
+            if order_date is not None and (self.watermark is None or order_date > self.watermark):
+                self.watermark = order_date
+        return self._add_to_sketches(year_ids, program_ids)
+
+    def _add_to_sketches(self, year_ids, program_ids):
+        """Add ``{key: [(player id, user id)]}`` to the sketches; return how many grew."""
+        grown = 0
+        # Sketches are updated once per batch and key so hashing stays vectorized.
+        for sketches, ids_by_key in ((self.year_sketches, year_ids), (self.program_sketches, program_ids)):
+            for key, ids in ids_by_key.items():
+                ids = np.array(ids, dtype=np.int64)
+                player_sketch, user_sketch = sketches[key]
+                grown += player_sketch.add(ids[:, 0]) | user_sketch.add(ids[:, 1])
+        return grown
+
+
+class IncrementalAggregates:
+    def __init__(self, refresh_seconds, reconcile_seconds, exact=True):
+        """Without ``exact`` only the approximate statistics are available."""
+        self.refresh_seconds = refresh_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.exact = exact
+        self.query = ENROLLMENT_QUERY if exact else SKETCH_QUERY
+        self.last_error = None
+        self.last_refresh = None
+
+        self._state = None
+        self._programs = {}  # program_id -> (name, year, season, format, environment)
+        self._divisions = {}  # (program_id, normalized name) -> [(name, gender)]
+        self._version = 0
+        self._sketch_version = None
+        self._reconciled_at = 0.0
+
+        self._lock = threading.Lock()  # guards the state while it is read or merged into
+        self._refresh_lock = threading.Lock()  # serializes refreshes
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        self._ensure_loaded()
+        return self._version
+
+    @property
+    def sketch_version(self):
+        """Digest of the sketches and programs the approximate statistics are read from.
+
+        Unlike ``version`` it depends only on the data, so workers that merged
+        the same enrollments agree on it. None until the first refresh; reading
+        it never triggers one.
+        """
+        return self._sketch_version
+
+    def refresh(self, reconcile=False):
+        """Merge new enrollments, or rebuild everything when reconciliation is due."""
+        with self._refresh_lock:
+            started = time.monotonic()
+            programs, divisions = self._load_reference_tables()
+            reconcile = reconcile or self._state is None or started - self._reconciled_at >= self.reconcile_seconds
+
+            if reconcile:
+                state = AggregateState(self.exact)
+                for batch in db.iter_batches(self.query, batch_size=INCREMENTAL_BATCH_SIZE):
+                    state.merge(batch)
+                rows_pulled = state.rows_merged
+            else:
+                query, params = self.query, None
+                if self._state.watermark is not None:
+                    query += " WHERE [Order Date] >= CAST(? AS DATETIME)"
+                    params = (self._state.watermark,)
+                batches = list(db.iter_batches(query, params, batch_size=INCREMENTAL_BATCH_SIZE))
+                rows_pulled = sum(len(batch) for batch in batches)
+
+            with self._lock:
+                changed = programs != self._programs or divisions != self._divisions
+                self._programs, self._divisions = programs, divisions
+                if reconcile:
+                    self._state = state
+                    self._reconciled_at = started
+                    changed = True
+                else:
+                    for batch in batches:
+                        changed = self._state.merge(batch) > 0 or changed
+                if changed:
+                    self._version += 1
+                    self._sketch_version = self._digest_sketches()
+
+            self.last_refresh = {
+                "reconciled": reconcile,
+                "rows_pulled": rows_pulled,
+                "changed": changed,
+                "seconds": round(time.monotonic() - started, 3),
+            }
+            return self.last_refresh
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="incremental-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self):
+        state = self._state
+        return {
+            "loaded": state is not None,
+            "exact": self.exact,
+            "version": self._version,
+            "watermark": state.watermark.isoformat() if state and state.watermark else None,
+            "partitions": len(state.partitions) if state else 0,
+            "rows_merged": state.rows_merged if state else 0,
+            "last_refresh": self.last_refresh,
+            "last_error": self.last_error,
+        }
+
+    # Statistics
+
+    def program_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            groups = defaultdict(lambda: (set(), set()))
+            for (program_id, _, _, active), (players, users) in self._state.partitions.items():
+                program = self._programs.get(program_id)
+                if active and program:
+                    group_players, group_users = groups[program[:2]]
+                    group_players |= players
+                    group_users |= users
+        results = [
+            {"ProgramName": name, "ProgramYear": year, "PlayerCount": len(players), "FamilyCount": len(users)}
+            for (name, year), (players, users) in groups.items()
+        ]
+        return sorted(results, key=program_order)
+
+    def year_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            groups = defaultdict(lambda: (set(), set()))
+            for (program_id, _, _, active), (players, users) in self._state.partitions.items():
+                program = self._programs.get(program_id)
+                if active and program:
+                    group_players, group_users = groups[program[1]]
+                    group_players |= players
+                    group_users |= users
+        return [
+            {"ProgramYear": year, "UniquePlayerCount": len(players), "UniqueFamilyCount": len(users)}
+            for year, (players, users) in sorted(groups.items(), key=lambda item: (item[0] is not None, item[0] or 0))
+        ]
+
+    def division_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            groups = defaultdict(set)
+            for (program_id, division, _, active), (players, _) in self._state.partitions.items():
+                program = self._programs.get(program_id)
+                if not (active and program):
+                    continue
+                for name, gender in self._divisions.get((program_id, division), ()):
+                    groups[program[1], program[0], program[2], program[3], program[4], name, gender] |= players
+        results = [
+            {
+                "ProgramYear": year,
+                "ProgramName": name,
+                "ProgramSeason": season,
+                "ProgramFormat": fmt,
+                "ProgramEnvironment": environment,
+                "DivisionName": division,
+                "DivisionGender": gender,
+                "Players": len(players),
+            }
+            for (year, name, season, fmt, environment, division, gender), players in groups.items()
+        ]
+        return sorted(results, key=program_order)
+
+    def lifetime_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            players, users = set(), set()
+            for partition_players, partition_users in self._state.partitions.values():
+                players |= partition_players
+                users |= partition_users
+        return {"PlayersLifetime": len(players), "FamiliesLifetime": len(users)}
+
+    def order_year_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            groups = defaultdict(lambda: (set(), set()))
+            for (_, _, order_year, _), (players, users) in self._state.partitions.items():
+                if order_year is not None:
+                    group_players, group_users = groups[order_year]
+                    group_players |= players
+                    group_users |= users
+        return {
+            str(year): {"players": len(players), "families": len(users)}
+            for year, (players, users) in sorted(groups.items())
+        }
+
+    def player_enrollment_counts(self, limit):
+        self._ensure_loaded()
+        with self._lock:
+            rows = [
+                {"PlayerId": player_id, "PlayerFirstName": first, "PlayerLastName": last,
+                 "TotalEnrollments": len(programs)}
+                for (player_id, first, last), programs in self._state.player_programs.items()
+            ]
+        return heapq.nsmallest(max(limit, 0), rows, key=player_ranking_order)
+
+    def active_memberships(self):
+        self._ensure_loaded()
+        program_ids, player_ids, user_ids = [], [], []
+        with self._lock:
+            for (program_id, _, _, active), (players, users) in self._state.partitions.items():
+                if not (active and program_id in self._programs):
+                    continue
+                # Partitions keep players and users in separate sets; pairing
+                # them is not needed, so each array only needs the same length.
+                size = max(len(players), len(users))
+                program_ids.append(np.full(size, program_id, dtype=np.int64))
+                player_ids.append(np.resize(np.fromiter(players, dtype=np.int64, count=len(players)), size))
+                user_ids.append(np.resize(np.fromiter(users, dtype=np.int64, count=len(users)), size))
+            programs = {program_id: (name, year, season) for program_id, (name, year, season, _, _) in self._programs.items()}
+        if not program_ids:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, programs
+        return np.concatenate(program_ids), np.concatenate(player_ids), np.concatenate(user_ids), programs
+
+    # Approximate statistics, merged from HyperLogLog sketches
+
+    def approximate_program_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            groups = defaultdict(lambda: (HyperLogLog(), HyperLogLog()))
+            for program_id, (players, users) in self._state.program_sketches.items():
+                program = self._programs.get(program_id)
+                if program:
+                    group_players, group_users = groups[program[:2]]
+                    group_players.merge(players)
+                    group_users.merge(users)
+        results = [
+            {
+                "ProgramName": name,
+                "ProgramYear": year,
+                "PlayerCount": players.estimate(),
+                "FamilyCount": users.estimate(),
+                "RelativeError": players.relative_error,
+            }
+            for (name, year), (players, users) in groups.items()
+        ]
+        return sorted(results, key=program_order)
+
+    def approximate_year_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            groups = defaultdict(lambda: (HyperLogLog(), HyperLogLog()))
+            for program_id, (players, users) in self._state.program_sketches.items():
+                program = self._programs.get(program_id)
+                if program:
+                    group_players, group_users = groups[program[1]]
+                    group_players.merge(players)
+                    group_users.merge(users)
+        results = [
+            {
+                "ProgramYear": year,
+                "UniquePlayerCount": players.estimate(),
+                "UniqueFamilyCount": users.estimate(),
+                "RelativeError": players.relative_error,
+            }
+            for year, (players, users) in groups.items()
+        ]
+        return sorted(results, key=year_order)
+
+    def approximate_lifetime_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            sketches = list(self._state.year_sketches.values())
+            players = HyperLogLog.union(p for p, _ in sketches)
+            users = HyperLogLog.union(u for _, u in sketches)
+        return {
+            "PlayersLifetime": players.estimate(),
+            "FamiliesLifetime": users.estimate(),
+            "RelativeError": players.relative_error,
+        }
+
+    def approximate_order_year_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            sketches = {year: (p.copy(), u.copy()) for year, (p, u) in self._state.year_sketches.items() if year is not None}
+        return {
+            str(year): {"players": p.estimate(), "families": u.estimate(), "RelativeError": p.relative_error}
+            for year, (p, u) in sorted(sketches.items())
+        }
+
+    # Internals
+
+    def _digest_sketches(self):
+        digest = hashlib.blake2b(repr(sorted(self._programs.items())).encode(), digest_size=16)
+        for sketches in (self._state.year_sketches, self._state.program_sketches):
+            for key in sorted(sketches, key=repr):
+                players, users = sketches[key]
+                digest.update(repr(key).encode())
+                digest.update(players.registers.tobytes())
+                digest.update(users.registers.tobytes())
+        return digest.hexdigest()
+
+    def _ensure_loaded(self):
+        if self._state is None:
+            self.refresh()
+
+    def _load_reference_tables(self):
+        programs = {
+            row[0]: tuple(row[1:])
+            for batch in db.iter_batches(PROGRAMS_QUERY)
+            for row in batch
+        }
+        divisions = defaultdict(list)
+        for batch in db.iter_batches(DIVISIONS_QUERY):
+            for program_id, name, gender in batch:
+                if name is not None:
+                    divisions[(program_id, normalize_name(name))].append((name, gender))
+        return programs, dict(divisions)
+
+    def _run(self):
+        wait = 0 if self._state is None else self.refresh_seconds
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Incremental aggregate refresh failed: {e}")
+            wait = self.refresh_seconds
+
+
+pipeline = IncrementalAggregates(INCREMENTAL_REFRESH_SECONDS, INCREMENTAL_RECONCILE_SECONDS)
+# Serves the approximate statistics when STATS_SOURCE is not incremental.
+sketches = IncrementalAggregates(INCREMENTAL_REFRESH_SECONDS, INCREMENTAL_RECONCILE_SECONDS, exact=False)
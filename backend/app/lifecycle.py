@@ -0,0 +1,120 @@
+"""Startup warm-up and keepalive for the auto-pausing serverless database.
+
+``start()`` runs in a background thread so the API accepts requests while the
+database resumes. It opens the pool's connections and then calls every
+registered warmer (the cached stats and list loaders), so the first dashboard
+load is served from cache. Afterwards, if ``KEEPALIVE_SECONDS`` is set, it
+runs ``SELECT 1`` on that schedule to stop the database from pausing. The pings
+can be limited to ``KEEPALIVE_HOURS`` (e.g. ``7-22``, local time) so the
+database can still pause overnight.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+
+def parse_hours(value):
+    """``"7-22"`` -> ``(7, 22)``; empty means all day."""
+    if not value:
+        return None
+    start, end = (int(part) for part in value.split("-"))
+    if not (0 <= start <= 23 and 0 <= end <= 24):
+        raise ValueError(f"KEEPALIVE_HOURS must look like 7-22, not {value!r}")
+    return start, end
+
+
+class Lifecycle:
+    def __init__(self, keepalive_seconds=0.0, keepalive_hours=None):
+        self.keepalive_seconds = keepalive_seconds
+        self.keepalive_hours = keepalive_hours
+        self.warm_up = {"started_at": None, "seconds": None, "warmed": [], "errors": {}}
+        self.keepalive = {"pings": 0, "last_ping_at": None, "last_error": None}
+        self._warmers = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, name, warmer):
+        """Call ``warmer()`` during warm-up; its result is expected to land in a cache."""
+        self._warmers.append((name, warmer))
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="lifecycle", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self):
+        return {
+            "warm_up": self.warm_up,
+            "keepalive": {
+                "interval_seconds": self.keepalive_seconds or None,
+                "hours": "-".join(map(str, self.keepalive_hours)) if self.keepalive_hours else None,
+                **self.keepalive,
+            },
+        }
+
+    def in_keepalive_hours(self, now=None):
+        if not self.keepalive_hours:
+            return True
+        start, end = self.keepalive_hours
+        hour = (now or datetime.now()).hour
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def run_warm_up(self):
+        started = time.monotonic()
+        self.warm_up = {"started_at": datetime.now().isoformat(timespec="seconds"), "seconds": None,
+                        "warmed": [], "errors": {}}
+        try:
+            db.pool.warm()
+        except Exception as e:
+            # The serverless database may still be resuming; connections open on demand.
+            logger.warning(f"Could not warm database connection pool: {e}")
+            self.warm_up["errors"]["pool"] = str(e)
+
+        for name, warmer in self._warmers:
+            if self._stop.is_set():
+                break
+            try:
+                warmer()
+                self.warm_up["warmed"].append(name)
+            except Exception as e:
+                logger.warning(f"Warm-up of {name} failed: {e}")
+                self.warm_up["errors"][name] = str(e)
+        self.warm_up["seconds"] = round(time.monotonic() - started, 3)
+        logger.info(f"Warm-up finished in {self.warm_up['seconds']}s ({len(self.warm_up['warmed'])} payloads)")
+
+    def ping(self):
+        try:
+            db.execute_query("SELECT 1")
+            self.keepalive["pings"] += 1
+            self.keepalive["last_ping_at"] = datetime.now().isoformat(timespec="seconds")
+            self.keepalive["last_error"] = None
+        except Exception as e:
+            logger.warning(f"Keepalive ping failed: {e}")
+            self.keepalive["last_error"] = str(e)
+
+    def _run(self):
+        self.run_warm_up()
+        if not self.keepalive_seconds:
+            return
+        while not self._stop.wait(self.keepalive_seconds):
+            if self.in_keepalive_hours():
+                self.ping()
+
+
+lifecycle = Lifecycle(
+    keepalive_seconds=float(os.getenv("KEEPALIVE_SECONDS", "0")),
+    keepalive_hours=parse_hours(os.getenv("KEEPALIVE_HOURS", "")),
+)
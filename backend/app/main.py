@@ -1,7 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
 from app.database import db
+from app import admission, aggregates, exports, incremental, metrics, retention, search, snapshot, summaries
+from app.cache import STALE_WAIT_SECONDS, cached, cache_stats, stale_results, table_version
+from app.http_cache import CompressionMiddleware, conditional_get
+from app.lifecycle import lifecycle
+from app.pagination import ORDER_BY, InvalidCursor, encode_cursor, keyset_condition
+from app.projection import ATHLETIC_PROGRAMS, ENROLLMENT_DETAILS, PROGRAM_DIVISIONS
+from app.stats_query import InvalidStatsQuery, StatsQuery, parse_filters
 from app.models import (
     AthleticProgram,
     ProgramDivision,
@@ -9,9 +17,20 @@ from app.models import (
     ProgramStats,
     YearStats,
     DivisionStats,
-    PlayerEnrollmentStats
+    PlayerEnrollmentStats,
+    DashboardStats,
+    PlayerMatch,
+    FamilyMatch
 )
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+import asyncio
+import itertools
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,15 +41,167 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# CORS configuration
+app.add_middleware(CompressionMiddleware)
+
+HEALTH_MAX_AGE_SECONDS = float(os.getenv("HEALTH_MAX_AGE_SECONDS", "30"))
+
+def route_path(scope):
+    """The path template of the route serving ``scope``, so metrics are not labelled per id"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+# The last middleware registered runs outermost: CORS, metrics, admission, conditional GET, then stale marking.
+@app.middleware("http")
+async def mark_stale_responses(request: Request, call_next):
+    served = []
+    token = stale_results.set(served)
+    try:
+        response = await call_next(request)
+    finally:
+        stale_results.reset(token)
+    if served:
+        # The database was resuming or slow; these results predate the current data.
+        response.headers["X-Served-Stale"] = ", ".join(f"{namespace};age={age:.0f}" for namespace, age in served)
+    return response
+
+@app.middleware("http")
+async def conditional_get_responses(request: Request, call_next):
+    """Answer 304 before the endpoint runs when If-None-Match has the current data version's ETag"""
+    version = conditional_get.version_for(route_path(request.scope))
+    if request.method != "GET" or version is None:
+        return await call_next(request)
+
+    try:
+        # A version probe stuck on a resuming database must not hold back the stale fallback.
+        etag = await asyncio.wait_for(
+            run_in_threadpool(conditional_get.etag, request.url.path, request.query_params.multi_items(), version),
+            timeout=STALE_WAIT_SECONDS if STALE_WAIT_SECONDS >= 0 else None,
+        )
+    except asyncio.TimeoutError:
+        return await call_next(request)
+    except Exception as e:
+        # Without a version the endpoint reports the database error itself.
+        logger.warning(f"Could not compute ETag for {request.url.path}: {e}")
+        return await call_next(request)
+
+    headers = {"ETag": etag, "Cache-Control": conditional_get.cache_control}
+    if conditional_get.matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    # A stale fallback predates the version the tag names.
+    if response.status_code == 200 and "X-Served-Stale" not in response.headers:
+        response.headers.update(headers)
+    return response
+
+@app.middleware("http")
+async def admit_requests(request: Request, call_next):
+    """Run the request's database work, including the ETag probe, in its route's priority class"""
+    rejected = []
+    class_token = admission.current_class.set(admission.classify(route_path(request.scope)))
+    rejections_token = admission.rejections.set(rejected)
+    try:
+        response = await call_next(request)
+    finally:
+        admission.current_class.reset(class_token)
+        admission.rejections.reset(rejections_token)
+    if rejected and response.status_code >= 500:
+        retry_after = max(e.retry_after for e in rejected)
+        return JSONResponse(status_code=503, content={"detail": str(rejected[0])}, headers={"Retry-After": str(retry_after)})
+    return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    request_metrics = metrics.RequestMetrics(route_path(request.scope))
+    token = metrics.current_request.set(request_metrics)
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.current_request.reset(token)
+    total = request_metrics.observe(request.method, response.status_code)
+    if metrics.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = request_metrics.server_timing(total)
+    return response
+
+# CORS configuration. Registered last so it wraps every response, including
+# the 304s and 503s answered by the middlewares above.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, replace with specific origins
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Served-Stale", "Content-Disposition", "ETag"],
 )
 
+@app.on_event("startup")
+def start_stats_refresh():
+    if aggregates.STATS_SOURCE == "snapshot":
+        snapshot.store.start()
+    elif aggregates.STATS_SOURCE == "incremental":
+        incremental.pipeline.start()
+    else:
+        summaries.store.start()
+
+@app.on_event("startup")
+def start_search_index():
+    search.index.start()
+
+@app.on_event("startup")
+def start_lifecycle():
+    """Warm the pool and precompute the dashboard payloads without delaying startup"""
+    warmers = {
+        "programs": program_list_json,
+        "divisions": division_list_json,
+        "stats.programs": program_stats,
+        "stats.years": year_stats,
+        "stats.divisions": get_division_stats,
+        "stats.lifetime": lifetime_stats,
+        "stats.yearly_breakdown": yearly_breakdown,
+        "stats.player_enrollments": get_player_enrollment_stats,
+        "stats.dashboard_enrollments": lambda: dashboard_enrollments(50),
+    }
+    for name, warmer in warmers.items():
+        lifecycle.register(name, warmer)
+    lifecycle.start()
+
+@app.on_event("startup")
+def register_conditional_routes():
+    """Tag responses with the data version of the cached loader behind each route"""
+    routes = {
+        "/programs": program_list_json,
+        "/programs/{program_id}": program_json,
+        "/divisions": division_list_json,
+        "/stats/divisions": get_division_stats,
+        "/stats/player-enrollments": get_player_enrollment_stats,
+        "/stats/query": stats_query_rows,
+        "/stats/retention": get_retention_stats,
+        "/stats/cohorts": get_cohort_stats,
+    }
+    for path, loader in routes.items():
+        conditional_get.register(path, loader.version)
+    conditional_get.register("/stats/programs", with_sketches(program_stats))
+    conditional_get.register("/stats/years", with_sketches(year_stats))
+    conditional_get.register("/stats/lifetime", with_sketches(lifetime_stats))
+    conditional_get.register("/stats/yearly-breakdown", with_sketches(yearly_breakdown))
+    conditional_get.register("/stats/dashboard", dashboard_version)
+
+@app.on_event("shutdown")
+def stop_stats_refresh():
+    lifecycle.stop()
+    snapshot.store.stop()
+    incremental.pipeline.stop()
+    incremental.sketches.stop()
+    summaries.store.stop()
+    search.index.stop()
+
+@app.on_event("shutdown")
+def close_connection_pool():
+    db.pool.close()
+
 @app.get("/")
 def read_root():
     return {"message": "LPFC Athletic Programs API", "version": "1.0.0"}
@@ -38,361 +209,582 @@ def read_root():
 @app.get("/health")
 def health_check():
     try:
-        db.execute_query("SELECT 1")
-        return {"status": "healthy", "database": "connected"}
+        # Any query that succeeded recently proves the connection; polling must not keep the database awake.
+        age = db.seconds_since_success()
+        if age is None or age > HEALTH_MAX_AGE_SECONDS:
+            db.execute_query("SELECT 1")
+        return {
+            "status": "healthy",
+            "database": "connected",
+            "last_query_seconds_ago": round(db.seconds_since_success(), 1),
+            "pool": db.pool.stats(),
+            **lifecycle.status(),
+        }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
+        return {"status": "unhealthy", "database": "disconnected", "error": str(e), "pool": db.pool.stats()}
+
+# Stats that only ever grow; /metrics exports them as ``_total`` counters.
+POOL_COUNTERS = {"checkouts", "connections_opened", "connections_closed", "recycled", "validation_failures", "timeouts"}
+CACHE_COUNTERS = {"hits", "misses", "stale", "expired", "evictions", "version_probes"}
+SINGLE_FLIGHT_COUNTERS = {"executions", "saved"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Request, query and span histograms in the Prometheus text format"""
+    gauges, counters = [], []
+    for prefix, description, stats, totals in (
+        ("lpfc_pool", "Connection pool", db.pool.stats(), POOL_COUNTERS),
+        ("lpfc_cache", "Result cache", cache_stats(), CACHE_COUNTERS),
+        ("lpfc_single_flight", "Query coalescing", db.single_flight.stats(), SINGLE_FLIGHT_COUNTERS),
+    ):
+        stat_gauges, stat_counters = metrics.stats_series(prefix, description, stats, totals)
+        gauges += stat_gauges
+        counters += stat_counters
+    gauges += [
+        ("lpfc_admission_active", "Database connections checked out under an admission slot.", admission.controller.active),
+    ] + [
+        (f"lpfc_admission_{name}_{stat}", f"Admission control {name} slots {stat}.", value)
+        for name, priority in admission.controller.classes.items()
+        for stat, value in (("active", priority.active), ("queued", len(priority.waiters)))
+    ]
+    return PlainTextResponse(metrics.render(gauges, counters), media_type="text/plain; version=0.0.4")
+
+@app.get("/admission/status")
+def get_admission_status():
+    """Database slots in use, queue depths and wait times per priority class"""
+    return admission.controller.status()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Get result cache hit/miss counters and footprint"""
+    return cache_stats()
+
+@app.get("/snapshot/status")
+def get_snapshot_status():
+    """Get the state of the local columnar snapshot used when STATS_SOURCE=snapshot"""
+    return {"stats_source": aggregates.STATS_SOURCE, **snapshot.store.status()}
+
+@app.get("/incremental/status")
+def get_incremental_status():
+    """Get the watermark and last refresh of the incrementally maintained aggregates"""
+    return {
+        "stats_source": aggregates.STATS_SOURCE,
+        **incremental.pipeline.status(),
+        "sketches": aggregates.sketch_source.status(),
+    }
+
+@app.post("/incremental/reconcile")
+def reconcile_incremental():
+    """Rebuild the incremental aggregates from a full pull"""
+    try:
+        return incremental.pipeline.refresh(reconcile=True)
+    except Exception as e:
+        logger.error(f"Error reconciling incremental aggregates: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/summaries/status")
+def get_summaries_status():
+    """Get which summary tables exist and whether they match the current data"""
+    return {"stats_source": aggregates.STATS_SOURCE, **summaries.store.status()}
+
+@app.post("/summaries/refresh")
+def refresh_summaries():
+    """Rebuild the summary tables whose source tables changed"""
+    try:
+        return summaries.store.refresh()
+    except summaries.NotProvisioned as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error refreshing summaries: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/search/status")
+def get_search_status():
+    """Get the size, watermark and last refresh of the in-memory search index"""
+    return search.index.status()
 
 # Athletic Programs Endpoints
+def json_response(body, headers=None):
+    """Send JSON already serialized by a projection, skipping response_model validation"""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@cached("programs", version=table_version("AthleticPrograms"))
+def program_list_json(year=None):
+    query = f"SELECT {ATHLETIC_PROGRAMS.select_list} FROM [dbo].[AthleticPrograms]"
+    params = None
+    if year:
+        query += " WHERE [Program Year] = ?"
+        params = (year,)
+    query += " ORDER BY [Program Sort Order], [Program Year] DESC"
+    return ATHLETIC_PROGRAMS.dumps(db.fetch_rows(query, params))
+
 @app.get("/programs", response_model=List[AthleticProgram])
 def get_programs(year: Optional[int] = None):
     """Get all athletic programs, optionally filtered by year"""
     try:
-        query = "SELECT * FROM [dbo].[AthleticPrograms]"
-        if year:
-            query += f" WHERE [Program Year] = {year}"
-        query += " ORDER BY [Program Sort Order], [Program Year] DESC"
-
-        results = db.execute_query(query)
-
-        # Convert space-separated column names to PascalCase
-        formatted_results = []
-        for row in results:
-            formatted_row = {
-                "ProgramID": row.get("ProgramID"),
-                "ProgramName": row.get("Program Name"),
-                "ProgramSport": row.get("Program Sport"),
-                "ProgramYear": row.get("Program Year"),
-                "ProgramSeason": row.get("Program Season"),
-                "ProgramFormat": row.get("Program Format"),
-                "ProgramEnvironment": row.get("Program Environment"),
-                "ProgramSortOrder": row.get("Program Sort Order")
-            }
-            formatted_results.append(formatted_row)
-
-        return formatted_results
+        return json_response(program_list_json(year))
     except Exception as e:
         logger.error(f"Error fetching programs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@cached("program", version=table_version("AthleticPrograms"))
+def program_json(program_id):
+    query = f"SELECT {ATHLETIC_PROGRAMS.select_list} FROM [dbo].[AthleticPrograms] WHERE ProgramID = ?"
+    rows = db.fetch_rows(query, (program_id,))
+    return ATHLETIC_PROGRAMS.dumps_one(rows[0]) if rows else None
+
 @app.get("/programs/{program_id}", response_model=AthleticProgram)
 def get_program(program_id: int):
     """Get a specific athletic program by ID"""
     try:
-        query = "SELECT * FROM [dbo].[AthleticPrograms] WHERE ProgramID = ?"
-        results = db.execute_query(query, (program_id,))
-
-        if not results:
-            raise HTTPException(status_code=404, detail="Program not found")
-
-        row = results[0]
-        return {
-            "ProgramID": row.get("ProgramID"),
-            "ProgramName": row.get("Program Name"),
-            "ProgramSport": row.get("Program Sport"),
-            "ProgramYear": row.get("Program Year"),
-            "ProgramSeason": row.get("Program Season"),
-            "ProgramFormat": row.get("Program Format"),
-            "ProgramEnvironment": row.get("Program Environment"),
-            "ProgramSortOrder": row.get("Program Sort Order")
-        }
-    except HTTPException:
-        raise
+        body = program_json(program_id)
     except Exception as e:
         logger.error(f"Error fetching program {program_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    if body is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    return json_response(body)
+
 # Program Divisions Endpoints
+@cached("divisions", version=table_version("ProgramDivisions"))
+def division_list_json(program_id=None):
+    query = f"SELECT {PROGRAM_DIVISIONS.select_list} FROM [dbo].[ProgramDivisions]"
+    params = None
+    if program_id:
+        query += " WHERE ProgramID = ?"
+        params = (program_id,)
+    return PROGRAM_DIVISIONS.dumps(db.fetch_rows(query, params))
+
 @app.get("/divisions", response_model=List[ProgramDivision])
 def get_divisions(program_id: Optional[int] = None):
     """Get all program divisions, optionally filtered by program"""
     try:
-        query = "SELECT * FROM [dbo].[ProgramDivisions]"
-        params = None
-
-        if program_id:
-            query += " WHERE ProgramID = ?"
-            params = (program_id,)
-
-        results = db.execute_query(query, params)
-
-        formatted_results = []
-        for row in results:
-            formatted_row = {
-                "DivisionID": row.get("DivisionID"),
-                "ProgramID": row.get("ProgramID"),
-                "DivisionName": row.get("Division Name"),
-                "DivisionFormat": row.get("Division Format"),
-                "DivisionGender": row.get("Division Gender"),
-                "UpperDivision": row.get("Upper Division"),
-                "LowerDivision": row.get("Lower Division"),
-                "DivisionDuration_Weeks": row.get("DivisionDuration_Weeks"),
-                "DivisionPractices_PerWeek": row.get("DivisionPractices_PerWeek"),
-                "DivisionPracticeLenth_Hours": row.get("DivisionPracticeLenth_Hours"),
-                "DivisionGames_PerWeek": row.get("DivisionGames_PerWeek"),
-                "DivisionGameLength_Hours": row.get("DivisionGameLength_Hours")
-            }
-            formatted_results.append(formatted_row)
-
-        return formatted_results
+        return json_response(division_list_json(program_id))
     except Exception as e:
         logger.error(f"Error fetching divisions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Enrollment Endpoints
+def enrollment_query(program_id=None, year=None, cursor=None):
+    """Build the filtered, newest-first enrollment query without its SELECT clause"""
+    query = "FROM [dbo].[Enrollment_Details] WHERE 1=1"
+    params = []
+
+    if program_id:
+        query += " AND ProgramID = ?"
+        params.append(program_id)
+
+    if year:
+        query += " AND [Program Year] = ?"
+        params.append(year)
+
+    if cursor:
+        condition, cursor_params = keyset_condition(cursor)
+        query += f" AND {condition}"
+        params.extend(cursor_params)
+
+    query += f" ORDER BY {ORDER_BY}"
+    return query, params
+
+ORDER_DATE = ENROLLMENT_DETAILS.index("OrderDate")
+ORDER_NO = ENROLLMENT_DETAILS.index("OrderNo")
+
+def enrollment_page(program_id=None, year=None, limit=100, cursor=None):
+    """Fetch one page of enrollment rows and the cursor of the next page, if any"""
+    query, params = enrollment_query(program_id, year, cursor)
+    rows = db.fetch_rows(
+        f"SELECT TOP (?) WITH TIES {ENROLLMENT_DETAILS.select_list} {query}",
+        tuple([limit] + params)
+    )
+    next_cursor = None
+    if rows and len(rows) >= limit:
+        next_cursor = encode_cursor(rows[-1][ORDER_DATE], rows[-1][ORDER_NO])
+    return rows, next_cursor
+
 @app.get("/enrollments", response_model=List[EnrollmentDetail])
 def get_enrollments(
     program_id: Optional[int] = None,
     year: Optional[int] = None,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
-    """Get enrollment details, optionally filtered by program and year"""
+    """Get enrollment details, optionally filtered by program and year.
+
+    Pass the ``X-Next-Cursor`` header of a response as ``cursor`` to get the next page.
+    """
     try:
-        query = "SELECT TOP (?) * FROM [dbo].[Enrollment_Details] WHERE 1=1"
-        params = [limit]
-
-        if program_id:
-            query += " AND ProgramID = ?"
-            params.append(program_id)
-
-        if year:
-            query += " AND [Program Year] = ?"
-            params.append(year)
-
-        query += " ORDER BY [Order Date] DESC"
-
-        results = db.execute_query(query, tuple(params))
-
-        formatted_results = []
-        for row in results:
-            formatted_row = {
-                "ProgramName": row.get("Program Name"),
-                "DivisionName": row.get("Division Name"),
-                "AccountFirstName": row.get("Account First Name"),
-                "AccountLastName": row.get("Account Last Name"),
-                "PlayerFirstName": row.get("Player First Name"),
-                "PlayerLastName": row.get("Player Last Name"),
-                "PlayerGender": row.get("Player Gender"),
-                "PlayerBirthDate": row.get("Player Birth Date"),
-                "StreetAddress": row.get("Street Address"),
-                "Unit": row.get("Unit"),
-                "City": row.get("City"),
-                "State": row.get("State"),
-                "PostalCode": row.get("Postal Code"),
-                "UserEmail": row.get("User Email"),
-                "Telephone": row.get("Telephone"),
-                "Cellphone": row.get("Cellphone"),
-                "OtherPhone": row.get("Other Phone"),
-                "TeamName": row.get("Team Name"),
-                "OrderDate": row.get("Order Date"),
-                "OrderNo": row.get("Order No"),
-                "OrderDetailDescription": row.get("Order Detail Description"),
-                "OrderItemAmount": row.get("OrderItem Amount"),
-                "OrderItemAmountPaid": row.get("OrderItem Amount Paid"),
-                "OrderItemBalance": row.get("OrderItem Balance"),
-                "OrderPaymentStatus": row.get("Order Payment Status"),
-                "PlayerId": row.get("Player Id"),
-                "UserId": row.get("User Id"),
-                "ProgramYear": row.get("Program Year"),
-                "ProgramSeason": row.get("Program Season"),
-                "ProgramSortOrder": row.get("Program Sort Order"),
-                "DivisionGender": row.get("Division Gender"),
-                "ProgramEnvironment": row.get("Program Environment"),
-                "ProgramID": row.get("ProgramID")
-            }
-            formatted_results.append(formatted_row)
-
-        return formatted_results
+        rows, next_cursor = enrollment_page(program_id, year, limit, cursor)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return json_response(ENROLLMENT_DETAILS.dumps(rows), headers)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching enrollments: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/enrollments/stream")
+def stream_enrollments(
+    program_id: Optional[int] = None,
+    year: Optional[int] = None,
+    cursor: Optional[str] = None,
+    batch_size: int = Query(default=1000, ge=1, le=10000)
+):
+    """Stream every matching enrollment as newline-delimited JSON"""
+    try:
+        query, params = enrollment_query(program_id, year, cursor)
+        batches = db.iter_batches(f"SELECT {ENROLLMENT_DETAILS.select_list} {query}", tuple(params), batch_size=batch_size)
+        # Run the query now so that failures still produce an error status.
+        first = next(batches, None)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error streaming enrollments: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def lines():
+        try:
+            if first is None:
+                return
+            for batch in itertools.chain([first], batches):
+                yield ENROLLMENT_DETAILS.dumps_lines(batch)
+        finally:
+            batches.close()
+
+    body = lines()
+    # Starlette runs the background task even when the client disconnects
+    # mid-stream, so the connection and its admission slot are returned then.
+    return StreamingResponse(body, media_type="application/x-ndjson", background=BackgroundTask(body.close))
+
+# Export Endpoints
+def enrollment_export(program_id=None, year=None):
+    """The export query and download file stem for the filtered enrollments"""
+    query, params = enrollment_query(program_id, year)
+    name = "enrollments"
+    if program_id:
+        name += f"-program-{program_id}"
+    if year:
+        name += f"-{year}"
+    return name, query, params
+
+@app.get("/exports/enrollments")
+def export_enrollments(
+    program_id: Optional[int] = None,
+    year: Optional[int] = None,
+    format: str = "csv",
+    batch_size: int = Query(default=exports.EXPORT_BATCH_SIZE, ge=1, le=exports.EXPORT_MAX_BATCH_SIZE)
+):
+    """Stream every matching enrollment as CSV or Parquet"""
+    try:
+        _, media_type, extension = exports.export_format(format)
+        name, query, params = enrollment_export(program_id, year)
+        chunks = exports.export_chunks(format, ENROLLMENT_DETAILS, query, params, batch_size=batch_size)
+    except exports.UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error exporting enrollments: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+        background=BackgroundTask(chunks.close),
+    )
+
+@app.post("/exports/enrollments/jobs", status_code=202)
+def start_enrollment_export(
+    request: Request,
+    program_id: Optional[int] = None,
+    year: Optional[int] = None,
+    format: str = "csv",
+    batch_size: int = Query(default=exports.EXPORT_BATCH_SIZE, ge=1, le=exports.EXPORT_MAX_BATCH_SIZE)
+):
+    """Export matching enrollments in the background; poll the job and fetch its download URL when done"""
+    try:
+        name, query, params = enrollment_export(program_id, year)
+        job = exports.jobs.submit(
+            name, format, ENROLLMENT_DETAILS, query, params, batch_size=batch_size,
+            client=request.client.host if request.client else None,
+        )
+    except exports.UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except exports.TooManyJobs as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return export_job_status(request, job)
+
+def export_job_status(request, job):
+    return {
+        **job,
+        "status_url": str(request.url_for("get_export_job", job_id=job["id"])),
+        "download_url": str(request.url_for("download_export", job_id=job["id"])) if job["status"] == "done" else None,
+    }
+
+@app.get("/exports/jobs/{job_id}")
+def get_export_job(request: Request, job_id: str):
+    job = exports.jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return export_job_status(request, job)
+
+@app.get("/exports/jobs/{job_id}/download")
+def download_export(job_id: str):
+    job = exports.jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    path = exports.jobs.path(job_id)
+    if path is None:
+        raise HTTPException(status_code=409, detail=f"Export job is {job['status']}")
+    _, media_type, _ = exports.export_format(job["format"])
+    return FileResponse(path, media_type=media_type, filename=job["filename"])
+
 # Statistics Endpoints
-@app.get("/stats/programs", response_model=List[ProgramStats])
-def get_program_stats():
-    """Get player and family counts by program"""
+@cached("stats.programs", version=aggregates.stats_version("Enrollment_Details", "AthleticPrograms"))
+def program_stats():
     try:
-        query = """
-        SELECT a.[Program Name] as ProgramName, a.[Program Year] as ProgramYear, a.cnt as PlayerCount, b.cnt as FamilyCount
-        FROM
-        (
-            SELECT COUNT(DISTINCT dbo.Enrollment_Details.[Player Id]) AS cnt,
-                   dbo.AthleticPrograms.[Program Name],
-                   dbo.AthleticPrograms.[Program Year]
-            FROM dbo.Enrollment_Details
-            INNER JOIN dbo.AthleticPrograms ON dbo.Enrollment_Details.ProgramID = dbo.AthleticPrograms.ProgramID
-            WHERE (dbo.Enrollment_Details.[Program Sort Order] > 0)
-            GROUP BY dbo.AthleticPrograms.[Program Name], dbo.AthleticPrograms.[Program Year]
-        ) a
-        INNER JOIN
-        (
-            SELECT COUNT(DISTINCT dbo.Enrollment_Details.[User Id]) AS cnt,
-                   dbo.AthleticPrograms.[Program Name],
-                   dbo.AthleticPrograms.[Program Year]
-            FROM dbo.Enrollment_Details
-            INNER JOIN dbo.AthleticPrograms ON dbo.Enrollment_Details.ProgramID = dbo.AthleticPrograms.ProgramID
-            WHERE (dbo.Enrollment_Details.[Program Sort Order] > 0)
-            GROUP BY dbo.AthleticPrograms.[Program Name], dbo.AthleticPrograms.[Program Year]
-        ) b
-        ON a.[Program Name] = b.[Program Name] AND a.[Program Year] = b.[Program Year]
-        ORDER BY a.[Program Year] DESC, a.[Program Name]
-        """
-
-        results = db.execute_query(query)
-        return results
+        return aggregates.program_counts()
     except Exception as e:
         logger.error(f"Error fetching program stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/stats/years", response_model=List[YearStats])
-def get_year_stats():
-    """Get player and family counts by year"""
+@cached("stats.years", version=aggregates.stats_version("Enrollment_Details", "AthleticPrograms"))
+def year_stats():
     try:
-        query = """
-        SELECT a.[Program Year] as ProgramYear,
-               a.cnt as UniquePlayerCount,
-               b.cnt as UniqueFamilyCount
-        FROM
-        (
-            SELECT COUNT(DISTINCT dbo.Enrollment_Details.[Player Id]) AS cnt,
-                   dbo.AthleticPrograms.[Program Year]
-            FROM dbo.Enrollment_Details
-            INNER JOIN dbo.AthleticPrograms ON dbo.Enrollment_Details.ProgramID = dbo.AthleticPrograms.ProgramID
-            WHERE (dbo.Enrollment_Details.[Program Sort Order] > 0)
-            GROUP BY dbo.AthleticPrograms.[Program Year]
-        ) a
-        INNER JOIN
-        (
-            SELECT COUNT(DISTINCT dbo.Enrollment_Details.[User Id]) AS cnt,
-                   dbo.AthleticPrograms.[Program Year]
-            FROM dbo.Enrollment_Details
-            INNER JOIN dbo.AthleticPrograms ON dbo.Enrollment_Details.ProgramID = dbo.AthleticPrograms.ProgramID
-            WHERE (dbo.Enrollment_Details.[Program Sort Order] > 0)
-            GROUP BY dbo.AthleticPrograms.[Program Year]
-        ) b
-        ON a.[Program Year] = b.[Program Year]
-        ORDER BY a.[Program Year] ASC
-        """
-
-        results = db.execute_query(query)
-        return results
+        return aggregates.year_counts()
     except Exception as e:
         logger.error(f"Error fetching year stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@cached("stats.lifetime", version=aggregates.stats_version("Enrollment_Details"))
+def lifetime_stats():
+    try:
+        return aggregates.lifetime_counts()
+    except Exception as e:
+        logger.error(f"Error fetching lifetime stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@cached("stats.yearly_breakdown", version=aggregates.stats_version("Enrollment_Details"))
+def yearly_breakdown():
+    try:
+        return aggregates.order_year_counts()
+    except Exception as e:
+        logger.error(f"Error fetching yearly breakdown: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+APPROXIMATIONS = {
+    "programs": aggregates.approximate_program_counts,
+    "years": aggregates.approximate_year_counts,
+    "lifetime": aggregates.approximate_lifetime_counts,
+    "yearly_breakdown": aggregates.approximate_order_year_counts,
+}
+
+# Versioned by the sketches themselves, so estimates never share a key with exact results.
+@cached("stats.approximate", version=aggregates.sketch_version)
+def approximate_stats(grouping):
+    try:
+        return APPROXIMATIONS[grouping]()
+    except Exception as e:
+        logger.error(f"Error fetching approximate {grouping} stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def with_sketches(exact):
+    """ETag version of a route that serves ``exact`` or, with approx, sketch estimates"""
+    def version(query):
+        approx = dict(query).get("approx", "").lower() in ("1", "true", "on", "yes")
+        return approximate_stats.version() if approx else exact.version()
+    version.per_query = True
+    return version
+
+@app.get("/stats/programs", response_model=List[ProgramStats], response_model_exclude_none=True)
+def get_program_stats(approx: bool = False):
+    """Get player and family counts by program, estimated from sketches when approx is set"""
+    return approximate_stats("programs") if approx else program_stats()
+
+@app.get("/stats/years", response_model=List[YearStats], response_model_exclude_none=True)
+def get_year_stats(approx: bool = False):
+    """Get player and family counts by year, estimated from sketches when approx is set"""
+    return approximate_stats("years") if approx else year_stats()
+
 @app.get("/stats/divisions", response_model=List[DivisionStats])
+@cached("stats.divisions", version=aggregates.stats_version("Enrollment_Details", "AthleticPrograms", "ProgramDivisions"))
 def get_division_stats():
     """Get player counts by program and division"""
     try:
-        query = """
-        SELECT COUNT(DISTINCT dbo.Enrollment_Details.[Player Id]) AS Players,
-               dbo.AthleticPrograms.[Program Year] as ProgramYear,
-               dbo.AthleticPrograms.[Program Name] as ProgramName,
-               dbo.AthleticPrograms.[Program Season] as ProgramSeason,
-               dbo.AthleticPrograms.[Program Format] as ProgramFormat,
-               dbo.AthleticPrograms.[Program Environment] as ProgramEnvironment,
-               dbo.ProgramDivisions.[Division Name] as DivisionName,
-               dbo.ProgramDivisions.[Division Gender] as DivisionGender
-        FROM dbo.Enrollment_Details
-        INNER JOIN dbo.AthleticPrograms ON dbo.Enrollment_Details.ProgramID = dbo.AthleticPrograms.ProgramID
-        INNER JOIN dbo.ProgramDivisions ON dbo.AthleticPrograms.ProgramID = dbo.ProgramDivisions.ProgramID
-            AND dbo.Enrollment_Details.[Division Name] = dbo.ProgramDivisions.[Division Name]
-        WHERE (dbo.Enrollment_Details.[Program Sort Order] > 0)
-        GROUP BY dbo.AthleticPrograms.[Program Year],
-                 dbo.AthleticPrograms.[Program Name],
-                 dbo.AthleticPrograms.[Program Season],
-                 dbo.AthleticPrograms.[Program Format],
-                 dbo.AthleticPrograms.[Program Environment],
-                 dbo.ProgramDivisions.[Division Name],
-                 dbo.ProgramDivisions.[Division Gender]
-        ORDER BY dbo.AthleticPrograms.[Program Year] DESC,
-                 dbo.AthleticPrograms.[Program Name]
-        """
-
-        results = db.execute_query(query)
-        return results
+        return aggregates.division_counts()
     except Exception as e:
         logger.error(f"Error fetching division stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stats/lifetime")
-def get_lifetime_stats():
-    """Get lifetime statistics for players and families"""
+def get_lifetime_stats(approx: bool = False):
+    """Get lifetime statistics for players and families, estimated from sketches when approx is set"""
+    return approximate_stats("lifetime") if approx else lifetime_stats()
+
+@app.get("/stats/yearly-breakdown")
+def get_yearly_breakdown(approx: bool = False):
+    """Get player and family counts for each year with orders, estimated from sketches when approx is set"""
+    return approximate_stats("yearly_breakdown") if approx else yearly_breakdown()
+
+@app.get("/stats/player-enrollments", response_model=List[PlayerEnrollmentStats])
+@cached("stats.player_enrollments", version=aggregates.stats_version("Enrollment_Details"))
+def get_player_enrollment_stats(limit: int = 50):
+    """Get top players by total program enrollments"""
+    try:
+        return aggregates.player_enrollment_counts(limit)
+    except Exception as e:
+        logger.error(f"Error fetching player enrollment stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@cached("stats.query", version=aggregates.stats_version("Enrollment_Details", "AthleticPrograms", "ProgramDivisions"))
+def stats_query_rows(group_by, metrics, filters, subtotals, active, sort):
+    return StatsQuery(
+        group_by=group_by,
+        metrics=metrics,
+        filters=parse_filters(filters),
+        subtotals=subtotals,
+        active_only=active,
+        sort=sort,
+    ).run()
+
+@app.get("/stats/query")
+def query_stats(
+    group_by: Optional[str] = None,
+    metrics: str = "players,families",
+    filter: List[str] = Query(default=[]),
+    subtotals: str = "none",
+    active: bool = True,
+    sort: Optional[str] = None
+):
+    """Compute metrics grouped by any whitelisted dimensions in one query.
+
+    ``filter`` takes ``dimension:value`` or ``dimension:value1|value2`` and can be repeated;
+    ``subtotals=rollup`` or ``cube`` adds subtotal and grand total rows.
+    """
     try:
-        players_query = "SELECT COUNT(DISTINCT [Player Id]) as PlayersLifetime FROM dbo.Enrollment_Details"
-        families_query = "SELECT COUNT(DISTINCT [User Id]) as FamiliesLifetime FROM dbo.Enrollment_Details"
+        return stats_query_rows(group_by, metrics, tuple(filter), subtotals, active, sort)
+    except InvalidStatsQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error running stats query: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        players_result = db.execute_query(players_query)
-        families_result = db.execute_query(families_query)
+@app.get("/stats/retention")
+@cached("stats.retention", version=aggregates.stats_version("Enrollment_Details", "AthleticPrograms"))
+def get_retention_stats(by: str = "year"):
+    """Get new, returning and churned players and families per program year or season, with the retention matrix"""
+    try:
+        return retention.retention(by)
+    except retention.InvalidRetentionQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error computing retention: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {
-            "PlayersLifetime": players_result[0]["PlayersLifetime"] if players_result else 0,
-            "FamiliesLifetime": families_result[0]["FamiliesLifetime"] if families_result else 0
-        }
+@app.get("/stats/cohorts")
+@cached("stats.cohorts", version=aggregates.stats_version("Enrollment_Details", "AthleticPrograms"))
+def get_cohort_stats(by: str = "year"):
+    """Get players and families by first program year or season, with how many are active in each later one"""
+    try:
+        return retention.cohorts(by)
+    except retention.InvalidRetentionQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error fetching lifetime stats: {e}")
+        logger.error(f"Error computing cohorts: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/stats/yearly-breakdown")
-def get_yearly_breakdown():
-    """Get player and family counts for each year"""
+DASHBOARD_SECTIONS = (
+    "programs",
+    "years",
+    "divisions",
+    "lifetime",
+    "yearly_breakdown",
+    "enrollments",
+    "player_enrollments",
+)
+
+# Shared by all dashboard requests so a burst of page loads cannot open more
+# concurrent section queries than this.
+dashboard_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DASHBOARD_WORKERS", "4")),
+    thread_name_prefix="dashboard",
+)
+
+@cached("stats.dashboard_enrollments", version=table_version("Enrollment_Details"))
+def dashboard_enrollments(limit):
     try:
-        years = [2022, 2023, 2024, 2025]
-        results = {}
-
-        for year in years:
-            players_query = f"""
-            SELECT COUNT(DISTINCT [Player Id]) AS Players{year}
-            FROM dbo.Enrollment_Details
-            WHERE [Order Date] BETWEEN
-                CONVERT(DATETIME, '{year}-01-01 00:00:00', 102) AND
-                CONVERT(DATETIME, '{year}-12-31 00:00:00', 102)
-            """
-
-            families_query = f"""
-            SELECT COUNT(DISTINCT [User Id]) AS Families{year}
-            FROM dbo.Enrollment_Details
-            WHERE [Order Date] BETWEEN
-                CONVERT(DATETIME, '{year}-01-01 00:00:00', 102) AND
-                CONVERT(DATETIME, '{year}-12-31 00:00:00', 102)
-            """
-
-            players_result = db.execute_query(players_query)
-            families_result = db.execute_query(families_query)
-
-            results[str(year)] = {
-                "players": players_result[0][f"Players{year}"] if players_result else 0,
-                "families": families_result[0][f"Families{year}"] if families_result else 0
-            }
-
-        return results
+        rows, _ = enrollment_page(limit=limit)
+        return ENROLLMENT_DETAILS.records(rows)
     except Exception as e:
-        logger.error(f"Error fetching yearly breakdown: {e}")
+        logger.error(f"Error fetching enrollments: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/stats/player-enrollments", response_model=List[PlayerEnrollmentStats])
-def get_player_enrollment_stats(limit: int = 50):
-    """Get top players by total program enrollments"""
+@app.get("/stats/dashboard", response_model=DashboardStats, response_model_exclude_unset=True)
+def get_dashboard(
+    include: Optional[str] = None,
+    enrollments_limit: int = 50,
+    player_limit: int = 50
+):
+    """Get every dashboard section in one response, querying the sections concurrently"""
+    sections = [s.strip() for s in include.split(",") if s.strip()] if include else list(DASHBOARD_SECTIONS)
+    unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown dashboard sections: {', '.join(unknown)}. Valid sections: {', '.join(DASHBOARD_SECTIONS)}"
+        )
+
+    loaders = {
+        "programs": program_stats,
+        "years": year_stats,
+        "divisions": get_division_stats,
+        "lifetime": lifetime_stats,
+        "yearly_breakdown": yearly_breakdown,
+        "enrollments": lambda: dashboard_enrollments(enrollments_limit),
+        "player_enrollments": lambda: get_player_enrollment_stats(limit=player_limit),
+    }
+    # Each section runs in its own copy of the request context so its queries are timed with the request.
+    futures = {
+        section: dashboard_executor.submit(copy_context().run, loaders[section])
+        for section in dict.fromkeys(sections)
+    }
+    # Each loader already logs and converts its own failures into HTTPException.
+    return {section: future.result() for section, future in futures.items()}
+
+def dashboard_version():
+    """The dashboard changes whenever the data version of any of its sections does"""
+    sections = (
+        program_stats,
+        year_stats,
+        get_division_stats,
+        lifetime_stats,
+        yearly_breakdown,
+        dashboard_enrollments,
+        get_player_enrollment_stats,
+    )
+    return tuple(section.version() for section in sections)
+
+# Search Endpoints
+
+def search_index(lookup, q, limit):
     try:
-        query = """
-        SELECT TOP (?)
-            e.[Player Id] as PlayerId,
-            e.[Player First Name] as PlayerFirstName,
-            e.[Player Last Name] as PlayerLastName,
-            COUNT(DISTINCT e.ProgramID) as TotalEnrollments
-        FROM dbo.Enrollment_Details e
-        WHERE e.[Program Sort Order] > 0
-        GROUP BY e.[Player Id], e.[Player First Name], e.[Player Last Name]
-        ORDER BY COUNT(DISTINCT e.ProgramID) DESC, e.[Player Last Name], e.[Player First Name]
-        """
-
-        results = db.execute_query(query, (limit,))
-        return results
+        return lookup(q, limit)
+    except search.SearchUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
-        logger.error(f"Error fetching player enrollment stats: {e}")
+        logger.error(f"Error searching for {q!r}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/search/players", response_model=List[PlayerMatch])
+def search_players(q: str, limit: int = Query(default=10, ge=1, le=100)):
+    """Autocomplete players by name or player id from the in-memory index"""
+    return search_index(search.index.search_players, q, limit)
+
+@app.get("/search/families", response_model=List[FamilyMatch])
+def search_families(q: str, limit: int = Query(default=10, ge=1, le=100)):
+    """Autocomplete families by account name, e-mail or user id from the in-memory index"""
+    return search_index(search.index.search_families, q, limit)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
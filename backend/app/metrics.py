@@ -0,0 +1,279 @@
+"""Request and query instrumentation.
+
+Each request gets a ``RequestMetrics`` in a context variable. The database
+layer adds every query's connect/execute/fetch durations, rows and approximate
+bytes to it, and ``span()`` times other phases such as row remapping and
+serialization. When the request finishes the totals go into the histograms
+served by ``/metrics`` in the Prometheus text format, and into the
+``Server-Timing`` response header.
+
+Queries that run outside a request (background refreshes) are recorded under
+the ``background`` endpoint.
+
+``SLOW_QUERY_SECONDS`` enables the slow-query log: any query that takes longer
+has its SQL text and parameter count logged to the ``app.slow_queries``
+logger. Parameter values are never logged, since they can hold personal data.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0"))
+
+BACKGROUND = "background"
+QUERY_PHASES = ("connect", "execute", "fetch")
+
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (repr(bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + ('+Inf',))} {values[-1]}")
+            labels = _labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {values[-2]}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+request_duration = Histogram(
+    "lpfc_request_duration_seconds", "HTTP request duration.", ("endpoint", "method", "status")
+)
+query_duration = Histogram(
+    "lpfc_query_duration_seconds", "Time spent per database query phase.", ("endpoint", "phase")
+)
+query_rows = Histogram(
+    "lpfc_query_rows", "Rows fetched per database query.", ("endpoint",), buckets=ROW_BUCKETS
+)
+query_bytes = Counter(
+    "lpfc_query_fetched_bytes_total", "Approximate bytes of row data fetched from the database.", ("endpoint",)
+)
+span_duration = Histogram(
+    "lpfc_span_duration_seconds", "Time spent in instrumented application phases.", ("endpoint", "span")
+)
+slow_queries = Counter(
+    "lpfc_slow_queries_total", "Queries slower than SLOW_QUERY_SECONDS.", ("endpoint",)
+)
+coalesced_queries = Counter(
+    "lpfc_coalesced_queries_total", "Query executions saved by sharing an identical in-flight query.", ("endpoint",)
+)
+admission_wait = Histogram(
+    "lpfc_admission_wait_seconds", "Time database work queued for a slot.", ("priority",)
+)
+admission_rejected = Counter(
+    "lpfc_admission_rejected_total", "Database work refused a slot by admission control.", ("priority", "reason")
+)
+
+METRICS = [
+    request_duration, query_duration, query_rows, query_bytes, span_duration, slow_queries, coalesced_queries,
+    admission_wait, admission_rejected,
+]
+
+
+class RequestMetrics:
+    """Durations and row counts accumulated while serving one request."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+        self.phases = defaultdict(float)  # query phase or span name -> seconds
+        self._lock = threading.Lock()  # dashboard sections record from several threads
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases[name] += seconds
+
+    def add_query(self, durations, rows, size):
+        with self._lock:
+            self.queries += 1
+            self.rows += rows
+            self.bytes += size
+            for phase, seconds in durations.items():
+                self.phases[phase] += seconds
+
+    def server_timing(self, total):
+        with self._lock:
+            phases = dict(self.phases)
+        db_seconds = sum(phases.get(phase, 0.0) for phase in QUERY_PHASES)
+        # Dashboard sections query concurrently, so db can exceed total.
+        entries = [f'db;dur={db_seconds * 1000:.1f};desc="{self.queries} queries, {self.rows} rows"']
+        entries.extend(f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items())
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+    def observe(self, method, status):
+        """Fold this request into the aggregated histograms and return its duration."""
+        total = time.perf_counter() - self.started
+        request_duration.observe(total, self.endpoint, method, str(status))
+        with self._lock:
+            phases = dict(self.phases)
+        for name, seconds in phases.items():
+            if name not in QUERY_PHASES:
+                span_duration.observe(seconds, self.endpoint, name)
+        return total
+
+
+current_request = ContextVar("current_request", default=None)
+
+
+def current_endpoint():
+    request = current_request.get()
+    return request.endpoint if request is not None else BACKGROUND
+
+
+def approximate_row_bytes(rows, sample=20):
+    """Estimate the in-memory size of fetched rows from a sample of them."""
+    if not rows:
+        return 0
+    step = max(1, len(rows) // sample)
+    sampled = rows[::step]
+    size = sum(sum(sys.getsizeof(value) for value in row) for row in sampled)
+    return size * len(rows) // len(sampled)
+
+
+class QueryRecord:
+    """Durations of one query, reported by ``Database`` when the cursor closes."""
+
+    def __init__(self, query, params):
+        self.query = query
+        self.param_count = len(params or ())
+        self.durations = dict.fromkeys(QUERY_PHASES, 0.0)
+        self.rows = 0
+        self.bytes = 0
+
+    def fetched(self, rows, seconds):
+        self.durations["fetch"] += seconds
+        self.rows += len(rows)
+        self.bytes += approximate_row_bytes(rows)
+
+    def finish(self):
+        endpoint = current_endpoint()
+        for phase, seconds in self.durations.items():
+            query_duration.observe(seconds, endpoint, phase)
+        query_rows.observe(self.rows, endpoint)
+        query_bytes.inc(self.bytes, endpoint)
+
+        request = current_request.get()
+        if request is not None:
+            request.add_query(self.durations, self.rows, self.bytes)
+
+        total = sum(self.durations.values())
+        if SLOW_QUERY_SECONDS and total >= SLOW_QUERY_SECONDS:
+            slow_queries.inc(1, endpoint)
+            slow_query_logger.warning(
+                f"Slow query ({total:.3f}s, {self.rows} rows, endpoint {endpoint}): "
+                f"{' '.join(self.query.split())} ({self.param_count} params)"
+            )
+
+
+@contextmanager
+def span(name):
+    """Time a block of work into the current request's ``name`` phase."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request = current_request.get()
+        if request is not None:
+            request.add(name, time.perf_counter() - started)
+        else:
+            span_duration.observe(time.perf_counter() - started, BACKGROUND, name)
+
+
+def stats_series(prefix, description, stats, counters=()):
+    """Split a ``stats()`` dict into ``(gauges, counters)`` for ``render``.
+
+    Keys in ``counters`` only ever grow and become ``_total`` counters; other
+    numeric keys are gauges. Nested values are skipped.
+    """
+    gauges, totals = [], []
+    for name, value in stats.items():
+        if not isinstance(value, (int, float)):
+            continue
+        documentation = f"{description} {name.replace('_', ' ')}."
+        if name in counters:
+            totals.append((f"{prefix}_{name}_total", documentation, value))
+        else:
+            gauges.append((f"{prefix}_{name}", documentation, value))
+    return gauges, totals
+
+
+def render(gauges=(), counters=()):
+    """Prometheus text exposition of every metric plus ``(name, documentation, value)`` gauges and counters."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for kind, series in (("gauge", gauges), ("counter", counters)):
+        for name, documentation, value in series:
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
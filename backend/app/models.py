@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class AthleticProgram(BaseModel):
@@ -66,11 +66,13 @@ class ProgramStats(BaseModel):
     ProgramYear: int
     PlayerCount: int
     FamilyCount: int
+    RelativeError: Optional[float] = None
 
 class YearStats(BaseModel):
     ProgramYear: int
     UniquePlayerCount: int
     UniqueFamilyCount: int
+    RelativeError: Optional[float] = None
 
 class DivisionStats(BaseModel):
     ProgramYear: int
@@ -87,3 +89,34 @@ class PlayerEnrollmentStats(BaseModel):
     PlayerFirstName: str
     PlayerLastName: str
     TotalEnrollments: int
+
+class DashboardStats(BaseModel):
+    programs: Optional[List[ProgramStats]] = None
+    years: Optional[List[YearStats]] = None
+    divisions: Optional[List[DivisionStats]] = None
+    lifetime: Optional[Dict[str, int]] = None
+    yearly_breakdown: Optional[Dict[str, Dict[str, int]]] = None
+    enrollments: Optional[List[EnrollmentDetail]] = None
+    player_enrollments: Optional[List[PlayerEnrollmentStats]] = None
+
+class PlayerMatch(BaseModel):
+    PlayerId: int
+    PlayerFirstName: Optional[str] = None
+    PlayerLastName: Optional[str] = None
+    UserId: Optional[int] = None
+    LastOrderDate: Optional[datetime] = None
+    Score: float
+
+class FamilyPlayer(BaseModel):
+    PlayerId: int
+    PlayerFirstName: Optional[str] = None
+    PlayerLastName: Optional[str] = None
+
+class FamilyMatch(BaseModel):
+    UserId: int
+    AccountFirstName: Optional[str] = None
+    AccountLastName: Optional[str] = None
+    UserEmail: Optional[str] = None
+    LastOrderDate: Optional[datetime] = None
+    Players: List[FamilyPlayer]
+    Score: float
@@ -0,0 +1,37 @@
+"""Sort keys reproducing the ORDER BY clauses of the statistics queries.
+
+Results computed in-process (snapshot, incremental aggregates) are sorted with
+these so they come back in the same order as the SQL versions: SQL Server puts
+NULL before every value and compares strings case-insensitively.
+"""
+
+
+def text_key(value):
+    return (value is not None, (value or "").casefold())
+
+
+def number_key(value):
+    return (value is not None, value or 0)
+
+
+def number_desc_key(value):
+    # In descending order NULL sorts last.
+    return (value is None, -(value or 0))
+
+
+def program_order(row):
+    """``ORDER BY [Program Year] DESC, [Program Name]``"""
+    return (number_desc_key(row["ProgramYear"]), text_key(row["ProgramName"]))
+
+
+def year_order(row):
+    """``ORDER BY [Program Year] ASC``"""
+    return number_key(row["ProgramYear"])
+
+
+def player_ranking_order(row):
+    """``ORDER BY COUNT(DISTINCT ProgramID) DESC, [Player Last Name], [Player First Name], [Player Id]``"""
+    return (
+        -row["TotalEnrollments"], text_key(row["PlayerLastName"]), text_key(row["PlayerFirstName"]),
+        number_key(row["PlayerId"]),
+    )
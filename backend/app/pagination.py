@@ -0,0 +1,51 @@
+"""Keyset pagination over Enrollment_Details.
+
+Enrollments are ordered newest first by ``([Order Date], [Order No])``. A page
+is continued from the key of its last row rather than with OFFSET, so every
+page costs the same no matter how deep the caller has paged. Pages are fetched
+with ``TOP (?) WITH TIES`` so line items sharing the boundary key are never
+split across two pages.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+ORDER_BY = "[Order Date] DESC, [Order No] DESC"
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(order_date, order_no):
+    """Build an opaque cursor pointing just past the row with the given key."""
+    key = [order_date.isoformat() if order_date else None, order_no]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the ``(order_date, order_no)`` key encoded by ``encode_cursor``."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        order_date, order_no = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(order_date) if order_date else None, float(order_no))
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_condition(cursor):
+    """SQL predicate and parameters selecting the rows after ``cursor``.
+
+    ``ORDER BY ... DESC`` places NULL order dates last, so they follow every
+    dated row. The parameter is cast to ``datetime`` so it compares exactly
+    with the column instead of being widened to ``datetime2``.
+    """
+    order_date, order_no = decode_cursor(cursor)
+    if order_date is None:
+        return "([Order Date] IS NULL AND [Order No] < ?)", [order_no]
+    return (
+        "([Order Date] < CAST(? AS DATETIME) OR [Order Date] IS NULL "
+        "OR ([Order Date] = CAST(? AS DATETIME) AND [Order No] < ?))",
+        [order_date, order_date, order_no],
+    )
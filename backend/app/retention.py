@@ -0,0 +1,187 @@
+"""Retention and cohort analytics over program years or seasons.
+
+The (program, player) and (program, family) pairs of active enrollments from
+``aggregates.active_memberships`` are mapped to periods, either program years
+or (year, season), and folded into one membership bitmap per kind: a row per
+period with one bit per distinct id, packed eight ids to a byte. Every set
+operation the reports need then becomes one vectorized operation over it:
+
+- the popcount of ``rows[i] & rows[j]`` is the size of a pairwise period
+  intersection, which fills the retention matrix;
+- each id's first period is its cohort, so new, returning, reactivated and
+  churned counts are comparisons against it and against the previous period;
+- ``np.bincount`` of the cohorts of a period's members counts each cohort's
+  members in that period.
+
+A bitmap takes one bit per id and period.
+
+No per-year SQL, ``COUNT(DISTINCT)`` per pair of periods or self-join is run,
+and the same code serves every ``STATS_SOURCE``.
+"""
+import os
+
+import numpy as np
+
+from app import aggregates
+
+PERIODS = ("year", "season")
+
+# Seasons in the order they happen within a program year; others sort after, alphabetically.
+SEASON_ORDER = [s.strip() for s in os.getenv("SEASON_ORDER", "Winter,Spring,Summer,Fall").split(",") if s.strip()]
+
+
+class InvalidRetentionQuery(ValueError):
+    """Raised for an unknown period."""
+
+
+def season_key(season):
+    folded = (season or "").casefold()
+    order = [s.casefold() for s in SEASON_ORDER]
+    return (order.index(folded), "") if folded in order else (len(order), folded)
+
+
+def period_label(period):
+    year, season = period
+    return str(year) if season is None else f"{year} {season}"
+
+
+# Set bits of every byte value.
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+class Bitmap:
+    """Which of ``size`` ids are members in each period.
+
+    ``rows[p]`` packs the membership bits of period ``p`` (``np.packbits``
+    order) and ``cohort[i]`` is the first period of id ``i``.
+    """
+
+    def __init__(self, ids, periods, period_count):
+        _, index = np.unique(ids, return_inverse=True)
+        index = index.reshape(-1)
+        self.size = int(index.max()) + 1 if index.size else 0
+        self.rows = np.zeros((period_count, (self.size + 7) // 8), dtype=np.uint8)
+        # Each (period, id) bit; a byte may collect bits from several pairs, so OR them in.
+        np.bitwise_or.at(self.rows, (periods, index >> 3), (0x80 >> (index & 7)).astype(np.uint8))
+        self.cohort = np.full(self.size, period_count, dtype=np.int64)
+        np.minimum.at(self.cohort, index, periods)
+
+    def members(self, period):
+        """Indexes of the ids that are members in ``period``."""
+        return np.flatnonzero(np.unpackbits(self.rows[period], count=self.size))
+
+    def overlap(self, i, j):
+        return int(POPCOUNT[self.rows[i] & self.rows[j]].sum(dtype=np.int64))
+
+
+class Memberships:
+    """Membership bitmaps of players and families by period."""
+
+    def __init__(self, by="year"):
+        if by not in PERIODS:
+            raise InvalidRetentionQuery(f"by must be one of {', '.join(PERIODS)}")
+        program_ids, player_ids, user_ids, programs = aggregates.active_memberships()
+
+        # Programs without a year cannot be placed in a sequence of periods.
+        program_period = {
+            program_id: (year, season if by == "season" else None)
+            for program_id, (_, year, season) in programs.items()
+            if year is not None
+        }
+        self.periods = sorted(set(program_period.values()), key=lambda p: (p[0], season_key(p[1])))
+        position = {period: i for i, period in enumerate(self.periods)}
+
+        known = np.array(sorted(program_period), dtype=np.int64)
+        columns = np.array([position[program_period[p]] for p in known.tolist()], dtype=np.int64)
+        at = np.clip(np.searchsorted(known, program_ids), 0, max(known.size - 1, 0))
+        found = known[at] == program_ids if known.size else np.zeros(program_ids.size, dtype=bool)
+        period_of_pair = columns[at[found]]
+
+        self.players = Bitmap(player_ids[found], period_of_pair, len(self.periods))
+        self.families = Bitmap(user_ids[found], period_of_pair, len(self.periods))
+
+
+def _overlaps(bitmap):
+    """``[i, j]``: how many ids are members in both period i and period j."""
+    count = len(bitmap.rows)
+    overlaps = np.zeros((count, count), dtype=np.int64)
+    for i in range(count):
+        for j in range(i, count):
+            overlaps[i, j] = overlaps[j, i] = bitmap.overlap(i, j)
+    return overlaps
+
+
+def _rate(part, whole):
+    return round(int(part) / int(whole), 4) if whole else None
+
+
+def _flow(bitmap):
+    """Per period: active, new, returning, reactivated and churned ids, and the retention rate."""
+    overlaps = _overlaps(bitmap)
+    active = overlaps.diagonal()
+    new = np.bincount(bitmap.cohort, minlength=len(bitmap.rows))
+    rows = []
+    for j in range(len(bitmap.rows)):
+        previous = active[j - 1] if j else 0
+        returning = overlaps[j - 1, j] if j else 0
+        rows.append({
+            "Active": int(active[j]),
+            "New": int(new[j]),
+            "Returning": int(returning),
+            "Reactivated": int(active[j] - new[j] - returning),
+            "Churned": int(previous - returning),
+            "RetentionRate": _rate(returning, previous),
+        })
+    return rows, overlaps
+
+
+def retention(by="year"):
+    """Period-over-period flows and the retention matrix of players and families.
+
+    ``matrix[i][j]`` is the share of period i's members also active in period
+    j, for j after i (None otherwise).
+    """
+    memberships = Memberships(by)
+    labels = [period_label(period) for period in memberships.periods]
+    result = {"by": by, "periods": labels}
+    for kind, bitmap in (("players", memberships.players), ("families", memberships.families)):
+        flows, overlaps = _flow(bitmap)
+        active = overlaps.diagonal()
+        result[kind] = {
+            "summary": [{"Period": label, **flow} for label, flow in zip(labels, flows)],
+            "matrix": [
+                [_rate(int(overlaps[i, j]), int(active[i])) if j > i else None for j in range(len(labels))]
+                for i in range(len(labels))
+            ],
+        }
+    return result
+
+
+def cohorts(by="year"):
+    """Players and families grouped by their first period, with how many are active in each later one.
+
+    ``Active[k]`` and ``Retention[k]`` are the cohort's members active ``k``
+    periods after it started, counted and as a share of its size.
+    """
+    memberships = Memberships(by)
+    labels = [period_label(period) for period in memberships.periods]
+    result = {"by": by, "periods": labels}
+    for kind, bitmap in (("players", memberships.players), ("families", memberships.families)):
+        # counts[i, j]: members of cohort i active in period j
+        counts = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        for j in range(len(labels)):
+            counts[:, j] = np.bincount(bitmap.cohort[bitmap.members(j)], minlength=len(labels))
+        rows = []
+        for i, label in enumerate(labels):
+            size = int(counts[i, i])
+            if not size:
+                continue
+            active = [int(count) for count in counts[i, i:]]
+            rows.append({
+                "Cohort": label,
+                "Size": size,
+                "Active": active,
+                "Retention": [_rate(count, size) for count in active],
+            })
+        result[kind] = rows
+    return result
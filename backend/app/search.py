@@ -0,0 +1,386 @@
+"""In-memory name search over players and families.
+
+``SearchIndex`` pulls player and account names, e-mail addresses and ids from
+Enrollment_Details and keeps one record per player and per family (user id).
+Their normalized words go into a ``TermIndex``:
+
+- a sorted term list answers prefix matches with a binary search;
+- a trigram -> terms map finds words within a few typos of a query word;
+- a term -> record postings map resolves matching words to records.
+
+Every query word must match some word of a record. An exact match scores
+highest, then prefixes, weighted by how much of the word they cover, then
+fuzzy matches by trigram similarity. Ties go to the most recent order. Lookups
+never touch the database.
+
+Like ``app.incremental``, a background thread pulls only the enrollments at
+or after the last ``[Order Date]`` watermark every ``SEARCH_REFRESH_SECONDS``.
+It rebuilds the index from a full pull every ``SEARCH_RECONCILE_SECONDS`` so
+renamed or deleted records drop out.
+
+A loaded ``SearchState`` is never changed: each refresh builds a new one,
+sharing what did not change with the previous state, and swaps it in, so
+searches read the current state without taking a lock.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "60"))
+SEARCH_RECONCILE_SECONDS = float(os.getenv("SEARCH_RECONCILE_SECONDS", "21600"))
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", "10000"))
+
+# A word sharing a trigram with a query word is a fuzzy match when their
+# trigram sets have at least this Jaccard similarity, or when it is at most
+# one typo (two for longer words) away; trigrams alone miss transpositions in
+# short names such as "smtih".
+MIN_SIMILARITY = 0.4
+MIN_FUZZY_LENGTH = 3
+
+SEARCH_QUERY = """
+SELECT [Player Id], [Player First Name], [Player Last Name], [User Id],
+       [Account First Name], [Account Last Name], [User Email], [Order Date]
+FROM dbo.Enrollment_Details
+"""
+
+
+class SearchUnavailable(Exception):
+    """Raised while the index has not been built yet."""
+
+
+def normalize(text):
+    """Lower-case, strip accents and split into alphanumeric words."""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"[a-z0-9]+", text.casefold())
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (an adjacent swap is one edit); ``limit + 1`` once it exceeds ``limit``."""
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+class TermIndex:
+    """Words -> record keys, with prefix and trigram lookup of the words.
+
+    ``postings`` maps each word to its record keys. With ``previous``, the
+    index of a subset of those words, only the words new since then are
+    sorted and split into trigrams.
+    """
+
+    def __init__(self, postings, previous=None):
+        self.postings = postings
+        if previous is None:
+            new_terms = sorted(postings)
+            self.terms = new_terms
+            self.trigrams = {}
+            self.trigram_counts = {}
+        else:
+            new_terms = sorted(postings.keys() - previous.postings.keys())
+            # Two sorted runs: the sort merges them in linear time.
+            self.terms = sorted(previous.terms + new_terms) if new_terms else previous.terms
+            self.trigrams = dict(previous.trigrams)
+            self.trigram_counts = dict(previous.trigram_counts)
+
+        added = defaultdict(list)
+        for term in new_terms:
+            grams = trigrams(term)
+            self.trigram_counts[term] = len(grams)
+            for gram in grams:
+                added[gram].append(term)
+        for gram, terms in added.items():
+            self.trigrams[gram] = self.trigrams.get(gram, frozenset()).union(terms)
+
+    def matching_terms(self, word):
+        """``{term: score}`` for terms equal to, starting with, or close to ``word``."""
+        scores = {}
+        position = bisect.bisect_left(self.terms, word)
+        while position < len(self.terms) and self.terms[position].startswith(word):
+            term = self.terms[position]
+            scores[term] = 1.0 if term == word else 0.6 + 0.3 * len(word) / len(term)
+            position += 1
+
+        if len(word) >= MIN_FUZZY_LENGTH and not word.isdigit():
+            grams = trigrams(word)
+            shared = defaultdict(int)
+            for gram in grams:
+                for term in self.trigrams.get(gram, ()):
+                    shared[term] += 1
+            max_typos = 1 if len(word) < 8 else 2
+            for term, count in shared.items():
+                if term in scores:
+                    continue
+                similarity = count / (len(grams) + self.trigram_counts[term] - count)
+                if similarity < MIN_SIMILARITY and abs(len(term) - len(word)) <= max_typos:
+                    typos = edit_distance(word, term, max_typos)
+                    if typos <= max_typos:
+                        similarity = max(similarity, 1 - typos / max(len(word), len(term)))
+                if similarity >= MIN_SIMILARITY:
+                    scores[term] = 0.5 * similarity
+        return scores
+
+    def search(self, words):
+        """``{key: score}`` of the records matching every word."""
+        results = None
+        # The most selective word first keeps the intersections small.
+        per_word = sorted((self.matching_terms(word) for word in words), key=len)
+        for terms in per_word:
+            scores = {}
+            for term, score in terms.items():
+                for key in self.postings[term]:
+                    if results is None or key in results:
+                        if score > scores.get(key, 0.0):
+                            scores[key] = score
+            if results is None:
+                results = scores
+            else:
+                results = {key: results[key] + score for key, score in scores.items()}
+            if not results:
+                return {}
+        return results or {}
+
+
+class SearchState:
+    """Player and family records with their term indexes.
+
+    Rows are merged into a state while it is built, then ``finish()`` indexes
+    it. ``SearchState(previous)`` starts from the records and words of
+    ``previous``, copying only those the new rows change.
+    """
+
+    def __init__(self, previous=None):
+        self.players = dict(previous.players) if previous else {}  # player id -> record
+        self.families = dict(previous.families) if previous else {}  # user id -> record
+        self.player_index = self.family_index = None
+        self.watermark = previous.watermark if previous else None
+        self.rows_merged = 0
+
+        self._previous = previous
+        self._player_postings = dict(previous.player_index.postings) if previous else {}
+        self._family_postings = dict(previous.family_index.postings) if previous else {}
+        self._owned = set()  # ids of the records and postings created for this state
+
+    def merge(self, rows):
+        """Merge enrollment rows; re-merging a row changes nothing."""
+        for player_id, first, last, user_id, account_first, account_last, email, order_date in rows:
+            self.rows_merged += 1
+            if order_date is not None and (self.watermark is None or order_date > self.watermark):
+                self.watermark = order_date
+            if player_id is None:
+                continue
+            player_id = int(player_id)
+            user_id = int(user_id) if user_id is not None else None
+
+            # Names and accounts come from the player's latest enrollment; the
+            # words of earlier spellings stay searchable until the next rebuild.
+            player = self.players.get(player_id)
+            if _newer(order_date, player["LastOrderDate"] if player else None):
+                self.players[player_id] = {
+                    "PlayerId": player_id, "PlayerFirstName": first, "PlayerLastName": last,
+                    "UserId": user_id, "LastOrderDate": order_date,
+                }
+            self._add(self._player_postings, player_id, [*normalize(first), *normalize(last), str(player_id)])
+
+            if user_id is None:
+                continue
+            family = self._writable(
+                self.families, user_id,
+                lambda: {"UserId": user_id, "PlayerIds": set(), "LastOrderDate": None},
+                lambda family: {**family, "PlayerIds": set(family["PlayerIds"])},
+            )
+            family["PlayerIds"].add(player_id)
+            if _newer(order_date, family["LastOrderDate"]):
+                family.update(AccountFirstName=account_first, AccountLastName=account_last,
+                              UserEmail=email, LastOrderDate=order_date)
+            self._add(
+                self._family_postings, user_id,
+                [*normalize(account_first), *normalize(account_last), *normalize(email), str(user_id)],
+            )
+
+    def finish(self):
+        """Index the merged words; the state must not change afterwards."""
+        previous = self._previous
+        self.player_index = TermIndex(self._player_postings, previous.player_index if previous else None)
+        self.family_index = TermIndex(self._family_postings, previous.family_index if previous else None)
+        self._previous = self._player_postings = self._family_postings = self._owned = None
+        return self
+
+    def _add(self, postings, key, terms):
+        for term in terms:
+            keys = postings.get(term)
+            if keys is None or key not in keys:
+                self._writable(postings, term, set, set).add(key)
+
+    def _writable(self, mapping, key, new, copy):
+        """``mapping[key]``, created with ``new()`` or, if the previous state still shares it, replaced by ``copy(value)``."""
+        value = mapping.get(key)
+        if value is None or id(value) not in self._owned:
+            value = mapping[key] = new() if value is None else copy(value)
+            self._owned.add(id(value))
+        return value
+
+
+def _newer(order_date, last):
+    return last is None or (order_date is not None and order_date >= last)
+
+
+def _recency(record):
+    return record["LastOrderDate"].timestamp() if record["LastOrderDate"] else 0.0
+
+
+class SearchIndex:
+    def __init__(self, refresh_seconds, reconcile_seconds):
+        self.refresh_seconds = refresh_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.last_error = None
+        self.last_refresh = None
+
+        self._state = None
+        self._reconciled_at = 0.0
+        self._lock = threading.Lock()  # guards swapping in a new state; searches read it without
+        self._refresh_lock = threading.Lock()  # serializes refreshes
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self, reconcile=False):
+        """Merge new enrollments, or rebuild the index when reconciliation is due."""
+        with self._refresh_lock:
+            started = time.monotonic()
+            reconcile = reconcile or self._state is None or started - self._reconciled_at >= self.reconcile_seconds
+
+            if reconcile:
+                state = SearchState()
+                for batch in db.iter_batches(SEARCH_QUERY, batch_size=SEARCH_BATCH_SIZE):
+                    state.merge(batch)
+                state.finish()
+                with self._lock:
+                    self._state = state
+                    self._reconciled_at = started
+            else:
+                query, params = SEARCH_QUERY, None
+                if self._state.watermark is not None:
+                    query += " WHERE [Order Date] >= CAST(? AS DATETIME)"
+                    params = (self._state.watermark,)
+                state = SearchState(self._state)
+                for batch in db.iter_batches(query, params, batch_size=SEARCH_BATCH_SIZE):
+                    state.merge(batch)
+                state.finish()
+                with self._lock:
+                    self._state = state
+            rows_pulled = state.rows_merged
+
+            self.last_refresh = {
+                "reconciled": reconcile,
+                "rows_pulled": rows_pulled,
+                "seconds": round(time.monotonic() - started, 3),
+            }
+            return self.last_refresh
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="search-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self):
+        state = self._state
+        return {
+            "loaded": state is not None,
+            "players": len(state.players) if state else 0,
+            "families": len(state.families) if state else 0,
+            "player_terms": len(state.player_index.terms) if state else 0,
+            "family_terms": len(state.family_index.terms) if state else 0,
+            "watermark": state.watermark.isoformat() if state and state.watermark else None,
+            "last_refresh": self.last_refresh,
+            "last_error": self.last_error,
+        }
+
+    def search_players(self, query, limit=10):
+        state = self._loaded()
+        return [
+            {**record, "Score": round(score, 3)}
+            for record, score in self._ranked(state.player_index, state.players, query, limit)
+        ]
+
+    def search_families(self, query, limit=10):
+        state = self._loaded()
+        results = []
+        for record, score in self._ranked(state.family_index, state.families, query, limit):
+            players = [state.players[player_id] for player_id in sorted(record["PlayerIds"])]
+            results.append({
+                "UserId": record["UserId"],
+                "AccountFirstName": record["AccountFirstName"],
+                "AccountLastName": record["AccountLastName"],
+                "UserEmail": record["UserEmail"],
+                "LastOrderDate": record["LastOrderDate"],
+                "Players": [
+                    {"PlayerId": player["PlayerId"], "PlayerFirstName": player["PlayerFirstName"],
+                     "PlayerLastName": player["PlayerLastName"]}
+                    for player in players
+                ],
+                "Score": round(score, 3),
+            })
+        return results
+
+    # Internals
+
+    def _loaded(self):
+        state = self._state
+        if state is None:
+            raise SearchUnavailable("The search index is still being built")
+        return state
+
+    @staticmethod
+    def _ranked(index, records, query, limit):
+        words = normalize(query)
+        if not words:
+            return []
+        scores = index.search(words)
+        best = sorted(scores, key=lambda key: (-scores[key], -_recency(records[key]), key))[:limit]
+        return [(records[key], scores[key]) for key in best]
+
+    def _run(self):
+        wait = 0 if self._state is None else self.refresh_seconds
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Search index refresh failed: {e}")
+            wait = self.refresh_seconds
+
+
+index = SearchIndex(SEARCH_REFRESH_SECONDS, SEARCH_RECONCILE_SECONDS)
@@ -0,0 +1,279 @@
+"""Result store shared by the uvicorn workers of one host.
+
+Each entry is a file in ``SHARED_CACHE_DIR``, which defaults to a per-user
+directory in ``/dev/shm`` so it lives in memory. The file name is derived from
+the cache key. A header holds a digest of the data version the value was
+computed against and the time it was stored, and the pickled value follows.
+
+Entries are unpickled, so the directory must be private: the store refuses a
+directory that is a symlink, belongs to another user, or is accessible to
+anyone but its owner, instead of reading files others could have planted.
+
+- Readers memory-map the file and unpickle straight from the mapping, which
+  skips reading the payload into a buffer first. It does not make the value
+  zero-copy: the cached results are lists of row dicts, not flat arrays that
+  could be viewed in place with ``np.frombuffer``, so each worker unpickles
+  its own copy and keeps it in its in-process cache. The store saves
+  recomputation and database queries, not memory; readers still copy.
+- Writers write a temporary file and rename it over the entry. Readers see
+  either the old or the new entry, never a partial one, and a reader that
+  still has the old file mapped keeps it until it is done.
+- Only one worker recomputes a missing entry: ``compute`` takes an exclusive
+  ``flock`` on the key's lock file, re-reads the entry once it holds the lock,
+  and runs the function only if no other worker stored it in the meantime.
+  Others block on the lock for up to ``SHARED_CACHE_LOCK_TIMEOUT`` seconds
+  and then read the fresh entry, so the database sees one query per entry and
+  version however many workers there are.
+
+Keys include the modification time of the app's modules, so a restart with
+changed code does not read entries pickled by the old code. Entries older
+than the TTL are ignored, and the least recently written files
+are deleted once the directory grows beyond ``SHARED_CACHE_MAX_BYTES``.
+File locks need ``fcntl``; without it (Windows) the store is disabled.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+# magic, version digest, stored at (epoch seconds), payload length
+HEADER = struct.Struct("<4s16sdQ")
+MAGIC = b"LPC1"
+
+
+def _default_directory():
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, f"lpfc-cache-{os.getuid()}")
+
+
+def _check_private(directory):
+    """Raise ``PermissionError`` unless ``directory`` is a real directory only this user can access."""
+    info = os.lstat(directory)
+    if stat.S_ISLNK(info.st_mode):
+        raise PermissionError(f"{directory} is a symlink")
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{directory} is not a directory")
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"{directory} is owned by uid {info.st_uid}, not {os.getuid()}")
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        raise PermissionError(f"{directory} has mode {stat.S_IMODE(info.st_mode):o}, not 700")
+
+
+def _code_version():
+    """Changes whenever a module of the app changes, so entries written by older code are not read."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return max(entry.stat().st_mtime_ns for entry in os.scandir(directory) if entry.name.endswith(".py"))
+
+
+CODE_VERSION = _code_version()
+
+
+def _digest(value):
+    return hashlib.blake2b(repr(value).encode(), digest_size=16).digest()
+
+
+class SharedStore:
+    def __init__(self, directory, ttl=3600.0, max_bytes=32 * 1024 * 1024, lock_timeout=30.0):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "lock_waits": 0, "lock_timeouts": 0, "errors": 0}
+        self._counters_lock = threading.Lock()
+        self._written = 0  # bytes written since the directory size was last checked
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        _check_private(directory)
+
+    def get(self, key, version):
+        """Return the value stored for ``key`` at ``version``, or ``MISSING``."""
+        try:
+            with open(self._path(key), "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    magic, version_digest, stored_at, length = HEADER.unpack_from(mapped)
+                    if (magic != MAGIC or version_digest != _digest(version)
+                            or time.time() - stored_at >= self.ttl or len(mapped) < HEADER.size + length):
+                        self._count("misses")
+                        return MISSING
+                    with memoryview(mapped) as view:
+                        value = pickle.loads(view[HEADER.size:HEADER.size + length])
+        except (FileNotFoundError, ValueError):
+            # ValueError: an empty file cannot be mapped.
+            self._count("misses")
+            return MISSING
+        except Exception as e:
+            logger.warning(f"Unreadable shared cache entry for {key[0]}: {e}")
+            self._count("errors")
+            return MISSING
+        self._count("hits")
+        return value
+
+    def set(self, key, value, version):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        header = HEADER.pack(MAGIC, _digest(version), time.time(), len(payload))
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(payload)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self._count("writes")
+        self._written += len(header) + len(payload)
+        if self._written > self.max_bytes // 16:
+            self._written = 0
+            self.evict()
+
+    def compute(self, key, version, func):
+        """Return the entry for ``key`` at ``version``, running ``func`` to store it if no worker has."""
+        value = self.get(key, version)
+        if value is not MISSING:
+            return value
+
+        with open(self._path(key, ".lock"), "a+b") as lock_file:
+            locked = self._lock(lock_file)
+            try:
+                if locked:
+                    # Another worker may have stored it while this one waited.
+                    value = self.get(key, version)
+                    if value is not MISSING:
+                        return value
+                value = func()
+                try:
+                    self.set(key, value, version)
+                except (OSError, pickle.PicklingError) as e:
+                    logger.warning(f"Could not write shared cache entry for {key[0]}: {e}")
+                    self._count("errors")
+                return value
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self):
+        """Delete the least recently written entries until the directory fits ``max_bytes``,
+        and temporary files older than the TTL."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".tmp"):
+                    self._remove_abandoned(entry)
+                elif entry.name.endswith(".entry"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._remove_idle_lock(path[:-len(".entry")] + ".lock")
+            total -= size
+
+    def clear(self):
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".entry"):
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "directory": self.directory,
+            "max_bytes": self.max_bytes,
+            **counters,
+            "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def _path(self, key, suffix=".entry"):
+        return os.path.join(self.directory, _digest((CODE_VERSION, key)).hex() + suffix)
+
+    def _remove_abandoned(self, entry):
+        """Delete a temporary file left by a worker that died while writing it."""
+        try:
+            if time.time() - entry.stat().st_mtime > self.ttl:
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _remove_idle_lock(path):
+        """Delete a lock file nobody holds. A worker that opened it just before
+        may still lock the unlinked file, which at worst lets two workers
+        compute the same entry once."""
+        try:
+            with open(path, "a+b") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.unlink(path)
+        except (BlockingIOError, FileNotFoundError):
+            pass
+
+    def _lock(self, lock_file):
+        """Take the exclusive lock, waiting up to ``lock_timeout``; False if it timed out."""
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            pass
+        self._count("lock_waits")
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                continue
+        # The holder is stuck; compute without the lock rather than fail the request.
+        self._count("lock_timeouts")
+        logger.warning(f"Timed out after {self.lock_timeout:g}s waiting for a shared cache lock")
+        return False
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+
+def _create_store():
+    directory = os.getenv("SHARED_CACHE_DIR", _default_directory())
+    if not directory or fcntl is None:
+        return None
+    try:
+        return SharedStore(
+            directory,
+            ttl=float(os.getenv("CACHE_TTL", "3600")),
+            max_bytes=int(os.getenv("SHARED_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            lock_timeout=float(os.getenv("SHARED_CACHE_LOCK_TIMEOUT", "30")),
+        )
+    except OSError as e:
+        logger.warning(f"Shared result cache disabled, cannot use {directory}: {e}")
+        return None
+
+
+# None when disabled (SHARED_CACHE_DIR set to an empty string, or no fcntl).
+store = _create_store()
@@ -0,0 +1,505 @@
+"""Local columnar snapshot of the enrollment tables.
+
+``STATS_SOURCE=snapshot`` answers the /stats endpoints from a compact in-memory
+copy of Enrollment_Details, AthleticPrograms and ProgramDivisions instead of the
+serverless database. Only the columns the statistics need are pulled. Strings
+are dictionary-encoded to int32 codes and ids are stored as int64, so the
+aggregations below are NumPy sorts and bincounts.
+
+The snapshot is refreshed every ``SNAPSHOT_REFRESH_SECONDS`` by a background
+thread and persisted to ``SNAPSHOT_PATH`` so a restart can serve immediately.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from app.database import db
+from app.ordering import player_ranking_order, program_order
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "data/lpfc_snapshot.npz")
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "900"))
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "50000"))
+
+INT_NULL = np.iinfo(np.int64).min
+STR_NULL = -1
+
+# table -> (source table, [(expression, column, kind)])
+TABLES = {
+    "enrollments": ("dbo.Enrollment_Details", [
+        ("ProgramID", "ProgramID", "int"),
+        ("[Program Sort Order]", "SortOrder", "int"),
+        ("[Player Id]", "PlayerId", "id"),
+        ("[User Id]", "UserId", "id"),
+        ("YEAR([Order Date])", "OrderYear", "int"),
+        ("[Division Name]", "DivisionName", "str"),
+        ("[Player First Name]", "PlayerFirstName", "str"),
+        ("[Player Last Name]", "PlayerLastName", "str"),
+    ]),
+    "programs": ("dbo.AthleticPrograms", [
+        ("ProgramID", "ProgramID", "int"),
+        ("[Program Name]", "ProgramName", "str"),
+        ("[Program Year]", "ProgramYear", "int"),
+        ("[Program Season]", "ProgramSeason", "str"),
+        ("[Program Format]", "ProgramFormat", "str"),
+        ("[Program Environment]", "ProgramEnvironment", "str"),
+    ]),
+    "divisions": ("dbo.ProgramDivisions", [
+        ("ProgramID", "ProgramID", "int"),
+        ("[Division Name]", "DivisionName", "str"),
+        ("[Division Gender]", "DivisionGender", "str"),
+    ]),
+}
+
+
+class SnapshotUnavailable(Exception):
+    """Raised when no snapshot could be loaded or pulled."""
+
+
+class ColumnarTable:
+    """One table held as NumPy column arrays.
+
+    String columns hold int32 codes (``STR_NULL`` for NULL) into
+    ``dictionaries[column]``; nullable integers use ``INT_NULL``.
+    """
+
+    def __init__(self, columns, dictionaries):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self._collated = {}
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def decode(self, column, codes):
+        """Turn codes of a string column back into Python strings (None for NULL)."""
+        dictionary = self.dictionaries[column]
+        return [None if code == STR_NULL else str(dictionary[code]) for code in codes]
+
+    def collated(self, column):
+        """Codes of a string column, with values SQL Server's CI collation treats as equal sharing one code.
+
+        Spellings that differ only in case or trailing spaces group together
+        like they do in the database; each group keeps the code of its first
+        spelling, so ``decode`` still works.
+        """
+        codes = self._collated.get(column)
+        if codes is None:
+            first = {}
+            mapping = np.array(
+                [first.setdefault(str(value).rstrip().casefold(), code)
+                 for code, value in enumerate(self.dictionaries[column])] + [STR_NULL],
+                dtype=np.int32,
+            )
+            # Index -1 (NULL) lands on the trailing STR_NULL entry.
+            codes = self._collated[column] = mapping[self.columns[column]]
+        return codes
+
+    @classmethod
+    def from_batches(cls, spec, batches):
+        """Build a table from row-tuple batches, dictionary-encoding as it goes."""
+        names = [name for _, name, _ in spec]
+        kinds = dict((name, kind) for _, name, kind in spec)
+        chunks = {name: [] for name in names}
+        lookups = {name: {} for name in names if kinds[name] == "str"}
+
+        for batch in batches:
+            for name, values in zip(names, zip(*batch)):
+                chunks[name].append(_encode(kinds[name], values, lookups.get(name)))
+
+        columns = {}
+        for name in names:
+            dtype = np.int32 if kinds[name] == "str" else np.int64
+            columns[name] = np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype=dtype)
+        dictionaries = {name: np.array(list(lookup), dtype=str) for name, lookup in lookups.items()}
+        return cls(columns, dictionaries)
+
+
+def _encode(kind, values, lookup):
+    if kind == "id":
+        return np.fromiter(values, dtype=np.float64, count=len(values)).astype(np.int64)
+    if kind == "int":
+        return np.array([INT_NULL if v is None else v for v in values], dtype=np.int64)
+    return np.array(
+        [STR_NULL if v is None else lookup.setdefault(v, len(lookup)) for v in values],
+        dtype=np.int32,
+    )
+
+
+class Snapshot:
+    def __init__(self, tables, refreshed_at):
+        self.tables = tables
+        self.refreshed_at = refreshed_at
+
+    @property
+    def version(self):
+        return self.refreshed_at.isoformat()
+
+    @classmethod
+    def pull(cls):
+        tables = {}
+        for name, (source, spec) in TABLES.items():
+            query = "SELECT " + ", ".join(f"{expr} AS {col}" for expr, col, _ in spec) + f" FROM {source}"
+            tables[name] = ColumnarTable.from_batches(spec, db.iter_batches(query, batch_size=SNAPSHOT_BATCH_SIZE))
+        return cls(tables, datetime.utcnow())
+
+    def save(self, path):
+        arrays = {"refreshed_at": np.array(self.version)}
+        for name, table in self.tables.items():
+            for column, values in table.columns.items():
+                arrays[f"{name}/{column}"] = values
+            for column, dictionary in table.dictionaries.items():
+                arrays[f"{name}/{column}/dict"] = dictionary
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            tables = {}
+            for name, (_, spec) in TABLES.items():
+                columns, dictionaries = {}, {}
+                for _, column, kind in spec:
+                    columns[column] = data[f"{name}/{column}"]
+                    if kind == "str":
+                        dictionaries[column] = data[f"{name}/{column}/dict"]
+                tables[name] = ColumnarTable(columns, dictionaries)
+            return cls(tables, datetime.fromisoformat(str(data["refreshed_at"])))
+
+
+class SnapshotStore:
+    """Holds the current snapshot and refreshes it on a background thread."""
+
+    def __init__(self, path, refresh_seconds):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.last_error = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """Return the loaded snapshot, loading or pulling one if none is held yet."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load() or self._pull()
+                snapshot = self._snapshot
+        return snapshot
+
+    def refresh(self):
+        with self._lock:
+            self._snapshot = self._pull()
+            return self._snapshot
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self):
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "refreshed_at": snapshot.version if snapshot else None,
+            "rows": {name: len(table) for name, table in snapshot.tables.items()} if snapshot else {},
+            "refresh_seconds": self.refresh_seconds,
+            "last_error": self.last_error,
+        }
+
+    def _run(self):
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._load()
+        wait = self._seconds_until_due()
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Snapshot refresh failed: {e}")
+            wait = self.refresh_seconds
+
+    def _seconds_until_due(self):
+        if self._snapshot is None:
+            return 0
+        age = (datetime.utcnow() - self._snapshot.refreshed_at).total_seconds()
+        return max(0.0, self.refresh_seconds - age)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            snapshot = Snapshot.load(self.path)
+            logger.info(f"Loaded snapshot from {self.path} (refreshed {snapshot.version})")
+            return snapshot
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable snapshot {self.path}: {e}")
+            return None
+
+    def _pull(self):
+        try:
+            snapshot = Snapshot.pull()
+        except Exception as e:
+            raise SnapshotUnavailable(f"Could not pull snapshot: {e}") from e
+        try:
+            snapshot.save(self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist snapshot to {self.path}: {e}")
+        logger.info(f"Pulled snapshot ({', '.join(f'{n}={len(t)}' for n, t in snapshot.tables.items())})")
+        return snapshot
+
+
+store = SnapshotStore(SNAPSHOT_PATH, SNAPSHOT_REFRESH_SECONDS)
+
+
+# Kernels
+
+def group_index(*columns):
+    """Return ``(index, keys)``: a dense group number per row and the key columns per group.
+
+    Pass string columns as ``ColumnarTable.collated`` codes, so they group the
+    way the database's case-insensitive collation does.
+    """
+    if not columns[0].size:
+        return np.empty(0, dtype=np.int64), [np.empty(0, dtype=np.int64) for _ in columns]
+    stacked = np.stack([c.astype(np.int64) for c in columns], axis=1)
+    keys, index = np.unique(stacked, axis=0, return_inverse=True)
+    return index.reshape(-1), [keys[:, i] for i in range(len(columns))]
+
+
+def distinct_count(index, values, n_groups):
+    """Number of distinct ``values`` within each group of ``index``."""
+    if not index.size:
+        return np.zeros(n_groups, dtype=np.int64)
+    order = np.lexsort((values, index))
+    groups, sorted_values = index[order], values[order]
+    first = np.ones(groups.size, dtype=bool)
+    first[1:] = (groups[1:] != groups[:-1]) | (sorted_values[1:] != sorted_values[:-1])
+    return np.bincount(groups[first], minlength=n_groups)
+
+
+def lookup(keys, sorted_keys, positions=None):
+    """Positions of ``keys`` in unique ``sorted_keys`` and a mask of which were found."""
+    found_at = np.searchsorted(sorted_keys, keys)
+    found_at = np.clip(found_at, 0, max(sorted_keys.size - 1, 0))
+    found = sorted_keys.size > 0
+    mask = (sorted_keys[found_at] == keys) if found else np.zeros(keys.size, dtype=bool)
+    if positions is not None and found:
+        found_at = positions[found_at]
+    return found_at, mask
+
+
+def many_to_many(left_keys, right_keys):
+    """Inner equi-join on integer keys, returning matching ``(left_rows, right_rows)``."""
+    order = np.argsort(left_keys, kind="stable")
+    sorted_left = left_keys[order]
+    lo = np.searchsorted(sorted_left, right_keys, side="left")
+    hi = np.searchsorted(sorted_left, right_keys, side="right")
+    counts = hi - lo
+    right_rows = np.repeat(np.arange(right_keys.size), counts)
+    starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+    left_rows = order[starts + np.arange(counts.sum())]
+    return left_rows, right_rows
+
+
+def _normalized_codes(table, column, shared):
+    """Map a string column's codes into ``shared`` codes compared like SQL Server's CI collation."""
+    mapping = np.array(
+        [shared.setdefault(str(value).rstrip().casefold(), len(shared)) for value in table.dictionaries[column]]
+        + [STR_NULL],
+        dtype=np.int64,
+    )
+    # Index -1 (NULL) lands on the trailing STR_NULL entry.
+    return mapping[table[column]]
+
+
+def _int_or_none(value):
+    return None if value == INT_NULL else int(value)
+
+
+# Statistics
+
+def _active_with_program(snapshot):
+    enrollments, programs = snapshot.tables["enrollments"], snapshot.tables["programs"]
+    by_program_id = np.argsort(programs["ProgramID"], kind="stable")
+    sorted_ids = programs["ProgramID"][by_program_id]
+    program_row, found = lookup(enrollments["ProgramID"], sorted_ids, by_program_id)
+    active = (enrollments["SortOrder"] > 0) & (enrollments["SortOrder"] != INT_NULL) & found
+    return np.nonzero(active)[0], program_row[active]
+
+
+def program_counts():
+    snapshot = store.current()
+    enrollments, programs = snapshot.tables["enrollments"], snapshot.tables["programs"]
+    rows, program_rows = _active_with_program(snapshot)
+
+    index, (names, years) = group_index(programs.collated("ProgramName")[program_rows], programs["ProgramYear"][program_rows])
+    players = distinct_count(index, enrollments["PlayerId"][rows], names.size)
+    families = distinct_count(index, enrollments["UserId"][rows], names.size)
+
+    results = [
+        {"ProgramName": name, "ProgramYear": _int_or_none(year), "PlayerCount": int(p), "FamilyCount": int(f)}
+        for name, year, p, f in zip(programs.decode("ProgramName", names), years, players, families)
+    ]
+    return sorted(results, key=program_order)
+
+
+def year_counts():
+    snapshot = store.current()
+    enrollments, programs = snapshot.tables["enrollments"], snapshot.tables["programs"]
+    rows, program_rows = _active_with_program(snapshot)
+
+    index, (years,) = group_index(programs["ProgramYear"][program_rows])
+    players = distinct_count(index, enrollments["PlayerId"][rows], years.size)
+    families = distinct_count(index, enrollments["UserId"][rows], years.size)
+
+    # np.unique sorts ascending and INT_NULL first, matching ORDER BY ... ASC.
+    return [
+        {"ProgramYear": _int_or_none(year), "UniquePlayerCount": int(p), "UniqueFamilyCount": int(f)}
+        for year, p, f in zip(years, players, families)
+    ]
+
+
+def division_counts():
+    snapshot = store.current()
+    enrollments, programs, divisions = (snapshot.tables[n] for n in ("enrollments", "programs", "divisions"))
+    rows, program_rows = _active_with_program(snapshot)
+
+    shared = {}
+    enrollment_names = _normalized_codes(enrollments, "DivisionName", shared)[rows]
+    division_names = _normalized_codes(divisions, "DivisionName", shared)
+    radix = len(shared) + 1
+    left_keys = enrollments["ProgramID"][rows] * radix + enrollment_names
+    right_keys = np.where(
+        (divisions["ProgramID"] != INT_NULL) & (division_names != STR_NULL),
+        divisions["ProgramID"] * radix + division_names,
+        -1,
+    )
+    left, right = many_to_many(np.where(enrollment_names != STR_NULL, left_keys, -2), right_keys)
+
+    program_rows = program_rows[left]
+    index, keys = group_index(
+        programs["ProgramYear"][program_rows],
+        programs.collated("ProgramName")[program_rows],
+        programs.collated("ProgramSeason")[program_rows],
+        programs.collated("ProgramFormat")[program_rows],
+        programs.collated("ProgramEnvironment")[program_rows],
+        divisions.collated("DivisionName")[right],
+        divisions.collated("DivisionGender")[right],
+    )
+    players = distinct_count(index, enrollments["PlayerId"][rows[left]], keys[0].size)
+
+    results = [
+        {
+            "ProgramYear": _int_or_none(year),
+            "ProgramName": name,
+            "ProgramSeason": season,
+            "ProgramFormat": fmt,
+            "ProgramEnvironment": environment,
+            "DivisionName": division,
+            "DivisionGender": gender,
+            "Players": int(count),
+        }
+        for year, name, season, fmt, environment, division, gender, count in zip(
+            keys[0],
+            programs.decode("ProgramName", keys[1]),
+            programs.decode("ProgramSeason", keys[2]),
+            programs.decode("ProgramFormat", keys[3]),
+            programs.decode("ProgramEnvironment", keys[4]),
+            divisions.decode("DivisionName", keys[5]),
+            divisions.decode("DivisionGender", keys[6]),
+            players,
+        )
+    ]
+    return sorted(results, key=program_order)
+
+
+def lifetime_counts():
+    enrollments = store.current().tables["enrollments"]
+    return {
+        "PlayersLifetime": int(np.unique(enrollments["PlayerId"]).size),
+        "FamiliesLifetime": int(np.unique(enrollments["UserId"]).size),
+    }
+
+
+def order_year_counts():
+    enrollments = store.current().tables["enrollments"]
+    dated = enrollments["OrderYear"] != INT_NULL
+
+    index, (years,) = group_index(enrollments["OrderYear"][dated])
+    players = distinct_count(index, enrollments["PlayerId"][dated], years.size)
+    families = distinct_count(index, enrollments["UserId"][dated], years.size)
+    return {str(int(year)): {"players": int(p), "families": int(f)} for year, p, f in zip(years, players, families)}
+
+
+def active_memberships():
+    snapshot = store.current()
+    enrollments, programs = snapshot.tables["enrollments"], snapshot.tables["programs"]
+    rows, _ = _active_with_program(snapshot)
+
+    program_info = {
+        int(program_id): (name, _int_or_none(year), season)
+        for program_id, name, year, season in zip(
+            programs["ProgramID"],
+            programs.decode("ProgramName", programs["ProgramName"]),
+            programs["ProgramYear"],
+            programs.decode("ProgramSeason", programs["ProgramSeason"]),
+        )
+    }
+    return enrollments["ProgramID"][rows], enrollments["PlayerId"][rows], enrollments["UserId"][rows], program_info
+
+
+def player_enrollment_counts(limit):
+    enrollments = store.current().tables["enrollments"]
+    sort_order = enrollments["SortOrder"]
+    active = (sort_order > 0) & (sort_order != INT_NULL)
+
+    index, (player_ids, first_names, last_names) = group_index(
+        enrollments["PlayerId"][active],
+        enrollments.collated("PlayerFirstName")[active],
+        enrollments.collated("PlayerLastName")[active],
+    )
+    program_ids = enrollments["ProgramID"][active]
+    has_program = program_ids != INT_NULL
+    totals = distinct_count(index[has_program], program_ids[has_program], player_ids.size)
+    if limit <= 0 or not totals.size:
+        return []
+
+    # Only groups that can reach the top ``limit`` need their names decoded for tie-breaking.
+    threshold = np.sort(totals)[-min(limit, totals.size)]
+    candidates = np.nonzero(totals >= threshold)[0]
+    results = [
+        {"PlayerId": int(pid), "PlayerFirstName": first, "PlayerLastName": last, "TotalEnrollments": int(total)}
+        for pid, first, last, total in zip(
+            player_ids[candidates],
+            enrollments.decode("PlayerFirstName", first_names[candidates]),
+            enrollments.decode("PlayerLastName", last_names[candidates]),
+            totals[candidates],
+        )
+    ]
+    results.sort(key=player_ranking_order)
+    return results[:limit]
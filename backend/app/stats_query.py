@@ -0,0 +1,224 @@
+"""Compiler from grouped-metric requests to one SQL statement.
+
+A ``StatsQuery`` names dimensions to group by, metrics to compute and filters,
+all validated against the whitelists below, and compiles to a single
+parameterized query over Enrollment_Details, joined to AthleticPrograms and
+ProgramDivisions only when a dimension needs them. With ``subtotals`` set to
+``rollup`` or ``cube`` the statement groups by ``GROUPING SETS``, so subtotal
+and grand total rows come back from the same scan as the detail rows. Each row
+then lists the dimensions it is aggregated over in ``RolledUp``.
+
+The per-grouping helpers in ``app.aggregates`` are presets over this compiler.
+"""
+from collections import namedtuple
+from itertools import combinations
+
+from app.database import db
+
+# Programs with a non-positive sort order are internal (fees, donations, ...)
+# and are excluded from the per-program and per-year statistics.
+ACTIVE_ENROLLMENT = "e.[Program Sort Order] > 0"
+
+PROGRAM_JOIN = "INNER JOIN dbo.AthleticPrograms p ON e.ProgramID = p.ProgramID"
+DIVISION_JOIN = (
+    "INNER JOIN dbo.ProgramDivisions d ON p.ProgramID = d.ProgramID "
+    "AND e.[Division Name] = d.[Division Name]"
+)
+
+Dimension = namedtuple("Dimension", "expression alias type table")
+
+# ``table`` is the alias the expression reads (e, p or d); it decides which joins are needed.
+DIMENSIONS = {
+    "year": Dimension("p.[Program Year]", "ProgramYear", int, "p"),
+    "program": Dimension("p.[Program Name]", "ProgramName", str, "p"),
+    "program_id": Dimension("e.ProgramID", "ProgramID", int, "e"),
+    "sport": Dimension("p.[Program Sport]", "ProgramSport", str, "p"),
+    "season": Dimension("p.[Program Season]", "ProgramSeason", str, "p"),
+    "format": Dimension("p.[Program Format]", "ProgramFormat", str, "p"),
+    "environment": Dimension("p.[Program Environment]", "ProgramEnvironment", str, "p"),
+    "division": Dimension("d.[Division Name]", "DivisionName", str, "d"),
+    "division_gender": Dimension("d.[Division Gender]", "DivisionGender", str, "d"),
+    "player_gender": Dimension("e.[Player Gender]", "PlayerGender", str, "e"),
+    "order_year": Dimension("YEAR(e.[Order Date])", "OrderYear", int, "e"),
+    "payment_status": Dimension("e.[Order Payment Status]", "OrderPaymentStatus", str, "e"),
+}
+
+# metric -> (expression, default alias)
+METRICS = {
+    "players": ("COUNT(DISTINCT e.[Player Id])", "Players"),
+    "families": ("COUNT(DISTINCT e.[User Id])", "Families"),
+    "enrollments": ("COUNT_BIG(*)", "Enrollments"),
+    "revenue": ("SUM(CAST(e.[OrderItem Amount Paid] AS FLOAT))", "Revenue"),
+    "billed": ("SUM(CAST(e.[OrderItem Amount] AS FLOAT))", "Billed"),
+    "balance": ("SUM(CAST(e.[OrderItem Balance] AS FLOAT))", "Balance"),
+}
+
+SUBTOTALS = ("none", "rollup", "cube")
+MAX_DIMENSIONS = 8
+MAX_CUBE_DIMENSIONS = 4
+MAX_FILTER_VALUES = 100
+
+
+class InvalidStatsQuery(ValueError):
+    """Raised for unknown dimensions, metrics or filters."""
+
+
+def _names(value):
+    """``"a, b"`` -> ``["a", "b"]``; lists pass through."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [name.strip() for name in value if name.strip()]
+
+
+def parse_filters(values):
+    """Parse ``dimension:value[|value...]`` strings into ``{dimension: [values]}``."""
+    filters = {}
+    for item in values or ():
+        name, separator, raw = item.partition(":")
+        name = name.strip()
+        if not separator or not raw:
+            raise InvalidStatsQuery(f"Filter {item!r} must look like dimension:value or dimension:value1|value2")
+        filters.setdefault(name, []).extend(raw.split("|"))
+    return filters
+
+
+class StatsQuery:
+    def __init__(self, group_by=(), metrics=("players", "families"), filters=None, subtotals="none",
+                 active_only=True, conditions=(), sort=None, aliases=None):
+        """Validate a grouped-metrics request.
+
+        ``group_by`` and ``metrics`` are names from ``DIMENSIONS`` and
+        ``METRICS``, ``filters`` maps dimensions to accepted values and ``sort``
+        lists grouped dimensions, ``-`` prefixed for descending (default: the
+        dimensions in order). ``conditions`` are extra SQL predicates and
+        ``aliases`` renames output columns; both are for presets, not clients.
+        """
+        self.group_by = _names(group_by)
+        self.metrics = _names(metrics)
+        self.subtotals = subtotals
+        self.active_only = active_only
+        self.conditions = list(conditions)
+        self.aliases = aliases or {}
+
+        unknown = [name for name in self.group_by if name not in DIMENSIONS]
+        if unknown:
+            raise InvalidStatsQuery(f"Unknown dimensions: {', '.join(unknown)}. Valid dimensions: {', '.join(DIMENSIONS)}")
+        if len(set(self.group_by)) != len(self.group_by):
+            raise InvalidStatsQuery("Each dimension can only be grouped by once")
+        if len(self.group_by) > MAX_DIMENSIONS:
+            raise InvalidStatsQuery(f"At most {MAX_DIMENSIONS} dimensions can be grouped by")
+        if not self.metrics:
+            raise InvalidStatsQuery("At least one metric is required")
+        unknown = [name for name in self.metrics if name not in METRICS]
+        if unknown:
+            raise InvalidStatsQuery(f"Unknown metrics: {', '.join(unknown)}. Valid metrics: {', '.join(METRICS)}")
+        if len(set(self.metrics)) != len(self.metrics):
+            raise InvalidStatsQuery("Each metric can only be requested once")
+        if subtotals not in SUBTOTALS:
+            raise InvalidStatsQuery(f"subtotals must be one of {', '.join(SUBTOTALS)}")
+        if subtotals == "cube" and len(self.group_by) > MAX_CUBE_DIMENSIONS:
+            raise InvalidStatsQuery(f"subtotals=cube supports at most {MAX_CUBE_DIMENSIONS} dimensions")
+
+        self.filters = {}
+        for name, values in (filters or {}).items():
+            if name not in DIMENSIONS:
+                raise InvalidStatsQuery(f"Unknown filter dimension {name!r}. Valid dimensions: {', '.join(DIMENSIONS)}")
+            if len(values) > MAX_FILTER_VALUES:
+                raise InvalidStatsQuery(f"At most {MAX_FILTER_VALUES} values can be given for filter {name!r}")
+            try:
+                self.filters[name] = [DIMENSIONS[name].type(value) for value in values]
+            except ValueError:
+                raise InvalidStatsQuery(f"Filter {name!r} takes {DIMENSIONS[name].type.__name__} values") from None
+
+        self.sort = []
+        for item in _names(sort) or self.group_by:
+            name = item.lstrip("-")
+            if name not in self.group_by:
+                raise InvalidStatsQuery(f"Cannot sort by {name!r}, which is not grouped by")
+            self.sort.append((name, item.startswith("-")))
+
+    def alias(self, name):
+        if name in DIMENSIONS:
+            return self.aliases.get(name, DIMENSIONS[name].alias)
+        return self.aliases.get(name, METRICS[name][1])
+
+    def grouping_sets(self):
+        """Every combination of dimensions a row is produced for, detail first."""
+        if self.subtotals == "rollup":
+            return [tuple(self.group_by[:size]) for size in range(len(self.group_by), -1, -1)]
+        if self.subtotals == "cube":
+            return [
+                subset
+                for size in range(len(self.group_by), -1, -1)
+                for subset in combinations(self.group_by, size)
+            ]
+        return [tuple(self.group_by)]
+
+    def tables(self):
+        """Source tables the result depends on, for cache versioning."""
+        referenced = {DIMENSIONS[name].table for name in [*self.group_by, *self.filters]}
+        tables = ["Enrollment_Details"]
+        if referenced & {"p", "d"}:
+            tables.append("AthleticPrograms")
+        if "d" in referenced:
+            tables.append("ProgramDivisions")
+        return tables
+
+    def compile(self):
+        """Return ``(sql, params)``."""
+        expression = {name: DIMENSIONS[name].expression for name in self.group_by}
+        grouping_sets = self.grouping_sets()
+        rolled_up = len(grouping_sets) > 1
+
+        select = [f"{expression[name]} AS [{self.alias(name)}]" for name in self.group_by]
+        select.extend(f"{METRICS[name][0]} AS [{self.alias(name)}]" for name in self.metrics)
+        if rolled_up:
+            # Tells subtotal NULLs apart from NULL values in the data.
+            select.extend(f"GROUPING({expression[name]}) AS [Grouping_{name}]" for name in self.group_by)
+
+        query = f"SELECT {', '.join(select)} FROM dbo.Enrollment_Details e"
+        tables = self.tables()
+        if "AthleticPrograms" in tables:
+            query += f" {PROGRAM_JOIN}"
+        if "ProgramDivisions" in tables:
+            query += f" {DIVISION_JOIN}"
+
+        where = list(self.conditions)
+        params = []
+        if self.active_only:
+            where.append(ACTIVE_ENROLLMENT)
+        for name, values in self.filters.items():
+            where.append(f"{DIMENSIONS[name].expression} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        if where:
+            query += " WHERE " + " AND ".join(f"({condition})" for condition in where)
+
+        if rolled_up:
+            sets = ", ".join("(" + ", ".join(expression[name] for name in names) + ")" for names in grouping_sets)
+            query += f" GROUP BY GROUPING SETS ({sets})"
+        elif self.group_by:
+            query += " GROUP BY " + ", ".join(expression[name] for name in self.group_by)
+
+        if self.sort:
+            order = []
+            for name, descending in self.sort:
+                if rolled_up:
+                    # Each subtotal follows the rows it summarizes.
+                    order.append(f"GROUPING({expression[name]})")
+                order.append(f"{expression[name]}{' DESC' if descending else ''}")
+            if rolled_up:
+                sorted_names = {name for name, _ in self.sort}
+                order.extend(f"GROUPING({expression[name]})" for name in self.group_by if name not in sorted_names)
+            query += " ORDER BY " + ", ".join(order)
+        return query, params
+
+    def run(self):
+        """Execute the query; rolled-up rows list their aggregated dimensions in ``RolledUp``."""
+        query, params = self.compile()
+        rows = db.execute_query(query, tuple(params))
+        if len(self.grouping_sets()) > 1:
+            for row in rows:
+                row["RolledUp"] = [name for name in self.group_by if row.pop(f"Grouping_{name}")]
+        return rows
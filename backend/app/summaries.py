@@ -0,0 +1,342 @@
+"""Summary tables that answer the /stats groupings without scanning Enrollment_Details.
+
+Enrollment_Details is a heap without indexes, so every live grouping scans it
+and hash-aggregates ``COUNT(DISTINCT)``. Indexed views cannot contain
+``COUNT(DISTINCT)``, so ``store.provision()`` creates instead:
+
+- one ``dbo.Summary_<Name>`` table per grouping registered by
+  ``app.aggregates``, filled by ``INSERT ... SELECT`` from the same query the
+  endpoint runs live;
+- ``dbo.Summary_State``, which records the data version (the fingerprint of
+  ``app.cache.version_probe``) each summary was built from;
+- covering indexes on Enrollment_Details for the program groupings and for
+  the ``[Order Date]`` lookups of the version probe and the incremental loads.
+
+``store.select(name)`` returns a query over a summary only while its recorded
+version matches the current version of its source tables, so a summary is
+never served stale: after an enrollment load the endpoints fall back to the
+live queries until the maintainer thread, every ``SUMMARY_REFRESH_SECONDS``,
+has rebuilt the summaries whose sources changed, each in one transaction.
+With the shared result store, one worker per host rebuilds and the others
+wait for it. Nothing is created until someone provisions:
+
+    python -m app.summaries provision|refresh|status|drop
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import pyodbc
+
+from app import shared_cache
+from app.cache import version_probe
+from app.database import db
+from app.stats_query import DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_REFRESH_SECONDS = float(os.getenv("SUMMARY_REFRESH_SECONDS", "60"))
+# How long the contents of Summary_State are trusted before being re-read.
+SUMMARY_CHECK_SECONDS = float(os.getenv("SUMMARY_CHECK_SECONDS", "30"))
+
+STATE_TABLE = "dbo.Summary_State"
+
+# name -> (table, key and included columns)
+INDEXES = {
+    "IX_Enrollment_Details_Program": (
+        "dbo.Enrollment_Details",
+        "(ProgramID, [Program Sort Order]) INCLUDE ([Player Id], [User Id], [Division Name])",
+    ),
+    "IX_Enrollment_Details_OrderDate": (
+        "dbo.Enrollment_Details",
+        "([Order Date]) INCLUDE ([Player Id], [User Id])",
+    ),
+}
+
+SQL_TYPES = {int: "int", str: "nvarchar(255)"}
+COUNT_METRICS = {"players", "families", "enrollments"}
+
+
+class NotProvisioned(Exception):
+    """Raised when refreshing before ``provision()`` has created the tables."""
+
+
+def _missing_table(error):
+    """Whether ``error`` is SQL Server's "Invalid object name" (SQLSTATE 42S02)."""
+    return isinstance(error, pyodbc.ProgrammingError) and bool(error.args) and error.args[0] == "42S02"
+
+
+class Summary:
+    def __init__(self, name, columns, select, tables, order_by=(), indexed=False):
+        """``columns`` lists ``(name, SQL type)`` in the order ``select`` returns them;
+        ``order_by`` is the order the live query returns its rows in. ``indexed``
+        adds a covering index in that order, for summaries read a page at a time."""
+        self.name = name
+        self.table = f"dbo.Summary_{name}"
+        self.columns = list(columns)
+        self.select = select
+        self.tables = tuple(tables)
+        self.order_by = list(order_by)
+        self.indexed = indexed
+
+    @classmethod
+    def from_stats_query(cls, name, query):
+        """The summary of a preset ``StatsQuery`` without filters or subtotals."""
+        sql, params = query.compile()
+        if params or len(query.grouping_sets()) > 1:
+            raise ValueError(f"Summary {name} needs a query without filters or subtotals")
+        columns = [(query.alias(dimension), SQL_TYPES[DIMENSIONS[dimension].type]) for dimension in query.group_by]
+        columns += [(query.alias(metric), "int" if metric in COUNT_METRICS else "float") for metric in query.metrics]
+        order_by = [f"[{query.alias(dimension)}]{' DESC' if descending else ''}" for dimension, descending in query.sort]
+        return cls(name, columns, sql, query.tables(), order_by)
+
+    def create_sql(self):
+        return f"CREATE TABLE {self.table} ({', '.join(f'[{column}] {kind} NULL' for column, kind in self.columns)})"
+
+    def index_sql(self):
+        keys = ", ".join(self.order_by)
+        ordered = {key.rsplit(" DESC", 1)[0] for key in self.order_by}
+        included = ", ".join(f"[{column}]" for column, _ in self.columns if f"[{column}]" not in ordered)
+        return f"CREATE INDEX IX_Summary_{self.name} ON {self.table} ({keys})" + (f" INCLUDE ({included})" if included else "")
+
+    def populate_sql(self):
+        return f"INSERT INTO {self.table} ({self._column_list()}) {self.select}"
+
+    def read_sql(self, top=False):
+        """Read the summary in the live query's order; with ``top``, the first ``?`` rows."""
+        query = f"SELECT {'TOP (?) ' if top else ''}{self._column_list()} FROM {self.table}"
+        if self.order_by:
+            query += " ORDER BY " + ", ".join(self.order_by)
+        return query
+
+    def _column_list(self):
+        return ", ".join(f"[{column}]" for column, _ in self.columns)
+
+
+SUMMARIES = {}
+
+
+def register(summary):
+    SUMMARIES[summary.name] = summary
+    return summary
+
+
+def _source_version(versions, summary):
+    return repr(tuple(versions[table] for table in summary.tables))
+
+
+class SummaryStore:
+    def __init__(self, refresh_seconds, check_seconds):
+        self.refresh_seconds = refresh_seconds
+        self.check_seconds = check_seconds
+        self.last_error = None
+        self.last_refresh = None
+
+        self._state = None  # {name: source version or None}, None when not provisioned
+        self._read_at = None
+        self._lock = threading.Lock()  # guards the cached state
+        self._refresh_lock = threading.Lock()  # serializes refreshes in this worker
+        self._stop = threading.Event()
+        self._thread = None
+
+    def select(self, name, top=False):
+        """SQL reading summary ``name`` (see ``Summary.read_sql``), or None if it is missing or
+        older than its source tables."""
+        state = self._current_state()
+        built = state.get(name) if state else None
+        if built is None:
+            return None
+        summary = SUMMARIES[name]
+        if built != _source_version(version_probe.current(), summary):
+            return None
+        return summary.read_sql(top)
+
+    def provision(self):
+        """(Re)create the summary tables and indexes, then fill them."""
+        statements = self._drop_statements()
+        statements += [(summary.create_sql(), None) for summary in SUMMARIES.values()]
+        statements += [(summary.index_sql(), None) for summary in SUMMARIES.values() if summary.indexed]
+        statements.append((
+            f"CREATE TABLE {STATE_TABLE} (Name nvarchar(100) NOT NULL PRIMARY KEY, "
+            "SourceVersion nvarchar(1000) NULL, RefreshedAt datetime NULL, SummaryRows int NULL)",
+            None,
+        ))
+        statements += [(f"INSERT INTO {STATE_TABLE} (Name) VALUES (?)", (name,)) for name in SUMMARIES]
+        statements += [
+            (f"CREATE INDEX {index} ON {table} {columns}", None) for index, (table, columns) in INDEXES.items()
+        ]
+        db.execute_statements(statements)
+        logger.info(f"Provisioned {len(SUMMARIES)} summary tables and {len(INDEXES)} indexes")
+        self._forget_state()
+        return self.refresh(force=True)
+
+    def drop(self):
+        """Remove the summary tables and indexes; the endpoints go back to live queries."""
+        db.execute_statements(self._drop_statements())
+        self._forget_state()
+
+    def refresh(self, force=False):
+        """Rebuild the summaries whose source tables changed since they were built, or all with ``force``."""
+        with self._refresh_lock:
+            started = time.monotonic()
+            state = self._read_state()
+            if state is None:
+                raise NotProvisioned("Summary tables have not been provisioned")
+            # A probe up to ``interval`` old may label a summary with an older
+            # version than its rows; that only causes one extra rebuild.
+            versions = version_probe.current()
+            stale = [
+                name for name, built in state.items()
+                if name in SUMMARIES and (force or built != _source_version(versions, SUMMARIES[name]))
+            ]
+            rebuilt = []
+
+            def rebuild():
+                rebuilt.extend(self._rebuild(stale, versions))
+                return True
+
+            if stale and (shared_cache.store is None or force):
+                rebuild()
+            elif stale:
+                # One worker per host rebuilds for a data version; the others wait for it and skip.
+                shared_cache.store.compute(("summary_refresh",), repr(versions), rebuild)
+            self._forget_state()
+            self.last_refresh = {
+                "rebuilt": rebuilt,
+                "seconds": round(time.monotonic() - started, 3),
+                "at": datetime.now().isoformat(timespec="seconds"),
+            }
+            return self.last_refresh
+
+    def status(self):
+        try:
+            rows = db.fetch_rows(f"SELECT Name, SourceVersion, RefreshedAt, SummaryRows FROM {STATE_TABLE}")
+        except pyodbc.ProgrammingError as e:
+            if not _missing_table(e):
+                raise
+            rows = None
+        summaries = {}
+        if rows is not None:
+            versions = version_probe.current()
+            for name, built, refreshed_at, row_count in rows:
+                summary = SUMMARIES.get(name)
+                summaries[name] = {
+                    "current": summary is not None and built == _source_version(versions, summary),
+                    "refreshed_at": refreshed_at.isoformat() if refreshed_at else None,
+                    "rows": row_count,
+                }
+        return {
+            "provisioned": rows is not None,
+            "summaries": summaries,
+            "last_refresh": self.last_refresh,
+            "last_error": self.last_error,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="summary-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # Internals
+
+    def _rebuild(self, names, versions):
+        rebuilt = []
+        for name in names:
+            summary = SUMMARIES[name]
+            version = _source_version(versions, summary)
+            db.execute_statements([
+                (f"DELETE FROM {summary.table}", None),
+                (summary.populate_sql(), None),
+                (
+                    f"UPDATE {STATE_TABLE} SET SourceVersion = ?, RefreshedAt = ?, "
+                    f"SummaryRows = (SELECT COUNT_BIG(*) FROM {summary.table}) WHERE Name = ?",
+                    (version, datetime.now(), name),
+                ),
+            ])
+            rebuilt.append(name)
+        if rebuilt:
+            logger.info(f"Rebuilt summaries: {', '.join(rebuilt)}")
+        return rebuilt
+
+    def _drop_statements(self):
+        statements = [(f"DROP TABLE IF EXISTS {summary.table}", None) for summary in SUMMARIES.values()]
+        statements.append((f"DROP TABLE IF EXISTS {STATE_TABLE}", None))
+        statements += [(f"DROP INDEX IF EXISTS {index} ON {table}", None) for index, (table, _) in INDEXES.items()]
+        return statements
+
+    def _read_state(self):
+        """``{name: source version}`` from Summary_State, or None if it does not exist."""
+        try:
+            rows = db.fetch_rows(f"SELECT Name, SourceVersion FROM {STATE_TABLE}")
+        except Exception as e:
+            if _missing_table(e):
+                return None
+            logger.error(f"Could not read {STATE_TABLE}: {e}")
+            raise
+        return {name: built for name, built in rows}
+
+    def _current_state(self):
+        with self._lock:
+            if self._read_at is None or time.monotonic() - self._read_at >= self.check_seconds:
+                try:
+                    self._state = self._read_state()
+                except Exception:
+                    # A transient failure says nothing about the summaries; keep
+                    # the last known state and try again after check_seconds.
+                    pass
+                self._read_at = time.monotonic()
+            return self._state
+
+    def _forget_state(self):
+        with self._lock:
+            self._read_at = None
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                if self._current_state() is not None:
+                    self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Summary refresh failed: {e}")
+
+
+store = SummaryStore(SUMMARY_REFRESH_SECONDS, SUMMARY_CHECK_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the summary tables behind the /stats endpoints")
+    parser.add_argument("command", choices=["provision", "refresh", "status", "drop"])
+    parser.add_argument("--force", action="store_true", help="With refresh: rebuild every summary")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Registers the summaries.
+    from app import aggregates  # noqa: F401
+
+    if args.command == "provision":
+        result = store.provision()
+    elif args.command == "refresh":
+        result = store.refresh(force=args.force)
+    elif args.command == "drop":
+        store.drop()
+        result = {"dropped": list(SUMMARIES)}
+    else:
+        result = store.status()
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""Reproducible performance benchmarks for the API.
+
+``bench.synthetic`` generates the three tables at a configurable scale into a
+SQLite file, ``bench.localdb`` swaps that file in for the Azure SQL database
+behind ``app.database.db``, and ``bench.run`` load-tests every endpoint and
+saves the results so runs from different versions can be compared.
+"""
@@ -0,0 +1,159 @@
+"""A SQLite stand-in for the Azure SQL database behind ``app.database.db``.
+
+``install(path)`` replaces the connection pool of the shared ``Database`` with
+one that opens the file written by ``bench.synthetic``. Everything above the
+pool (``cursor``, ``execute_query``, ``fetch_rows``, ``iter_batches``, the
+result cache, the snapshot and incremental loaders) runs unchanged. The
+cursors rewrite the few T-SQL constructs the app uses into SQLite:
+
+- ``SELECT TOP (?) [WITH TIES] ...`` becomes ``... LIMIT ?``; ties at the
+  page boundary are not returned.
+- ``CAST(? AS DATETIME)`` becomes a plain parameter.
+- ``COUNT_BIG`` becomes ``COUNT``, and ``CHECKSUM_AGG(BINARY_CHECKSUM(*))``
+  becomes a sum of rowids, which is enough to version a table that is not
+  edited during a run.
+- ``YEAR()`` is registered as a function.
+- A missing table raises ``pyodbc.ProgrammingError`` with SQLSTATE
+  ``42S02``, like SQL Server's "Invalid object name".
+- For the DDL of ``app.summaries``: ``nvarchar(n)`` columns become ``TEXT
+  COLLATE NOCASE``, ``CREATE INDEX`` and ``DROP INDEX`` name the index in the
+  ``dbo`` schema instead of the table, and ``INCLUDE`` columns become trailing
+  key columns, since SQLite has no included columns.
+
+Connections run in autocommit mode like the pyodbc ones, so ``BEGIN
+TRANSACTION`` / ``COMMIT TRANSACTION`` statements delimit transactions.
+``capture()`` records the statements executed and ``explain`` returns SQLite's
+plan for one, for ``bench.plans``.
+
+Text columns use ``COLLATE NOCASE``, close to the CI_AS collation, but
+trailing spaces are significant.
+"""
+import re
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+import pyodbc
+
+from app.database import ConnectionPool, db
+
+TOP = re.compile(r"^\s*SELECT\s+TOP\s*\(\?\)(?:\s+WITH\s+TIES)?", re.IGNORECASE)
+REWRITES = [
+    (re.compile(r"CAST\(\?\s+AS\s+DATETIME\)", re.IGNORECASE), "?"),
+    (re.compile(r"\bCOUNT_BIG\(", re.IGNORECASE), "COUNT("),
+    (re.compile(r"CHECKSUM_AGG\(BINARY_CHECKSUM\(\*\)\)", re.IGNORECASE), "TOTAL(rowid)"),
+    (re.compile(r"\bnvarchar\((?:\d+|max)\)", re.IGNORECASE), "TEXT COLLATE NOCASE"),
+    (re.compile(r"\bCREATE\s+INDEX\s+(\w+)\s+ON\s+dbo\.(\w+)", re.IGNORECASE), r"CREATE INDEX dbo.\1 ON \2"),
+    (re.compile(r"\bDROP\s+INDEX\s+IF\s+EXISTS\s+(\w+)\s+ON\s+dbo\.\w+", re.IGNORECASE), r"DROP INDEX IF EXISTS dbo.\1"),
+    (re.compile(r"\)\s*INCLUDE\s*\(", re.IGNORECASE), ", "),
+]
+
+# Set by ``capture()`` to a list that collects ``(query, params)`` as executed by the app.
+captured = ContextVar("captured", default=None)
+
+
+def translate(query, params=None):
+    """Rewrite a T-SQL query and its parameters for SQLite."""
+    params = list(params or ())
+    for pattern, replacement in REWRITES:
+        query = pattern.sub(replacement, query)
+    if TOP.match(query):
+        # The TOP parameter is always the first one; LIMIT takes it last.
+        query = TOP.sub("SELECT", query, count=1).rstrip().rstrip(";") + " LIMIT ?"
+        params.append(params.pop(0))
+    return query, params
+
+
+def _year(value):
+    if value is None:
+        return None
+    return int(str(value)[:4])
+
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATETIME", _to_datetime)
+
+
+class LocalCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, params=None):
+        statements = captured.get()
+        if statements is not None:
+            statements.append((query, tuple(params or ())))
+        try:
+            self._cursor.execute(*translate(query, params))
+        except sqlite3.OperationalError as e:
+            # Raise a missing table the way pyodbc reports SQL Server's "Invalid object name".
+            if str(e).startswith("no such table"):
+                raise pyodbc.ProgrammingError("42S02", f"[42S02] {e}") from e
+            raise
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+
+class LocalConnection:
+    def __init__(self, path):
+        # The synthetic tables live in the main schema of ``path``; attaching
+        # it as ``dbo`` resolves the app's schema-qualified names.
+        self._conn = sqlite3.connect(
+            ":memory:", detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("ATTACH DATABASE ? AS dbo", (path,))
+        self._conn.create_function("YEAR", 1, _year, deterministic=True)
+
+    def cursor(self):
+        return LocalCursor(self._conn.cursor())
+
+    def explain(self, query, params=None):
+        """SQLite's plan for a T-SQL query, one line per step, indented by depth."""
+        query, params = translate(query, params)
+        rows = self._conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node] + detail)
+        return lines
+
+    def close(self):
+        self._conn.close()
+
+
+@contextmanager
+def capture():
+    """Collect the statements executed in this context: ``with capture() as statements: ...``."""
+    statements = []
+    token = captured.set(statements)
+    try:
+        yield statements
+    finally:
+        captured.reset(token)
+
+
+def install(path, max_size=10):
+    """Point ``app.database.db`` at the SQLite file ``path``."""
+    db.pool.close()
+    db.pool = ConnectionPool(lambda: LocalConnection(path), min_size=1, max_size=max_size)
+    return db
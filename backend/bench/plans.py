@@ -0,0 +1,131 @@
+"""Query plans and timings of the /stats groupings with and without summary tables.
+
+Runs every grouping of ``app.aggregates`` against the SQLite stand-in twice:
+first with the summary tables and indexes of ``app.summaries`` dropped, then
+after provisioning them. For each grouping it records the statements the app
+executed, their plans from ``EXPLAIN QUERY PLAN`` and the median time of
+``--runs`` calls. The comparison is printed and saved as JSON under
+``bench/results``.
+
+    python -m bench.plans --enrollments 100000 --runs 9
+
+The summaries are dropped again at the end unless ``--keep`` is given, so
+``bench.run`` measures the plain heap by default.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from datetime import datetime
+
+from bench.run import RESULTS_DIR, git_revision
+
+logger = logging.getLogger(__name__)
+
+
+def cases(aggregates):
+    """Grouping name -> function computing it the way the endpoints do."""
+    return {
+        "program_counts": aggregates.program_counts,
+        "year_counts": aggregates.year_counts,
+        "division_counts": aggregates.division_counts,
+        "lifetime_counts": aggregates.lifetime_counts,
+        "order_year_counts": aggregates.order_year_counts,
+        "player_enrollment_counts": lambda: aggregates.player_enrollment_counts(100),
+        "active_memberships": aggregates.active_memberships,
+    }
+
+
+def measure(db, localdb, func, runs):
+    """Median milliseconds of ``func`` and the plans of the statements it executed."""
+    # Warm-up: connections, the data-version probe and the summary state.
+    func()
+    timings = []
+    for _ in range(runs):
+        with localdb.capture() as statements:
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+    plans = []
+    with db.get_connection() as conn:
+        for query, params in statements:
+            plans.append({"query": " ".join(query.split()), "plan": conn.explain(query, params)})
+    return {"median_ms": round(statistics.median(timings), 3), "min_ms": round(min(timings), 3), "statements": plans}
+
+
+def measure_all(db, localdb, aggregates, runs):
+    return {name: measure(db, localdb, func, runs) for name, func in cases(aggregates).items()}
+
+
+def print_report(before, after):
+    print(f"\n{'grouping':<26} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name in before:
+        speedup = before[name]["median_ms"] / after[name]["median_ms"] if after[name]["median_ms"] else float("inf")
+        print(f"{name:<26} {before[name]['median_ms']:>10.2f} {after[name]['median_ms']:>10.2f} {speedup:>7.1f}x")
+    for name in before:
+        print(f"\n== {name}")
+        for label, result in (("before", before[name]), ("after", after[name])):
+            for statement in result["statements"]:
+                print(f"  [{label}] {statement['query'][:110]}")
+                for line in statement["plan"]:
+                    print(f"      {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare /stats query plans and timings with and without summaries")
+    parser.add_argument("--db", help="SQLite file to use; generated if missing (default data/bench-<N>.db)")
+    parser.add_argument("--enrollments", type=int, default=100000, help="Scale of a generated database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=5, help="Timed calls per grouping")
+    parser.add_argument("--keep", action="store_true", help="Leave the summary tables and indexes in place")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for the result file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Each call should reach the database; the groupings themselves are not cached.
+    os.environ["SHARED_CACHE_DIR"] = ""
+
+    from bench import localdb, synthetic
+
+    path = args.db or os.path.join("data", f"bench-{args.enrollments}.db")
+    if not os.path.exists(path):
+        synthetic.generate(path, args.enrollments, args.seed)
+    db = localdb.install(path)
+
+    from app import aggregates, summaries
+
+    summaries.store.drop()
+    before = measure_all(db, localdb, aggregates, args.runs)
+
+    started = time.perf_counter()
+    summaries.store.provision()
+    provision_seconds = time.perf_counter() - started
+    after = measure_all(db, localdb, aggregates, args.runs)
+    if not args.keep:
+        summaries.store.drop()
+
+    print_report(before, after)
+    print(f"\nProvisioning took {provision_seconds:.2f}s")
+
+    rows = db.fetch_rows("SELECT COUNT(*) FROM dbo.Enrollment_Details")[0][0]
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "database": path,
+        "enrollments": rows,
+        "runs": args.runs,
+        "provision_seconds": round(provision_seconds, 3),
+        "before": before,
+        "after": after,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    output = os.path.join(args.output, f"plans-{datetime.now():%Y%m%d-%H%M%S}-{report['revision'] or 'unknown'}-{rows}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
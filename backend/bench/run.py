@@ -0,0 +1,268 @@
+"""Load-test every GET endpoint of the API against a synthetic database.
+
+Each endpoint gets one warm-up request, one request under ``tracemalloc`` for
+its peak allocation, then ``--requests`` requests from ``--concurrency``
+concurrent clients. Latency percentiles, throughput, peak memory and response
+size are printed and saved as JSON under ``bench/results``; pass an earlier
+result file to ``--compare`` to see the change per endpoint.
+
+    python -m bench.run --enrollments 100000 --requests 200 --concurrency 8
+    python -m bench.run --env STATS_SOURCE=snapshot --compare bench/results/<earlier>.json
+
+Settings the app reads at import (``STATS_SOURCE``, ``CACHE_*``, ...) are
+given with ``--env``; ``--no-cache`` disables the result cache so every
+request reaches the database.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SKIPPED_PATHS = {
+    "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json",
+    # Need a job started with POST /exports/enrollments/jobs.
+    "/exports/jobs/{job_id}", "/exports/jobs/{job_id}/download",
+    # Need a search text; see EXTRA_REQUESTS.
+    "/search/players", "/search/families",
+}
+
+# Requests beyond the bare path of each GET route.
+EXTRA_REQUESTS = [
+    "/stats/programs?approx=true",
+    "/stats/years?approx=true",
+    "/stats/lifetime?approx=true",
+    "/stats/yearly-breakdown?approx=true",
+    "/enrollments?limit=1000",
+    "/enrollments?year={program_year}",
+    "/exports/enrollments?format=parquet",
+    "/stats/query?group_by=year,environment,player_gender&metrics=players,families,revenue",
+    "/stats/retention?by=season",
+    "/stats/cohorts?by=season",
+    "/search/players?q=jo",
+    "/search/families?q=nguyen",
+]
+# Regressions larger than this fraction are flagged by --compare.
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def endpoint_paths(app, samples):
+    """Every GET route with its path parameters filled in, plus ``EXTRA_REQUESTS``."""
+    paths = []
+    for route in app.routes:
+        if "GET" not in getattr(route, "methods", ()) or route.path in SKIPPED_PATHS:
+            continue
+        paths.append(route.path.format(**samples))
+    paths.extend(path.format(**samples) for path in EXTRA_REQUESTS)
+    return paths
+
+
+def sample_values(db):
+    row = db.fetch_rows(
+        "SELECT TOP (?) ProgramID, [Program Year] FROM dbo.AthleticPrograms "
+        "WHERE [Program Year] IS NOT NULL ORDER BY ProgramID", (1,)
+    )
+    program_id, program_year = row[0] if row else (1, 2024)
+    return {"program_id": program_id, "program_year": program_year}
+
+
+async def measure(client, path, requests, concurrency):
+    response = await client.get(path)  # warm-up: connections, caches, lazy loads
+    result = {"status": response.status_code, "bytes": len(response.content)}
+    if response.status_code >= 400:
+        result["error"] = response.text[:200]
+        return result
+
+    tracemalloc.start()
+    try:
+        await client.get(path)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result.update({
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        **{
+            f"{name}_ms": round(percentile(latencies, fraction) * 1000, 3)
+            for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+        },
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+    return result
+
+
+async def run_endpoints(app, paths, requests, concurrency):
+    import httpx
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for path in paths:
+            logger.info(f"Benchmarking {path}")
+            results[path] = await measure(client, path, requests, concurrency)
+    return results
+
+
+def print_results(results):
+    header = f"{'endpoint':<42} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'peak KiB':>9} {'KiB':>8}"
+    print(header)
+    print("-" * len(header))
+    for path, result in results.items():
+        if "requests" not in result:
+            print(f"{path:<42} {result['status']:>6}  {result.get('error', '')}")
+            continue
+        print(
+            f"{path:<42} {result['status']:>6} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+            f"{result['p99_ms']:>9.2f} {result['throughput_rps']:>9.1f} "
+            f"{result['peak_memory_bytes'] / 1024:>9.0f} {result['bytes'] / 1024:>8.1f}"
+        )
+
+
+def compare(results, baseline_path):
+    """Print the change of each endpoint against an earlier result file and return the regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(
+        f"\nCompared with {baseline_path} (revision {baseline.get('revision')}, "
+        f"label {baseline.get('label')!r}, env {baseline.get('env')}):"
+    )
+
+    regressions = []
+    for path, result in results.items():
+        before = baseline["endpoints"].get(path)
+        if not before or "requests" not in before or "requests" not in result:
+            continue
+        changes = {
+            "p50_ms": result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0,
+            "p95_ms": result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0,
+            "throughput_rps": 1 - result["throughput_rps"] / before["throughput_rps"] if before["throughput_rps"] else 0.0,
+        }
+        worse = [name for name, change in changes.items() if change > REGRESSION_THRESHOLD]
+        if worse:
+            regressions.append(path)
+        print(
+            f"{path:<42} p50 {changes['p50_ms']:+7.1%}  p95 {changes['p95_ms']:+7.1%}  "
+            f"req/s {-changes['throughput_rps']:+7.1%}{'  REGRESSION' if worse else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against a synthetic local database")
+    parser.add_argument("--db", help="SQLite file to use; generated if missing (default data/bench-<N>.db)")
+    parser.add_argument("--enrollments", type=int, default=100000, help="Scale of a generated database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate the database even if it exists")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--only", action="append", default=[], help="Only endpoints containing this text")
+    parser.add_argument("--skip", action="append", default=[], help="Skip endpoints containing this text")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Set before importing the app")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the result cache")
+    parser.add_argument("--label", default="", help="Stored with the results, e.g. the change under test")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for the result file")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    env = dict(item.split("=", 1) for item in args.env)
+    if args.no_cache:
+        env["CACHE_MAX_ENTRIES"] = "0"
+        env["SHARED_CACHE_DIR"] = ""
+    os.environ.update(env)
+
+    from bench import localdb, synthetic
+
+    path = args.db or os.path.join("data", f"bench-{args.enrollments}.db")
+    if args.regenerate or not os.path.exists(path):
+        synthetic.generate(path, args.enrollments, args.seed)
+    db = localdb.install(path, max_size=max(args.concurrency, 1))
+
+    from app import search
+    from app.main import app
+
+    # Built by a startup hook, which the benchmark does not run.
+    search.index.refresh()
+
+    paths = [
+        p for p in endpoint_paths(app, sample_values(db))
+        if (not args.only or any(text in p for text in args.only)) and not any(text in p for text in args.skip)
+    ]
+    results = asyncio.run(run_endpoints(app, paths, args.requests, args.concurrency))
+    print_results(results)
+
+    counts = {
+        table: db.fetch_rows(f"SELECT COUNT(*) FROM dbo.{table}")[0][0]
+        for table in ("AthleticPrograms", "ProgramDivisions", "Enrollment_Details")
+    }
+    report = {
+        "label": args.label,
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": path,
+        "rows": counts,
+        "env": env,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "endpoints": results,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{report['revision'] or 'unknown'}-{counts['Enrollment_Details']}.json"
+    output = os.path.join(args.output, name)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Synthetic AthleticPrograms, ProgramDivisions and Enrollment_Details data.
+
+The tables follow the column layout of ``schema.sql`` and are written to a
+SQLite file that ``bench.localdb`` can serve in place of Azure SQL. Output is
+deterministic for a given scale and seed, so runs at the same scale are
+comparable across versions. Enrollment_Details is left as a heap without
+indexes, like the production table.
+
+    python -m bench.synthetic data/bench.db --enrollments 1000000
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# nvarchar columns compare case-insensitively, like the CI_AS collation.
+TEXT = "TEXT COLLATE NOCASE"
+
+SCHEMA = [
+    f"""CREATE TABLE AthleticPrograms (
+        ProgramID INTEGER PRIMARY KEY,
+        [Program Name] {TEXT},
+        [Program Sport] {TEXT},
+        [Program Year] INTEGER,
+        [Program Season] {TEXT},
+        [Program Format] {TEXT},
+        [Program Environment] {TEXT},
+        [Program Sort Order] INTEGER
+    )""",
+    f"""CREATE TABLE ProgramDivisions (
+        DivisionID INTEGER PRIMARY KEY,
+        ProgramID INTEGER NOT NULL REFERENCES AthleticPrograms (ProgramID),
+        [Division Name] {TEXT},
+        [Division Format] {TEXT},
+        [Division Gender] {TEXT},
+        [Upper Division] {TEXT},
+        [Lower Division] {TEXT},
+        DivisionDuration_Weeks INTEGER,
+        DivisionPractices_PerWeek INTEGER,
+        DivisionPracticeLenth_Hours REAL,
+        DivisionGames_PerWeek INTEGER,
+        DivisionGameLength_Hours REAL
+    )""",
+    f"""CREATE TABLE Enrollment_Details (
+        [Program Name] {TEXT},
+        [Division Name] {TEXT},
+        [Account First Name] {TEXT},
+        [Account Last Name] {TEXT},
+        [Player First Name] {TEXT},
+        [Player Last Name] {TEXT},
+        [Player Gender] {TEXT},
+        [Player Birth Date] DATETIME,
+        [Street Address] {TEXT},
+        [Unit] {TEXT},
+        [City] {TEXT},
+        [State] {TEXT},
+        [Postal Code] {TEXT},
+        [User Email] {TEXT},
+        [Telephone] {TEXT},
+        [Cellphone] {TEXT},
+        [Other Phone] {TEXT},
+        [Team Name] {TEXT},
+        [Order Date] DATETIME,
+        [Order No] REAL NOT NULL,
+        [Order Detail Description] {TEXT},
+        [OrderItem Amount] REAL,
+        [OrderItem Amount Paid] REAL,
+        [OrderItem Balance] REAL,
+        [Order Payment Status] {TEXT},
+        [Player Id] REAL NOT NULL,
+        [User Id] REAL NOT NULL,
+        [Program Year] INTEGER,
+        [Program Season] {TEXT},
+        [Program Sort Order] INTEGER,
+        [Division Gender] {TEXT},
+        [Program Environment] {TEXT},
+        ProgramID INTEGER REFERENCES AthleticPrograms (ProgramID)
+    )""",
+]
+
+PROGRAM_NAMES = ["Fall Rec", "Spring Rec", "Winter Futsal", "Summer Camp", "Travel", "Academy", "TOPSoccer"]
+# Fees and donations are recorded as programs with a non-positive sort order.
+INTERNAL_PROGRAM_NAMES = ["Registration Fee", "Donation"]
+SEASONS = {"Fall Rec": "Fall", "Spring Rec": "Spring", "Winter Futsal": "Winter", "Summer Camp": "Summer"}
+AGE_GROUPS = ["U6", "U8", "U10", "U12", "U14", "U16", "U19"]
+GENDERS = ["Boys", "Girls", "Coed"]
+FIRST_NAMES = ["Ava", "Ben", "Chloe", "Diego", "Emma", "Finn", "Grace", "Hugo", "Isla", "Jack", "Kai", "Lena",
+               "Mia", "Noah", "Olivia", "Priya", "Quinn", "Ravi", "Sofia", "Theo", "Uma", "Vera", "Wyatt", "Zoe"]
+LAST_NAMES = ["Anderson", "Brown", "Chen", "Davis", "Evans", "Garcia", "Hughes", "Ito", "Johnson", "Kim",
+              "Lopez", "Miller", "Nguyen", "O'Brien", "Patel", "Reyes", "Smith", "Taylor", "Walker", "Young"]
+PAYMENT_STATUSES = ["Paid", "Paid", "Paid", "Partial", "Unpaid", "Refunded"]
+FIRST_YEAR = 2016
+
+
+def scale_for(enrollments):
+    """Table sizes derived from the number of enrollments."""
+    players = max(50, enrollments // 3)
+    return {
+        "enrollments": enrollments,
+        "programs": min(5000, max(20, enrollments // 400)),
+        "players": players,
+        "families": max(30, players * 5 // 8),
+    }
+
+
+def _programs(rng, count):
+    years = list(range(FIRST_YEAR, FIRST_YEAR + 10))
+    for program_id in range(1, count + 1):
+        if rng.random() < 0.08:
+            name, sort_order = rng.choice(INTERNAL_PROGRAM_NAMES), rng.choice([0, -1, None])
+        else:
+            name, sort_order = rng.choice(PROGRAM_NAMES), rng.randint(1, 40)
+        yield (
+            program_id,
+            name,
+            "Soccer",
+            years[(program_id - 1) * len(years) // count] if rng.random() > 0.01 else None,
+            SEASONS.get(name, rng.choice(["Fall", "Spring"])),
+            rng.choice(["4v4", "7v7", "9v9", "11v11"]),
+            rng.choice(["Outdoor", "Outdoor", "Indoor"]),
+            sort_order,
+        )
+
+
+def _divisions(rng, programs):
+    for program_id, *_ in programs:
+        for age_group in rng.sample(AGE_GROUPS, rng.randint(2, 5)):
+            gender = rng.choice(GENDERS)
+            weeks, practices, games = rng.randint(6, 12), rng.randint(1, 3), 1
+            yield (
+                None, program_id, age_group, rng.choice(["Rec", "Competitive"]), gender,
+                age_group, age_group, weeks, practices, rng.choice([1.0, 1.5]), games, rng.choice([0.75, 1.0, 1.5]),
+            )
+
+
+def _enrollments(rng, counts, programs, divisions):
+    by_program = {}
+    for division in divisions:
+        by_program.setdefault(division[1], []).append(division)
+
+    order_no = 100000
+    for _ in range(counts["enrollments"]):
+        # Skewed towards low ids so some players enroll in many programs.
+        player_id = int(counts["players"] * rng.random() ** 1.5) + 1
+        user_id = player_id * counts["families"] // counts["players"] + 1
+        program_id, program_name, _, year, season, _, environment, sort_order = rng.choice(programs)
+        division = rng.choice(by_program.get(program_id) or [None])
+        division_name = division[2] if division else None
+        if division_name and rng.random() < 0.05:
+            # Enrollment exports do not always match the division's case or spacing.
+            division_name = rng.choice([division_name.lower(), division_name + " "])
+
+        if rng.random() < 0.7:
+            order_no += 1
+        order_date = None
+        if year is not None and rng.random() > 0.02:
+            order_date = datetime(year - 1, 6, 1) + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            order_date = order_date.isoformat(" ")
+        amount = rng.choice([0.0, 65.0, 95.0, 150.0, 325.0])
+        paid = amount if rng.random() < 0.85 else rng.choice([0.0, amount / 2])
+        first, last = rng.choice(FIRST_NAMES), LAST_NAMES[user_id % len(LAST_NAMES)]
+
+        yield (
+            program_name, division_name,
+            rng.choice(FIRST_NAMES), last, first, last, rng.choice(["M", "F"]),
+            (datetime(year or 2020, 1, 1) - timedelta(days=rng.randint(4 * 365, 18 * 365))).isoformat(" "),
+            f"{user_id % 9000 + 100} Main St", None, "Springfield", "IL", f"{62700 + user_id % 100}",
+            f"family{user_id}@example.com", None, f"555-{user_id % 10000:04d}", None,
+            f"Team {rng.randint(1, 30)}" if rng.random() < 0.6 else None,
+            order_date, float(order_no), f"{program_name} registration",
+            amount, paid, amount - paid, rng.choice(PAYMENT_STATUSES),
+            float(player_id), float(user_id),
+            year, season, sort_order, division[4] if division else None, environment,
+            program_id,
+        )
+
+
+def generate(path, enrollments=10000, seed=42, chunk_size=50000):
+    """Write a fresh database with ``enrollments`` rows to ``path`` and return its table sizes."""
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    rng = random.Random(seed)
+    counts = scale_for(enrollments)
+    started = time.monotonic()
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+        programs = list(_programs(rng, counts["programs"]))
+        conn.executemany("INSERT INTO AthleticPrograms VALUES (?, ?, ?, ?, ?, ?, ?, ?)", programs)
+        conn.executemany("INSERT INTO ProgramDivisions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         list(_divisions(rng, programs)))
+        divisions = conn.execute("SELECT * FROM ProgramDivisions").fetchall()
+
+        insert = f"INSERT INTO Enrollment_Details VALUES ({', '.join('?' * 33)})"
+        chunk = []
+        for row in _enrollments(rng, counts, programs, divisions):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                conn.executemany(insert, chunk)
+                chunk.clear()
+        if chunk:
+            conn.executemany(insert, chunk)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    counts["divisions"] = len(divisions)
+    logger.info(f"Generated {counts} in {time.monotonic() - started:.1f}s")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic LPFC database for benchmarking")
+    parser.add_argument("path", help="SQLite file to create (replaced if it exists)")
+    parser.add_argument("--enrollments", type=int, default=10000, help="Enrollment_Details rows (10k to 10M)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generate(args.path, args.enrollments, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import pytest
+
+from bench import localdb, synthetic
+
+
+@pytest.fixture(scope="session")
+def local_db(tmp_path_factory):
+    """``app.database.db`` serving a small synthetic database through the SQLite stand-in."""
+    path = tmp_path_factory.mktemp("data") / "test.db"
+    synthetic.generate(str(path), enrollments=2000, seed=7)
+    return localdb.install(str(path))
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import admission, main
+from app.admission import AdmissionController, Rejected
+
+
+def test_freed_slot_goes_to_the_highest_priority_waiter():
+    controller = AdmissionController(1, {"interactive": (None, 10, 5.0), "export": (None, 10, 5.0)})
+    granted_at = controller.acquire("export")
+    order = []
+
+    def wait(name):
+        granted_at = controller.acquire(name)
+        order.append(name)
+        controller.release(name, granted_at)
+
+    threads = [threading.Thread(target=wait, args=(name,)) for name in ("export", "interactive")]
+    for thread in threads:
+        thread.start()
+    while sum(len(priority.waiters) for priority in controller.classes.values()) < 2:
+        time.sleep(0.01)
+    controller.release("export", granted_at)
+    for thread in threads:
+        thread.join()
+    assert order == ["interactive", "export"]
+
+
+def test_full_queue_is_rejected():
+    controller = AdmissionController(1, {"export": (None, 0, 5.0)})
+    controller.acquire("export")
+    with pytest.raises(Rejected):
+        controller.acquire("export")
+
+
+def test_a_slot_released_on_another_thread_does_not_bypass_the_next_one():
+    # A streamed body acquires its slot on one threadpool thread and may finish on another.
+    def batches():
+        with admission.slot():
+            yield 1
+            yield 2
+
+    listing = admission.controller.classes["listing"]
+    token = admission.current_class.set("listing")
+    try:
+        with ThreadPoolExecutor(max_workers=1) as acquiring, ThreadPoolExecutor(max_workers=1) as finishing:
+            stream = batches()
+            acquiring.submit(copy_context().run, next, stream).result()
+            finishing.submit(copy_context().run, list, stream).result()
+
+            admitted = listing.admitted
+            acquiring.submit(copy_context().run, lambda: list(batches())).result()
+            assert listing.admitted == admitted + 1
+    finally:
+        admission.current_class.reset(token)
+    assert admission.controller.active == 0
+
+
+def test_requests_after_a_stream_are_still_admitted(local_db):
+    client = TestClient(main.app)
+    listing = admission.controller.classes["listing"]
+
+    for _ in range(5):
+        response = client.get("/enrollments/stream", params={"batch_size": 100})
+        assert response.status_code == 200
+        admitted = listing.admitted
+        assert client.get("/enrollments", params={"limit": 5}).status_code == 200
+        assert listing.admitted == admitted + 1
+
+    assert admission.controller.active == 0
@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+from app import cache
+from app.cache import MISSING, ResultCache, approximate_size, cached
+
+
+@pytest.fixture
+def result_cache(monkeypatch):
+    result_cache = ResultCache()
+    monkeypatch.setattr(cache, "result_cache", result_cache)
+    monkeypatch.setattr(cache.shared_cache, "store", None)
+    return result_cache
+
+
+class FakeVersion:
+    """A version function whose value the test sets."""
+
+    def __init__(self):
+        self.value = 1
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_hits_are_served_until_the_version_changes(result_cache):
+    version = FakeVersion()
+    calls = []
+
+    @cached("test_version", version)
+    def load(year):
+        calls.append(year)
+        return {"year": year, "load": len(calls)}
+
+    assert load(2024) == {"year": 2024, "load": 1}
+    assert load(2024) == {"year": 2024, "load": 1}
+    assert load(2025) == {"year": 2025, "load": 2}
+
+    version.value = 2
+    assert load(2024) == {"year": 2024, "load": 3}
+    assert load(2024) == {"year": 2024, "load": 3}
+    assert calls == [2024, 2025, 2024]
+    assert result_cache.stats()["stale"] == 1
+
+
+def test_exceptions_are_not_cached(result_cache):
+    attempts = []
+
+    @cached("test_errors", FakeVersion())
+    def load():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise RuntimeError("database unavailable")
+        return "ok"
+
+    with pytest.raises(RuntimeError):
+        load()
+    assert load() == "ok"
+    assert len(attempts) == 2
+
+
+def test_the_previous_value_is_served_after_the_stale_wait(result_cache, monkeypatch):
+    monkeypatch.setattr(cache, "STALE_WAIT_SECONDS", 0.05)
+    version = FakeVersion()
+    release = threading.Event()
+    loads = []
+
+    @cached("test_stale", version)
+    def load():
+        loads.append(None)
+        if len(loads) > 1:
+            release.wait(5)
+        return len(loads)
+
+    assert load() == 1
+    version.value = 2
+    served = []
+    token = cache.stale_results.set(served)
+    try:
+        started = time.monotonic()
+        assert load() == 1
+        waited = time.monotonic() - started
+    finally:
+        cache.stale_results.reset(token)
+
+    assert 0.05 <= waited < 1
+    assert [namespace for namespace, _ in served] == ["test_stale"]
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while not result_cache.contains(("test_stale", ()), 2) and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert load() == 2
+    assert len(loads) == 2
+
+
+def test_a_failed_refresh_serves_the_previous_value(result_cache, monkeypatch):
+    monkeypatch.setattr(cache, "STALE_WAIT_SECONDS", 0.05)
+    version = FakeVersion()
+    loads = []
+
+    @cached("test_stale_error", version)
+    def load():
+        loads.append(None)
+        if len(loads) > 1:
+            raise RuntimeError("database unavailable")
+        return "first"
+
+    assert load() == "first"
+    version.value = 2
+    assert load() == "first"
+
+
+def test_negative_stale_wait_blocks_for_the_refresh(result_cache, monkeypatch):
+    monkeypatch.setattr(cache, "STALE_WAIT_SECONDS", -1)
+    version = FakeVersion()
+    loads = []
+
+    @cached("test_no_stale", version)
+    def load():
+        loads.append(None)
+        time.sleep(0.05 if len(loads) > 1 else 0)
+        return len(loads)
+
+    assert load() == 1
+    version.value = 2
+    assert load() == 2
+
+
+def test_least_recently_used_entries_are_evicted_past_max_entries():
+    result_cache = ResultCache(max_entries=2)
+    result_cache.set("a", 1, version=1)
+    result_cache.set("b", 2, version=1)
+    assert result_cache.get("a", 1) == 1
+
+    result_cache.set("c", 3, version=1)
+
+    assert result_cache.get("b", 1) is MISSING
+    assert result_cache.get("a", 1) == 1
+    assert result_cache.get("c", 1) == 3
+    assert result_cache.stats()["evictions"] == 1
+
+
+def test_entries_are_evicted_to_stay_under_max_bytes():
+    value = [{"Players": n, "ProgramName": f"Program {n}"} for n in range(10)]
+    size = approximate_size(value)
+    result_cache = ResultCache(max_bytes=size * 2 + size // 2)
+
+    for key in "abc":
+        result_cache.set(key, value, version=1)
+
+    stats = result_cache.stats()
+    assert stats["entries"] == 2 and stats["bytes"] == size * 2
+    assert result_cache.get("a", 1) is MISSING
+    assert result_cache.get("c", 1) is value
+
+
+def test_values_larger_than_max_bytes_are_not_stored():
+    result_cache = ResultCache(max_bytes=100)
+    result_cache.set("small", 1, version=1)
+
+    result_cache.set("large", list(range(1000)), version=1)
+
+    assert result_cache.get("large", 1) is MISSING
+    assert result_cache.get("small", 1) == 1
+
+
+def test_outdated_entries_stay_available_to_peek():
+    result_cache = ResultCache(ttl=0)
+    result_cache.set("a", "value", version=1)
+
+    assert result_cache.get("a", 1) is MISSING
+    assert result_cache.get("a", 2) is MISSING
+    assert result_cache.peek("a")[0] == "value"
+    assert result_cache.stats()["expired"] == 1 and result_cache.stats()["stale"] == 1
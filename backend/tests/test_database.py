@@ -0,0 +1,78 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyodbc
+import pytest
+
+QUERY = "SELECT [Player Id] FROM dbo.Enrollment_Details WHERE [Program Sort Order] > ? ORDER BY [Player Id]"
+
+
+def held_executions(db, monkeypatch):
+    """Make every query execution wait for the returned event; returns it and the list of executed params."""
+    release = threading.Event()
+    executed = []
+    run = db._columns_and_rows
+
+    def held(query, params):
+        executed.append(params)
+        release.wait(5)
+        return run(query, params)
+
+    monkeypatch.setattr(db, "_columns_and_rows", held)
+    return release, executed
+
+
+def wait_for_waiters(db, count):
+    deadline = time.monotonic() + 5
+    while db.single_flight.saved < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+@pytest.mark.parametrize("callers", [2, 8])
+def test_identical_concurrent_queries_run_once(local_db, monkeypatch, callers):
+    release, executed = held_executions(local_db, monkeypatch)
+    saved = local_db.single_flight.saved
+
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        futures = [pool.submit(local_db.fetch_rows, QUERY, (0,)) for _ in range(callers)]
+        wait_for_waiters(local_db, saved + callers - 1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert executed == [(0,)]
+    assert local_db.single_flight.saved == saved + callers - 1
+    assert all(result == results[0] for result in results) and results[0]
+    # Each caller gets its own list.
+    assert len({id(result) for result in results}) == callers
+
+
+def test_an_error_reaches_every_waiter(local_db, monkeypatch):
+    release, executed = held_executions(local_db, monkeypatch)
+    saved = local_db.single_flight.saved
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(local_db.fetch_rows, "SELECT 1 FROM dbo.Missing_Table") for _ in range(4)]
+        wait_for_waiters(local_db, saved + 3)
+        release.set()
+        for future in futures:
+            with pytest.raises(pyodbc.ProgrammingError):
+                future.result()
+
+    assert len(executed) == 1
+    assert local_db.single_flight.stats()["in_flight"] == 0
+
+
+def test_different_parameters_are_not_merged(local_db, monkeypatch):
+    release, executed = held_executions(local_db, monkeypatch)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(local_db.fetch_rows, QUERY, (sort_order,)) for sort_order in (0, 100)]
+        deadline = time.monotonic() + 5
+        while len(executed) < 2 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        release.set()
+        first, second = (future.result() for future in futures)
+
+    assert sorted(executed) == [(0,), (100,)]
+    assert first != second
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import exports, main
+from app.main import enrollment_export
+from app.projection import ENROLLMENT_DETAILS
+
+
+def test_export_batch_size_is_bounded(local_db):
+    client = TestClient(main.app)
+
+    for batch_size in (0, -1, exports.EXPORT_MAX_BATCH_SIZE + 1):
+        assert client.get("/exports/enrollments", params={"batch_size": batch_size}).status_code == 422
+        assert client.post("/exports/enrollments/jobs", params={"batch_size": batch_size}).status_code == 422
+
+
+def test_each_client_may_only_have_per_client_unfinished_jobs(local_db, tmp_path):
+    jobs = exports.ExportJobs(str(tmp_path), workers=1, per_client=1)
+    # Keep the only worker busy so submitted jobs stay queued.
+    release = threading.Event()
+    jobs._executor.submit(release.wait)
+    name, query, params = enrollment_export()
+    try:
+        first = jobs.submit(name, "csv", ENROLLMENT_DETAILS, query, params, client="10.0.0.1")
+        with pytest.raises(exports.TooManyJobs):
+            jobs.submit(name, "csv", ENROLLMENT_DETAILS, query, params, client="10.0.0.1")
+        jobs.submit(name, "csv", ENROLLMENT_DETAILS, query, params, client="10.0.0.2")
+    finally:
+        release.set()
+
+    while jobs.status(first["id"])["finished_at"] is None:
+        time.sleep(0.01)
+    jobs.submit(name, "csv", ENROLLMENT_DETAILS, query, params, client="10.0.0.1")
+    jobs._executor.shutdown(wait=True)
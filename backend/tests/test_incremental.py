@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from app.incremental import SKETCH_QUERY, AggregateState, IncrementalAggregates
+from app.sketches import HyperLogLog
+
+# Estimates may miss by a few standard errors, plus one for rounding to an integer.
+STANDARD_ERRORS = 3
+
+
+def assert_within_error(estimate, exact, relative_error):
+    assert abs(estimate - exact) <= STANDARD_ERRORS * relative_error * exact + 1, (estimate, exact)
+
+
+def test_approximate_results_report_relative_error(local_db):
+    pipeline = IncrementalAggregates(refresh_seconds=3600, reconcile_seconds=3600)
+
+    rows = [
+        *pipeline.approximate_program_counts(),
+        *pipeline.approximate_year_counts(),
+        pipeline.approximate_lifetime_counts(),
+        *pipeline.approximate_order_year_counts().values(),
+    ]
+
+    assert rows
+    for row in rows:
+        assert "relativeError" not in row
+        assert row["RelativeError"] == pipeline.approximate_lifetime_counts()["RelativeError"]
+
+
+def test_sketch_only_pipeline_matches_the_exact_pipeline_estimates(local_db):
+    exact = IncrementalAggregates(refresh_seconds=3600, reconcile_seconds=3600)
+    sketches = IncrementalAggregates(refresh_seconds=3600, reconcile_seconds=3600, exact=False)
+
+    assert sketches.approximate_program_counts() == exact.approximate_program_counts()
+    assert sketches.approximate_year_counts() == exact.approximate_year_counts()
+    assert sketches.approximate_lifetime_counts() == exact.approximate_lifetime_counts()
+    assert sketches.approximate_order_year_counts() == exact.approximate_order_year_counts()
+    assert sketches.sketch_version == exact.sketch_version
+    assert not sketches._state.partitions and not sketches._state.player_programs
+
+
+def test_sketch_version_depends_only_on_the_data(local_db):
+    # Workers share approximate results under this version, so merge order and batching must not matter.
+    rows = [row for batch in local_db.iter_batches(SKETCH_QUERY) for row in batch]
+    loaded = IncrementalAggregates(refresh_seconds=3600, reconcile_seconds=3600, exact=False)
+    loaded.refresh()
+
+    for ordered, batch_size in ((rows, 100), (rows[::-1], 7)):
+        pipeline = IncrementalAggregates(refresh_seconds=3600, reconcile_seconds=3600, exact=False)
+        pipeline._programs, _ = pipeline._load_reference_tables()
+        pipeline._state = AggregateState(exact=False)
+        for start in range(0, len(ordered), batch_size):
+            pipeline._state.merge(ordered[start:start + batch_size])
+        assert pipeline._digest_sketches() == loaded.sketch_version
+
+
+def test_estimates_are_within_the_reported_error_of_the_exact_counts(local_db):
+    pipeline = IncrementalAggregates(refresh_seconds=3600, reconcile_seconds=3600)
+
+    pairs = [
+        (pipeline.approximate_program_counts(), pipeline.program_counts(), ("PlayerCount", "FamilyCount")),
+        (pipeline.approximate_year_counts(), pipeline.year_counts(), ("UniquePlayerCount", "UniqueFamilyCount")),
+        ([pipeline.approximate_lifetime_counts()], [pipeline.lifetime_counts()], ("PlayersLifetime", "FamiliesLifetime")),
+        (list(pipeline.approximate_order_year_counts().values()), list(pipeline.order_year_counts().values()),
+         ("players", "families")),
+    ]
+
+    for approximate, exact, columns in pairs:
+        assert len(approximate) == len(exact) > 0
+        for estimated_row, exact_row in zip(approximate, exact):
+            for column in columns:
+                assert_within_error(estimated_row[column], exact_row[column], estimated_row["RelativeError"])
+
+
+@pytest.mark.parametrize("precision", [10, 14])
+@pytest.mark.parametrize("distinct", [100, 5000, 200000])
+def test_sketch_estimates_are_within_the_reported_error(precision, distinct):
+    # Covers both the linear-counting range and the raw estimator.
+    ids = np.random.default_rng(distinct).choice(10 ** 12, distinct, replace=False)
+    sketch = HyperLogLog(precision)
+    sketch.add(np.concatenate([ids, ids[: distinct // 2]]))
+
+    assert_within_error(sketch.estimate(), distinct, sketch.relative_error)
@@ -0,0 +1,36 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+from app import main, metrics
+
+
+def test_slow_query_log_omits_parameter_values(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 0.001)
+    record = metrics.QueryRecord("SELECT * FROM dbo.Enrollment_Details WHERE [Player Email] = ?", ("jane@example.com",))
+    record.durations["execute"] = 0.5
+
+    with caplog.at_level(logging.WARNING, logger="app.slow_queries"):
+        record.finish()
+
+    [message] = [entry.getMessage() for entry in caplog.records if entry.name == "app.slow_queries"]
+    assert "(1 params)" in message
+    assert "jane@example.com" not in message
+
+
+def test_stats_series_splits_counters_from_gauges():
+    gauges, counters = metrics.stats_series(
+        "lpfc_pool", "Connection pool", {"size": 3, "checkouts": 10, "shared": {"hits": 1}}, {"checkouts"}
+    )
+
+    assert gauges == [("lpfc_pool_size", "Connection pool size.", 3)]
+    assert counters == [("lpfc_pool_checkouts_total", "Connection pool checkouts.", 10)]
+
+
+def test_monotonic_stats_are_exported_as_counters(local_db):
+    lines = TestClient(main.app).get("/metrics").text.splitlines()
+
+    for name in ("lpfc_pool_checkouts_total", "lpfc_cache_hits_total", "lpfc_single_flight_saved_total"):
+        assert f"# TYPE {name} counter" in lines
+    assert "# TYPE lpfc_pool_size gauge" in lines
+    assert not any(line.startswith("# TYPE lpfc_pool_checkouts ") for line in lines)
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pyodbc
+import pytest
+
+from app.database import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+
+    def cursor(self):
+        if not self.alive:
+            raise pyodbc.OperationalError("connection is dead")
+        return FakeCursor()
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def execute(self, query, *params):
+        pass
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+def pool_of(opened, **options):
+    """A pool whose connections are appended to ``opened`` as they are created."""
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    return ConnectionPool(connect, **options)
+
+
+def test_checkout_blocks_at_max_size_until_a_connection_is_released():
+    opened = []
+    pool = pool_of(opened, min_size=0, max_size=1, timeout=5)
+    first = pool.acquire()
+    got = []
+
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while pool.stats()["waiting"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert pool.stats()["waiting"] == 1 and got == []
+
+    pool.release(first)
+    waiter.join(5)
+    assert got == [first]
+    assert len(opened) == 1
+
+
+def test_checkout_times_out_when_the_pool_stays_full():
+    pool = pool_of([], min_size=0, max_size=2, timeout=0.05)
+    held = [pool.acquire(), pool.acquire()]
+
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()["timeouts"] == 1
+    for conn in held:
+        pool.release(conn)
+
+
+@pytest.mark.parametrize("error", [pyodbc.OperationalError, pyodbc.InterfaceError])
+def test_a_connection_that_failed_is_discarded(error):
+    opened = []
+    pool = pool_of(opened, min_size=0, max_size=1)
+
+    with pytest.raises(error):
+        with pool.connection():
+            raise error("server went away")
+
+    assert opened[0].closed
+    assert pool.stats()["size"] == 0
+    with pool.connection() as conn:
+        assert conn is opened[1]
+
+
+def test_other_errors_return_the_connection_to_the_pool():
+    opened = []
+    pool = pool_of(opened, min_size=0, max_size=1)
+
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("not a connection problem")
+
+    with pool.connection() as conn:
+        assert conn is opened[0] and not conn.closed
+
+
+def test_connections_past_max_lifetime_are_recycled_on_release():
+    opened = []
+    pool = pool_of(opened, min_size=0, max_size=1, max_lifetime=0)
+
+    with pool.connection():
+        pass
+
+    assert opened[0].closed
+    assert pool.stats()["recycled"] == 1
+    with pool.connection() as conn:
+        assert conn is opened[1]
+
+
+def test_idle_connections_past_max_lifetime_are_replaced_on_checkout():
+    opened = []
+    pool = pool_of(opened, min_size=1, max_size=1, max_lifetime=0.05)
+    pool.warm()
+    time.sleep(0.06)
+
+    with pool.connection() as conn:
+        assert conn is opened[1]
+
+    assert opened[0].closed
+    assert pool.stats()["recycled"] >= 1
+
+
+def test_stale_idle_connections_that_fail_validation_are_replaced():
+    opened = []
+    pool = pool_of(opened, min_size=1, max_size=1, validate_after=0)
+    pool.warm()
+    opened[0].alive = False
+
+    with pool.connection() as conn:
+        assert conn is opened[1]
+
+    assert opened[0].closed
+    assert pool.stats()["validation_failures"] == 1
+
+
+def test_idle_connections_that_pass_validation_are_reused():
+    opened = []
+    pool = pool_of(opened, min_size=1, max_size=1, validate_after=0)
+    pool.warm()
+
+    with pool.connection() as conn:
+        assert conn is opened[0]
+
+    assert pool.stats()["validation_failures"] == 0
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from app import snapshot
+from app.snapshot import TABLES, ColumnarTable, Snapshot, SnapshotStore
+
+# (ProgramID, SortOrder, PlayerId, UserId, OrderYear, DivisionName, PlayerFirstName, PlayerLastName)
+ENROLLMENTS = [
+    (1, 1, 10, 100, 2024, "U10 Girls", "Ana", "Diaz"),
+    (2, 1, 11, 101, 2024, "u10 girls ", "ana", "DIAZ"),
+    (2, 1, 12, 102, 2024, "U10 GIRLS", "Ben", "Ng"),
+    (3, 1, 10, 100, 2024, "U12 Boys", "ANA", "diaz"),
+]
+# (ProgramID, ProgramName, ProgramYear, ProgramSeason, ProgramFormat, ProgramEnvironment)
+PROGRAMS = [
+    (1, "Fall Rec", 2024, "Fall", "Rec", "Outdoor"),
+    (2, "fall rec ", 2024, "FALL", "rec", "outdoor"),
+    (3, "Spring Rec", 2024, "Spring", "Rec", "Outdoor"),
+]
+# (ProgramID, DivisionName, DivisionGender)
+DIVISIONS = [
+    (1, "U10 Girls", "Female"),
+    (2, "u10 girls", "FEMALE"),
+    (3, "U12 Boys", "Male"),
+]
+
+
+@pytest.fixture
+def mixed_case_snapshot(monkeypatch):
+    rows = {"enrollments": ENROLLMENTS, "programs": PROGRAMS, "divisions": DIVISIONS}
+    tables = {name: ColumnarTable.from_batches(spec, [rows[name]]) for name, (_, spec) in TABLES.items()}
+    store = SnapshotStore(path="unused.npz", refresh_seconds=3600)
+    store._snapshot = Snapshot(tables, datetime(2024, 9, 1))
+    monkeypatch.setattr(snapshot, "store", store)
+
+
+def test_collated_codes_share_the_first_spelling():
+    table = ColumnarTable.from_batches([("Name", "Name", "str")], [[("Fall",), ("FALL ",), (None,), ("Spring",), ("fall",)]])
+
+    assert table.decode("Name", table.collated("Name")) == ["Fall", "Fall", None, "Spring", "Fall"]
+
+
+def test_program_counts_group_names_case_insensitively(mixed_case_snapshot):
+    assert snapshot.program_counts() == [
+        {"ProgramName": "Fall Rec", "ProgramYear": 2024, "PlayerCount": 3, "FamilyCount": 3},
+        {"ProgramName": "Spring Rec", "ProgramYear": 2024, "PlayerCount": 1, "FamilyCount": 1},
+    ]
+
+
+def test_division_counts_group_names_case_insensitively(mixed_case_snapshot):
+    rows = [(row["ProgramName"], row["ProgramSeason"], row["DivisionName"], row["DivisionGender"], row["Players"])
+            for row in snapshot.division_counts()]
+
+    assert sorted(rows) == [("Fall Rec", "Fall", "U10 Girls", "Female", 3), ("Spring Rec", "Spring", "U12 Boys", "Male", 1)]
+
+
+def test_player_names_group_case_insensitively(mixed_case_snapshot):
+    top = snapshot.player_enrollment_counts(limit=1)
+
+    assert top == [{"PlayerId": 10, "PlayerFirstName": "Ana", "PlayerLastName": "Diaz", "TotalEnrollments": 2}]
@@ -0,0 +1,120 @@
+from collections import Counter
+
+import pytest
+
+from app.stats_query import DIVISION_JOIN, PROGRAM_JOIN, InvalidStatsQuery, StatsQuery
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"group_by": "year,colour"}, "Unknown dimensions: colour"),
+    ({"group_by": "year,year"}, "grouped by once"),
+    ({"metrics": "players,height"}, "Unknown metrics: height"),
+    ({"metrics": "players,players"}, "requested once"),
+    ({"metrics": ""}, "At least one metric"),
+    ({"group_by": "year", "subtotals": "total"}, "subtotals must be one of"),
+    ({"group_by": "year,sport,season,format,division", "subtotals": "cube"}, "at most 4 dimensions"),
+    ({"filters": {"colour": ["red"]}}, "Unknown filter dimension"),
+    ({"filters": {"year": ["2024", "last"]}}, "takes int values"),
+    ({"filters": {"order_year": ["20.5"]}}, "takes int values"),
+    ({"group_by": "year", "sort": "-sport"}, "not grouped by"),
+])
+def test_invalid_queries_are_rejected(options, message):
+    with pytest.raises(InvalidStatsQuery, match=message):
+        StatsQuery(**options)
+
+
+def test_filter_values_are_converted_to_the_dimension_type():
+    query = StatsQuery(filters={"year": ["2024", "2025"], "sport": ["Soccer"]})
+
+    _, params = query.compile()
+
+    assert params == [2024, 2025, "Soccer"]
+
+
+@pytest.mark.parametrize("options, joins", [
+    ({"group_by": "player_gender"}, []),
+    ({"group_by": "order_year,payment_status", "metrics": "revenue"}, []),
+    ({"group_by": "program_id", "filters": {"player_gender": ["F"]}}, []),
+    ({"group_by": "sport"}, [PROGRAM_JOIN]),
+    ({"group_by": "player_gender", "filters": {"year": ["2024"]}}, [PROGRAM_JOIN]),
+    ({"group_by": "division"}, [PROGRAM_JOIN, DIVISION_JOIN]),
+    ({"group_by": "year", "filters": {"division_gender": ["Girls"]}}, [PROGRAM_JOIN, DIVISION_JOIN]),
+])
+def test_only_the_needed_tables_are_joined(options, joins):
+    sql, _ = StatsQuery(**options).compile()
+
+    assert [join for join in (PROGRAM_JOIN, DIVISION_JOIN) if join in sql] == joins
+
+
+@pytest.mark.parametrize("subtotals, sets, sql", [
+    ("none", [("year", "sport")], " GROUP BY p.[Program Year], p.[Program Sport] ORDER BY"),
+    ("rollup", [("year", "sport"), ("year",), ()],
+     " GROUP BY GROUPING SETS ((p.[Program Year], p.[Program Sport]), (p.[Program Year]), ()) ORDER BY"),
+    ("cube", [("year", "sport"), ("year",), ("sport",), ()],
+     " GROUP BY GROUPING SETS ((p.[Program Year], p.[Program Sport]), (p.[Program Year]), (p.[Program Sport]), ()) ORDER BY"),
+])
+def test_subtotals_compile_to_grouping_sets(subtotals, sets, sql):
+    query = StatsQuery(group_by="year,sport", subtotals=subtotals)
+
+    compiled, _ = query.compile()
+
+    assert query.grouping_sets() == sets
+    assert sql in compiled
+    assert ("GROUPING(p.[Program Year]) AS [Grouping_year]" in compiled) == (subtotals != "none")
+
+
+def active_enrollments(db, *columns):
+    select = ", ".join(f"[{column}]" for column in columns)
+    return db.fetch_rows(f"SELECT {select} FROM dbo.Enrollment_Details WHERE [Program Sort Order] > 0")
+
+
+@pytest.mark.parametrize("dimension, column", [
+    ("player_gender", "Player Gender"),
+    ("payment_status", "Order Payment Status"),
+    ("program_id", "ProgramID"),
+])
+def test_grouped_counts_match_the_stand_in(local_db, dimension, column):
+    rows = StatsQuery(group_by=dimension, metrics="enrollments,players").run()
+
+    enrollments = Counter(value for value, _ in active_enrollments(local_db, column, "Player Id"))
+    players = Counter(value for value, _ in set(active_enrollments(local_db, column, "Player Id")))
+    alias = StatsQuery(group_by=dimension).alias(dimension)
+    assert {row[alias]: row["Enrollments"] for row in rows} == enrollments
+    assert {row[alias]: row["Players"] for row in rows} == players
+    assert [row[alias] for row in rows] == sorted(enrollments, key=lambda value: (value is not None, value))
+
+
+def test_filters_restrict_the_rows(local_db):
+    genders = Counter(gender for gender, in active_enrollments(local_db, "Player Gender"))
+    gender = genders.most_common(1)[0][0]
+
+    rows = StatsQuery(group_by="player_gender", metrics="enrollments", filters={"player_gender": [gender]}).run()
+
+    assert [(row["PlayerGender"], row["Enrollments"]) for row in rows] == [(gender, genders[gender])]
+
+
+def test_rolled_up_rows_list_the_aggregated_dimensions(local_db, monkeypatch):
+    # SQLite has no GROUPING SETS: answer each set with its own query, the way SQL Server returns them.
+    execute_query = local_db.execute_query
+
+    def grouping_sets(sql, params):
+        rows = []
+        for names in query.grouping_sets():
+            for row in execute_query(*StatsQuery(group_by=names, metrics=query.metrics).compile()):
+                for name in query.group_by:
+                    row.setdefault(query.alias(name), None)
+                    row[f"Grouping_{name}"] = int(name not in names)
+                rows.append(row)
+        return rows
+
+    query = StatsQuery(group_by="payment_status,player_gender", metrics="enrollments", subtotals="rollup")
+    monkeypatch.setattr(local_db, "execute_query", grouping_sets)
+
+    rows = query.run()
+
+    assert {tuple(row["RolledUp"]) for row in rows} == {(), ("player_gender",), ("payment_status", "player_gender")}
+    assert not any(name.startswith("Grouping_") for row in rows for name in row)
+    detail = sum(row["Enrollments"] for row in rows if not row["RolledUp"])
+    subtotals = sum(row["Enrollments"] for row in rows if row["RolledUp"] == ["player_gender"])
+    [total] = [row["Enrollments"] for row in rows if len(row["RolledUp"]) == 2]
+    assert detail == subtotals == total == len(active_enrollments(local_db, "Player Id"))
@@ -0,0 +1,27 @@
+import pyodbc
+import pytest
+
+from app.summaries import SummaryStore
+
+
+def test_missing_state_table_means_not_provisioned(local_db):
+    store = SummaryStore(refresh_seconds=3600, check_seconds=0)
+
+    assert store._read_state() is None
+    assert store.status()["provisioned"] is False
+
+
+def test_transient_errors_keep_the_last_known_state(local_db, monkeypatch):
+    store = SummaryStore(refresh_seconds=3600, check_seconds=0)
+    monkeypatch.setattr(store, "_read_state", lambda: {"YearCounts": "v1"})
+    assert store._current_state() == {"YearCounts": "v1"}
+
+    monkeypatch.undo()
+
+    def unreachable(query, params=None):
+        raise pyodbc.OperationalError("08S01", "[08S01] Communication link failure")
+
+    monkeypatch.setattr(local_db, "fetch_rows", unreachable)
+    with pytest.raises(pyodbc.OperationalError):
+        store._read_state()
+    assert store._current_state() == {"YearCounts": "v1"}
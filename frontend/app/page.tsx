@@ -1,15 +1,7 @@
 'use client';
 
 import { useEffect, useState } from 'react';
-import {
-  fetchProgramStats,
-  fetchYearStats,
-  fetchDivisionStats,
-  fetchLifetimeStats,
-  fetchYearlyBreakdown,
-  fetchEnrollments,
-  fetchPlayerEnrollmentStats,
-} from '@/lib/api';
+import { fetchDashboard } from '@/lib/api';
 import {
   BarChart,
   Bar,
@@ -84,23 +76,15 @@ export default function Home() {
     const loadData = async () => {
       try {
         setLoading(true);
-        const [programs, years, divisions, lifetime, yearly, enrollData, playerEnrolls] = await Promise.all([
-          fetchProgramStats(),
-          fetchYearStats(),
-          fetchDivisionStats(),
-          fetchLifetimeStats(),
-          fetchYearlyBreakdown(),
-          fetchEnrollments({ limit: 50 }),
-          fetchPlayerEnrollmentStats(50),
-        ]);
+        const dashboard = await fetchDashboard({ enrollments_limit: 50, player_limit: 50 });
 
-        setProgramStats(programs);
-        setYearStats(years);
-        setDivisionStats(divisions);
-        setLifetimeStats(lifetime);
-        setYearlyBreakdown(yearly);
-        setEnrollments(enrollData);
-        setPlayerEnrollmentStats(playerEnrolls);
+        setProgramStats(dashboard.programs);
+        setYearStats(dashboard.years);
+        setDivisionStats(dashboard.divisions);
+        setLifetimeStats(dashboard.lifetime);
+        setYearlyBreakdown(dashboard.yearly_breakdown);
+        setEnrollments(dashboard.enrollments);
+        setPlayerEnrollmentStats(dashboard.player_enrollments);
       } catch (err) {
         setError('Failed to load data. Please check if the backend is running.');
         console.error(err);
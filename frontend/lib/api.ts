@@ -9,6 +9,11 @@ const api = axios.create({
   },
 });
 
+// Conditional GET and compression are left to the browser: responses carry an
+// ETag and Cache-Control: no-cache, so its HTTP cache revalidates each request
+// with If-None-Match and reuses its copy on 304. Setting the header here would
+// make every cross-origin GET wait for a CORS preflight.
+
 export const fetchPrograms = async () => {
   const response = await api.get('/programs');
   return response.data;
@@ -48,9 +53,80 @@ export const fetchEnrollments = async (params?: {
   return response.data;
 };
 
+export const fetchEnrollmentsPage = async (params?: {
+  program_id?: number;
+  year?: number;
+  limit?: number;
+  cursor?: string;
+}) => {
+  const response = await api.get('/enrollments', { params });
+  return {
+    items: response.data,
+    nextCursor: (response.headers['x-next-cursor'] as string | undefined) ?? null,
+  };
+};
+
+export type ExportFormat = 'csv' | 'parquet';
+
+// A download link: the browser streams the file instead of Axios buffering it.
+export const enrollmentExportUrl = (params: {
+  format?: ExportFormat;
+  program_id?: number;
+  year?: number;
+} = {}) => {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined) query.set(key, String(value));
+  });
+  return `${API_URL}/exports/enrollments?${query}`;
+};
+
+export type RetentionPeriod = 'year' | 'season';
+
+export const fetchRetention = async (by: RetentionPeriod = 'year') => {
+  const response = await api.get('/stats/retention', { params: { by } });
+  return response.data;
+};
+
+export const fetchCohorts = async (by: RetentionPeriod = 'year') => {
+  const response = await api.get('/stats/cohorts', { params: { by } });
+  return response.data;
+};
+
 export const fetchPlayerEnrollmentStats = async (limit: number = 50) => {
   const response = await api.get('/stats/player-enrollments', { params: { limit } });
   return response.data;
 };
 
+export type DashboardSection =
+  | 'programs'
+  | 'years'
+  | 'divisions'
+  | 'lifetime'
+  | 'yearly_breakdown'
+  | 'enrollments'
+  | 'player_enrollments';
+
+export const fetchDashboard = async (params?: {
+  include?: DashboardSection[];
+  enrollments_limit?: number;
+  player_limit?: number;
+}) => {
+  const { include, ...rest } = params ?? {};
+  const response = await api.get('/stats/dashboard', {
+    params: { ...rest, include: include?.join(',') },
+  });
+  return response.data;
+};
+
+export const searchPlayers = async (q: string, limit: number = 10) => {
+  const response = await api.get('/search/players', { params: { q, limit } });
+  return response.data;
+};
+
+export const searchFamilies = async (q: string, limit: number = 10) => {
+  const response = await api.get('/search/families', { params: { q, limit } });
+  return response.data;
+};
+
 export default api;